@@ -0,0 +1,232 @@
+import argparse
+import base64
+import gc
+import importlib
+import importlib.util
+import json
+import os
+import random
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+from bench_rendu import PARAGRAPHE
+from fiche_modele import SECTIONS_ORDER, construire_document
+
+# Référence enregistrée par --enregistrer et comparée par --verifier
+REFERENCE_DEFAUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_reference.json')
+
+# Écart toléré par rapport à la référence avant de signaler une régression
+TOLERANCE_DUREE = 0.25
+TOLERANCE_MEMOIRE = 0.25
+
+# Écarts absolus en deçà desquels une mesure n'est jamais une régression (bruit de mesure)
+ECART_MIN_MS = 2.0
+ECART_MIN_MO = 0.5
+
+# Scénarios : taille du texte des grandes sections (octets), nombre de citations, taille d'image (octets),
+# image avec canal alpha (RGBA)
+SCENARIOS = {
+    'petite': (10_000, 10, 0),
+    'moyenne': (1_000_000, 200, 200_000),
+    'grande': (10_000_000, 2_000, 2_000_000),
+    'transparente': (1_000_000, 200, 200_000, True),
+}
+
+def png_synthetique(taille, alpha=False):
+    """Construit un PNG valide d'environ `taille` octets (pixels pseudo-aléatoires, incompressibles).
+
+    Avec alpha=True, l'image est en RVBA (type de couleur 6), avec une transparence variable.
+    """
+    composantes = 4 if alpha else 3
+    cote = max(1, int((taille / composantes) ** 0.5))
+    hasard = random.Random(cote)
+    # Chaque ligne commence par l'octet de filtre 0, suivi des pixels RVB ou RVBA
+    pixels = b''.join(b'\x00' + hasard.randbytes(cote * composantes) for _ in range(cote))
+
+    def bloc(nature, contenu):
+        return (struct.pack('>I', len(contenu)) + nature + contenu
+                + struct.pack('>I', zlib.crc32(nature + contenu) & 0xFFFFFFFF))
+
+    entete = struct.pack('>IIBBBBB', cote, cote, 8, 6 if alpha else 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + bloc(b'IHDR', entete)
+            + bloc(b'IDAT', zlib.compress(pixels, 1)) + bloc(b'IEND', b''))
+
+def fiche_synthetique(taille_texte, citations, taille_image, alpha=False):
+    """Construit une fiche synthétique : texte réparti sur resume, notes et schemas, citations et image collée."""
+    data = {section: f"Contenu de la section {section}." for section in SECTIONS_ORDER}
+    data['titre'] = "Madame Bovary"
+    data['auteur'] = "Gustave Flaubert"
+    repetitions = max(1, taille_texte // (3 * len(PARAGRAPHE)))
+    for section in ('resume', 'notes', 'schemas'):
+        data[section] = PARAGRAPHE * repetitions
+    data['citations'] = [{'text': f"Citation numéro {i}", 'page': str(i % 400 + 1)} for i in range(citations)]
+    if taille_image:
+        image = base64.b64encode(png_synthetique(taille_image, alpha)).decode('ascii')
+        data['images'] = f"Schéma du récit :\ndata:image/png;base64,{image}\nFin du schéma."
+    return data
+
+def disponible(module):
+    """Indique si une bibliothèque optionnelle est installée, sans l'importer."""
+    return importlib.util.find_spec(module) is not None
+
+def mesures(dossier):
+    """Retourne les mesures disponibles : {nom: (fonction(data), dépendance manquante ou None)}.
+
+    Les fonctions 'isolé' appellent directement une fonction d'un exporteur ;
+    les mesures 'bout-en-bout' passent par export_fiche.exporter (modèle,
+    nommage, écriture atomique), dans un dossier neuf à chaque appel.
+    """
+    import export_fiche
+
+    compteur = iter(range(1 << 30))
+
+    def nouveau_dossier():
+        chemin = os.path.join(dossier, str(next(compteur)))
+        os.makedirs(chemin)
+        return chemin
+
+    def generer(nom):
+        return lambda data: importlib.import_module(f"export_fiche_{nom}").generate_html(data)
+
+    def simple(fonction, extension, **options):
+        def mesure(data):
+            module = importlib.import_module('export_fiche_simple')
+            if not getattr(module, fonction)(data, os.path.join(nouveau_dossier(), f"fiche.{extension}"), **options):
+                raise RuntimeError(f"échec de {fonction}")
+        return mesure
+
+    def bout_en_bout(fmt, theme='modern'):
+        return lambda data: export_fiche.exporter(data, fmt, nouveau_dossier(), theme)
+
+    manque_fpdf = None if disponible('fpdf') else 'fpdf'
+    manque_docx = None if disponible('docx') else 'docx'
+    return {
+        'isolé/modele.construire_document': (construire_document, None),
+        'isolé/modern.generate_html': (generer('modern'), None),
+        'isolé/webstyle.generate_html': (generer('webstyle'), None),
+        'isolé/simple_web.generate_html': (generer('simple_web'), None),
+        'isolé/simple.creer_pdf': (simple('creer_pdf', 'pdf'), None),
+        'isolé/simple.creer_pdf[fpdf]': (simple('creer_pdf', 'pdf', moteur='fpdf'), manque_fpdf),
+        'isolé/simple.creer_docx': (simple('creer_docx', 'docx'), None),
+        'isolé/simple.creer_docx[python-docx]': (simple('creer_docx', 'docx', moteur='python-docx'), manque_docx),
+        'bout-en-bout/html': (bout_en_bout('html'), None),
+        'bout-en-bout/pdf': (bout_en_bout('pdf'), None),
+        'bout-en-bout/docx': (bout_en_bout('docx'), None),
+    }
+
+def mesurer(fonction, data, repetitions):
+    """Retourne (durée médiane en ms, pic mémoire en Mo) d'une fonction.
+
+    Les durées sont prises sans tracemalloc, qui ralentit l'allocation ; le pic
+    mémoire est mesuré lors d'un passage supplémentaire.
+    """
+    fonction(data)  # échauffement : imports et caches de modules
+    durees = []
+    for _ in range(repetitions):
+        gc.collect()
+        debut = time.perf_counter()
+        fonction(data)
+        durees.append((time.perf_counter() - debut) * 1000)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fonction(data)
+        _, pic = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(durees), pic / (1024 * 1024)
+
+def comparer(resultats, reference, tolerance_duree, tolerance_memoire):
+    """Retourne les régressions (messages) par rapport à la référence et les mesures qui n'y figurent pas."""
+    regressions = []
+    sans_reference = []
+    for cle, (duree, pic) in sorted(resultats.items()):
+        attendu = reference.get(cle)
+        if attendu is None:
+            sans_reference.append(cle)
+            continue
+        if duree > max(attendu['duree_ms'] * (1 + tolerance_duree), attendu['duree_ms'] + ECART_MIN_MS):
+            regressions.append(f"{cle} : {duree:.1f} ms contre {attendu['duree_ms']:.1f} ms")
+        if pic > max(attendu['pic_mo'] * (1 + tolerance_memoire), attendu['pic_mo'] + ECART_MIN_MO):
+            regressions.append(f"{cle} : {pic:.1f} Mo contre {attendu['pic_mo']:.1f} Mo")
+    return regressions, sans_reference
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesure chaque exporteur sur des fiches synthétiques.")
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="scénario à mesurer (répétable ; défaut : tous)")
+    parser.add_argument('-m', '--mesure', action='append', default=None,
+                        help="ne garder que les mesures contenant ce texte (répétable)")
+    parser.add_argument('-n', '--repetitions', type=int, default=5,
+                        help="répétitions chronométrées par mesure (défaut : %(default)s)")
+    parser.add_argument('--reference', default=REFERENCE_DEFAUT,
+                        help="fichier de référence (défaut : bench_reference.json)")
+    parser.add_argument('--enregistrer', action='store_true',
+                        help="enregistrer les résultats comme nouvelle référence")
+    parser.add_argument('--verifier', action='store_true',
+                        help="échouer si une mesure dépasse la référence au-delà de la tolérance")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE_DUREE,
+                        help="écart de durée toléré (défaut : %(default)s, soit +25 %%)")
+    parser.add_argument('--tolerance-memoire', type=float, default=TOLERANCE_MEMOIRE,
+                        help="écart de pic mémoire toléré (défaut : %(default)s)")
+    args = parser.parse_args()
+
+    scenarios = args.scenario or list(SCENARIOS)
+    resultats = {}
+    with tempfile.TemporaryDirectory() as dossier:
+        a_mesurer = mesures(dossier)
+        print(f"{'mesure':<40}{'scénario':>10}{'durée (ms)':>14}{'pic (Mo)':>12}")
+        for scenario in scenarios:
+            data = fiche_synthetique(*SCENARIOS[scenario])
+            for nom, (fonction, manque) in a_mesurer.items():
+                if args.mesure and not any(filtre in nom for filtre in args.mesure):
+                    continue
+                if manque:
+                    print(f"{nom:<40}{scenario:>10}{'— ' + manque + ' non installé':>26}")
+                    continue
+                duree, pic = mesurer(fonction, data, args.repetitions)
+                resultats[f"{scenario}/{nom}"] = (duree, pic)
+                print(f"{nom:<40}{scenario:>10}{duree:>14.1f}{pic:>12.1f}")
+
+    if args.enregistrer:
+        reference = {}
+        if os.path.exists(args.reference):
+            with open(args.reference, 'r', encoding='utf-8') as f:
+                reference = json.load(f)
+        reference.update({
+            cle: {'duree_ms': round(duree, 3), 'pic_mo': round(pic, 3)}
+            for cle, (duree, pic) in resultats.items()
+        })
+        with open(args.reference, 'w', encoding='utf-8') as f:
+            json.dump(reference, f, indent=2, ensure_ascii=False, sort_keys=True)
+        print(f"\n✓ Référence enregistrée : {args.reference}")
+
+    if args.verifier:
+        if not os.path.exists(args.reference):
+            print(f"Erreur : aucune référence ({args.reference}) ; lancez d'abord --enregistrer.")
+            sys.exit(1)
+        with open(args.reference, 'r', encoding='utf-8') as f:
+            reference = json.load(f)
+        regressions, sans_reference = comparer(resultats, reference, args.tolerance, args.tolerance_memoire)
+        if sans_reference:
+            print(f"\n⚠ {len(sans_reference)} mesure(s) absente(s) de la référence, non vérifiée(s) :")
+            for cle in sans_reference:
+                print(f"  - {cle}")
+            if len(sans_reference) == len(resultats):
+                print("Erreur : aucune mesure n'a pu être comparée ; lancez d'abord --enregistrer.")
+                sys.exit(1)
+        if regressions:
+            print(f"\n✗ {len(regressions)} régression(s) :")
+            for message in regressions:
+                print(f"  - {message}")
+            sys.exit(1)
+        print("\n✓ Aucune régression par rapport à la référence.")
+
+if __name__ == "__main__":
+    main()
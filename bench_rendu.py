@@ -0,0 +1,94 @@
+import argparse
+import sys
+import time
+
+import export_fiche_modern
+import export_fiche_simple_web
+import export_fiche_webstyle
+from fiche_modele import SECTIONS_ORDER
+from fiche_rendu import rendre_html
+
+THEMES = {
+    'modern': export_fiche_modern.THEME,
+    'webstyle': export_fiche_webstyle.THEME,
+    'simple_web': export_fiche_simple_web.THEME,
+}
+
+# Tailles d'entrée mesurées, en octets (10 Ko à 50 Mo)
+TAILLES = [10_000, 100_000, 1_000_000, 10_000_000, 50_000_000]
+
+# Écart toléré à la linéarité : une entrée k fois plus grande peut prendre au plus
+# k × MARGE_LINEAIRE fois plus de temps que la précédente (un rendu quadratique
+# prendrait k² fois plus) ; la marge absorbe caches processeur et allocations
+MARGE_LINEAIRE = 2
+
+PARAGRAPHE = "Emma relit ses lettres <à la lueur> de la lampe & rêve de Paris.\n"
+
+def fiche_synthetique(taille):
+    """Construit une fiche d'environ `taille` octets, concentrés dans resume, notes et schemas."""
+    data = {section: f"Contenu de la section {section}." for section in SECTIONS_ORDER}
+    data['titre'] = "Madame Bovary"
+    data['auteur'] = "Gustave Flaubert"
+    repetitions = max(1, taille // (3 * len(PARAGRAPHE)))
+    for section in ('resume', 'notes', 'schemas'):
+        data[section] = PARAGRAPHE * repetitions
+    data['citations'] = [
+        {'text': f"Citation numéro {i}", 'page': str(i)}
+        for i in range(max(1, taille // 10_000))
+    ]
+    return data
+
+def mesurer(data, theme, repetitions):
+    """Retourne la meilleure durée de rendu (en secondes) sur plusieurs répétitions."""
+    meilleure = float('inf')
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        rendre_html(data, theme)
+        meilleure = min(meilleure, time.perf_counter() - debut)
+    return meilleure
+
+def ecarts_lineaires(durees):
+    """Retourne les écarts à la linéarité (messages) entre tailles successives {taille: durée}."""
+    ecarts = []
+    tailles = sorted(durees)
+    for petite, grande in zip(tailles, tailles[1:]):
+        facteur = grande / petite
+        rapport = durees[grande] / durees[petite]
+        if rapport > facteur * MARGE_LINEAIRE:
+            ecarts.append(f"{petite / 1_000_000:.2f} → {grande / 1_000_000:.2f} Mo : "
+                          f"durée × {rapport:.1f} pour une entrée × {facteur:.0f}")
+    return ecarts
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesure la mise à l'échelle du moteur de rendu HTML.")
+    parser.add_argument('--max-mo', type=float, default=50,
+                        help="taille d'entrée maximale mesurée, en Mo (défaut : 50)")
+    parser.add_argument('-t', '--theme', choices=sorted(THEMES), default=None,
+                        help="ne mesurer qu'un thème")
+    args = parser.parse_args()
+
+    tailles = [t for t in TAILLES if t <= args.max_mo * 1_000_000]
+    themes = [args.theme] if args.theme else sorted(THEMES)
+
+    print(f"{'thème':<12}{'entrée':>12}{'durée (ms)':>14}{'ms / Mo':>12}")
+    ecarts = []
+    for nom in themes:
+        durees = {}
+        for taille in tailles:
+            data = fiche_synthetique(taille)
+            repetitions = 5 if taille <= 1_000_000 else 3 if taille <= 10_000_000 else 1
+            duree = durees[taille] = mesurer(data, THEMES[nom], repetitions)
+            print(f"{nom:<12}{taille / 1_000_000:>10.2f}Mo{duree * 1000:>14.2f}"
+                  f"{duree * 1000 / (taille / 1_000_000):>12.2f}")
+        ecarts.extend(f"{nom} : {ecart}" for ecart in ecarts_lineaires(durees))
+
+    # Vérification de la mise à l'échelle : la durée ne doit pas croître plus vite que l'entrée
+    if ecarts:
+        print(f"\n✗ Rendu plus que linéaire (marge × {MARGE_LINEAIRE}) :")
+        for message in ecarts:
+            print(f"  - {message}")
+        sys.exit(1)
+    print(f"\n✓ Durée linéaire en la taille de l'entrée (marge × {MARGE_LINEAIRE}).")
+
+if __name__ == "__main__":
+    main()
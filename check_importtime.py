@@ -0,0 +1,66 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Budget d'import par format (millisecondes, médiane de plusieurs lancements)
+BUDGET_MS = 40
+
+# Modules qui ne doivent jamais être chargés pour un format donné
+INTERDITS = {
+    'html': {'fpdf', 'docx', 'pdfkit', 'webbrowser'},
+    'pdf': {'docx', 'pdfkit', 'webbrowser', 'sqlite3'},
+    'docx': {'fpdf', 'pdfkit', 'webbrowser', 'sqlite3'},
+}
+
+def importtime(code):
+    """Exécute du code sous `python -X importtime` et retourne {module de premier niveau: µs cumulées}."""
+    resultat = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, check=True
+    )
+    modules = {}
+    for ligne in resultat.stderr.splitlines():
+        if not ligne.startswith('import time:') or 'cumulative' in ligne:
+            continue
+        _, cumule, nom = ligne[len('import time:'):].split('|')
+        # Les imports imbriqués sont indentés : seuls ceux de premier niveau sont comptés
+        if nom.startswith('  '):
+            modules.setdefault('*', set()).add(nom.strip())
+            continue
+        modules[nom.strip()] = int(cumule)
+    return modules
+
+def mesurer(fmt, lancements):
+    """Retourne (durée médiane en ms, modules chargés) de l'import du backend d'un format."""
+    demarrage = set(importtime('pass'))
+    code = f"import export_fiche; export_fiche.charger_backend({fmt!r})"
+    durees = []
+    charges = set()
+    for _ in range(lancements):
+        modules = importtime(code)
+        charges = set(modules) | modules.pop('*', set())
+        durees.append(sum(us for nom, us in modules.items() if nom not in demarrage) / 1000)
+    return statistics.median(durees), charges
+
+def main():
+    parser = argparse.ArgumentParser(description="Vérifie le temps d'import de chaque format d'export.")
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS,
+                        help="budget par format en ms (défaut : %(default)s)")
+    parser.add_argument('-n', '--lancements', type=int, default=5,
+                        help="nombre de lancements mesurés par format (défaut : %(default)s)")
+    args = parser.parse_args()
+
+    echecs = 0
+    for fmt, interdits in INTERDITS.items():
+        duree, charges = mesurer(fmt, args.lancements)
+        en_trop = sorted(interdits & charges)
+        ok = duree <= args.budget_ms and not en_trop
+        echecs += not ok
+        print(f"{'✓' if ok else '✗'} {fmt:<5} {duree:6.1f} ms (budget {args.budget_ms:.0f} ms)"
+              + (f" — modules chargés à tort : {', '.join(en_trop)}" if en_trop else ""))
+
+    sys.exit(1 if echecs else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+
+# Module fournissant chaque format ; seul celui du format demandé est importé
+BACKENDS = {
+    'pdf': 'export_fiche_simple',
+    'docx': 'export_fiche_simple',
+}
+
+# Thèmes HTML disponibles
+THEMES_HTML = {
+    'modern': 'export_fiche_modern',
+    'webstyle': 'export_fiche_webstyle',
+    'simple_web': 'export_fiche_simple_web',
+}
+
+def charger_backend(fmt, theme='modern'):
+    """Importe et retourne le module qui produit le format demandé."""
+    if fmt == 'html':
+        return importlib.import_module(THEMES_HTML[theme])
+    return importlib.import_module(BACKENDS[fmt])
+
+def theme_html(theme='modern', palette=None):
+    """Retourne le thème HTML (fiche_rendu.Theme) demandé, recoloré selon une palette s'il y en a une."""
+    module_theme = charger_backend('html', theme).THEME
+    if palette is None:
+        return module_theme
+    from fiche_themes import theme_personnalise
+    return theme_personnalise(module_theme, palette)
+
+# Exports produits par --format tout : (format, thème)
+TOUS_LES_EXPORTS = [
+    ('pdf', None), ('docx', None),
+    ('html', 'modern'), ('html', 'webstyle'), ('html', 'simple_web'),
+]
+
+def chemin_sortie(data, fmt, export_dir, theme='modern', concordance=False, css_externe=False, glossaire=False,
+                  palette=None):
+    """Retourne le chemin de sortie d'une fiche, dérivé de son contenu et de la version de l'exporteur."""
+    from fiche_cache import nom_sortie
+
+    if fmt != 'html':
+        version = charger_backend(fmt).EXPORT_VERSION
+    elif css_externe:
+        module_theme = theme_html(theme, palette)
+        version = f"{module_theme.empreinte}:{module_theme.feuille}"
+    else:
+        version = theme_html(theme, palette).empreinte
+    prefixe = f"fiche_lecture_{theme}" if fmt == 'html' else "fiche_lecture"
+    if concordance:
+        prefixe += "_concordance"
+    if glossaire:
+        prefixe += "_glossaire"
+    nom = nom_sortie(prefixe, data, version)
+    return os.path.join(export_dir, f"{nom}.{fmt}")
+
+def rendre(doc, fmt, chemin, theme='modern', profil=None, css_externe=False, palette=None):
+    """Rend un document (fiche JSON ou document intermédiaire) dans un format donné.
+
+    Écrit dans un fichier temporaire renommé à la fin : jamais d'export partiel.
+    Les images collées sont partagées par tous les formats dans le dossier
+    'images' voisin, une seule fois par contenu. Avec css_externe=True, la page
+    HTML lie la feuille de style partagée du thème, écrite dans le même dossier.
+    Avec une palette (fiche_themes.charger_palette), le thème HTML est recoloré.
+    Avec un profil (fiche_profil.Profil), le rendu et ses étapes sont chronométrés.
+    """
+    from fiche_cache import ouvrir_cache
+    from fiche_images import MagasinImages
+    from fiche_manifeste import abandonner_temporaire, chemin_temporaire
+    from fiche_profil import mesurer
+
+    with mesurer(profil, f"{fmt} {theme}" if fmt == 'html' else fmt, 'export'):
+        module = charger_backend(fmt, theme)
+        temporaire = chemin_temporaire(chemin)
+        try:
+            if fmt == 'html':
+                cache = ouvrir_cache(os.path.join(os.path.dirname(chemin), '.cache'))
+                images = MagasinImages(os.path.join(os.path.dirname(chemin), 'images'))
+                if css_externe:
+                    from fiche_rendu import ecrire_feuille
+                    ecrire_feuille(theme_html(theme, palette), os.path.dirname(chemin))
+                with open(temporaire, 'w', encoding='utf-8') as f:
+                    if palette is None:
+                        f.writelines(module.generate_html_stream(doc, cache, images, profil, css_externe=css_externe))
+                    else:
+                        from fiche_rendu import iter_html
+                        f.writelines(iter_html(doc, theme_html(theme, palette), cache, images, profil, css_externe))
+            elif fmt == 'pdf':
+                if not module.creer_pdf(doc, temporaire, profil=profil):
+                    raise RuntimeError("échec de la création du PDF")
+            else:
+                if not module.creer_docx(doc, temporaire, profil=profil):
+                    raise RuntimeError("échec de la création du DOCX")
+            os.replace(temporaire, chemin)
+        finally:
+            abandonner_temporaire(chemin)
+    return chemin
+
+def exporter(data, fmt, export_dir, theme='modern', concordance=False, profil=None, css_externe=False,
+             glossaire=False, palette=None):
+    """Exporte une fiche dans un seul format et retourne (chemin, réutilisé).
+
+    Avec concordance=True, une annexe reprend les citations triées par page.
+    Avec glossaire=True, les termes du lexique et du glossaire sont liés à leur
+    définition dans les autres sections (HTML). Avec une palette de thème
+    personnalisé (fiche_themes), le thème HTML en prend les couleurs.
+    """
+    from fiche_modele import construire_document
+
+    chemin = chemin_sortie(data, fmt, export_dir, theme, concordance, css_externe, glossaire, palette)
+    if os.path.exists(chemin):
+        return chemin, True
+    doc = construire_document(data, concordance, glossaire) if concordance or glossaire else data
+    return rendre(doc, fmt, chemin, theme, profil, css_externe, palette), False
+
+def exporter_tout(data, export_dir, workers=None, concordance=False, profil=None, css_externe=False,
+                  glossaire=False, palette=None):
+    """Exporte une fiche en PDF, DOCX et dans les trois thèmes HTML en parallèle.
+
+    Le document intermédiaire est construit une seule fois puis transmis aux
+    processus de travail : le coût total est celui d'une analyse plus celui du
+    backend le plus lent. Retourne une liste de (format, thème, chemin, erreur).
+    Avec un profil, les événements des processus de travail y sont fusionnés.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from fiche_modele import construire_document
+    from fiche_profil import mesurer, profiler
+
+    with mesurer(profil, 'modele'):
+        doc = construire_document(data, concordance, glossaire)
+    resultats = []
+    with ProcessPoolExecutor(max_workers=workers or len(TOUS_LES_EXPORTS)) as executor:
+        futures = []
+        for fmt, theme in TOUS_LES_EXPORTS:
+            try:
+                chemin = chemin_sortie(data, fmt, export_dir, theme, concordance, css_externe, glossaire, palette)
+            except ImportError as e:
+                resultats.append((fmt, theme, None, f"backend non installé ({e})"))
+                continue
+            if os.path.exists(chemin):
+                resultats.append((fmt, theme, chemin, None))
+                continue
+            if profil is None:
+                future = executor.submit(rendre, doc, fmt, chemin, theme, css_externe=css_externe, palette=palette)
+            else:
+                future = executor.submit(profiler, rendre, doc, fmt, chemin, theme, css_externe=css_externe,
+                                         palette=palette)
+            futures.append((fmt, theme, chemin, future))
+
+        for fmt, theme, chemin, future in futures:
+            try:
+                resultat = future.result()
+                if profil is not None:
+                    profil.etendre(resultat[1])
+                resultats.append((fmt, theme, chemin, None))
+            except Exception as e:
+                resultats.append((fmt, theme, chemin, f"{e.__class__.__name__} : {e}"))
+    return resultats
+
+def ecrire_profil(profil, chemin):
+    """Écrit la trace de profilage, s'il y en a une."""
+    if profil is None:
+        return
+    profil.ecrire(chemin)
+    print(f"✓ Trace de profilage : {chemin}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporte une fiche de lecture JSON dans un format donné.")
+    parser.add_argument('fiche', help="chemin vers la fiche JSON")
+    parser.add_argument('-f', '--format', choices=('pdf', 'docx', 'html', 'tout'), default='html',
+                        help="format de sortie ; 'tout' produit chaque format en parallèle (défaut : html)")
+    parser.add_argument('-t', '--theme', choices=sorted(THEMES_HTML), default='modern',
+                        help="thème du format html (défaut : modern)")
+    parser.add_argument('-o', '--sortie', default=None,
+                        help="dossier de sortie (défaut : 'exports' à côté de la fiche)")
+    parser.add_argument('--concordance', action='store_true',
+                        help="ajouter en annexe les citations triées par page")
+    parser.add_argument('--glossaire', action='store_true',
+                        help="lier chaque terme du lexique et du glossaire à sa définition (HTML)")
+    parser.add_argument('--css-externe', action='store_true',
+                        help="lier la feuille de style partagée du thème (fiche-<thème>.<version>.css, "
+                             "écrite dans le dossier de sortie) au lieu d'intégrer le CSS à la page")
+    parser.add_argument('--theme-json', default=None, metavar='FICHIER',
+                        help="thème personnalisé de l'application (JSON de useCustomThemes ; "
+                             "FICHIER#id pour choisir dans une liste) appliqué aux thèmes HTML")
+    parser.add_argument('--ouvrir', action='store_true',
+                        help="ouvrir l'export HTML dans le navigateur")
+    parser.add_argument('--profile', nargs='?', const='trace_export.json', default=None, metavar='FICHIER',
+                        help="écrire une trace Chrome (chrome://tracing, Perfetto) des phases et "
+                             "sections de l'export (défaut : trace_export.json)")
+    args = parser.parse_args()
+
+    from fiche_profil import Profil, mesurer
+    profil = Profil() if args.profile else None
+
+    if not os.path.exists(args.fiche):
+        print(f"Erreur : Le fichier {args.fiche} n'existe pas.")
+        sys.exit(1)
+
+    try:
+        with mesurer(profil, 'json', fichier=args.fiche), open(args.fiche, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Erreur lors de la lecture du fichier JSON : {e}")
+        sys.exit(1)
+
+    palette = None
+    if args.theme_json:
+        from fiche_themes import charger_palette
+        try:
+            palette = charger_palette(args.theme_json)
+        except (OSError, ValueError) as e:
+            print(f"Erreur lors de la lecture du thème JSON : {e}")
+            sys.exit(1)
+
+    export_dir = args.sortie or os.path.join(os.path.dirname(os.path.abspath(args.fiche)), 'exports')
+    os.makedirs(export_dir, exist_ok=True)
+
+    if args.format == 'tout':
+        echecs = 0
+        resultats = exporter_tout(data, export_dir, concordance=args.concordance, profil=profil,
+                                  css_externe=args.css_externe, glossaire=args.glossaire, palette=palette)
+        ecrire_profil(profil, args.profile)
+        for fmt, theme, chemin, erreur in resultats:
+            libelle = f"{fmt.upper()} {theme}" if theme else fmt.upper()
+            if erreur:
+                echecs += 1
+                print(f"✗ {libelle} : {erreur}")
+            else:
+                print(f"✓ {libelle} : {chemin}")
+        sys.exit(1 if echecs else 0)
+
+    try:
+        chemin, reutilise = exporter(data, args.format, export_dir, args.theme, args.concordance, profil,
+                                     args.css_externe, args.glossaire, palette)
+    except ImportError as e:
+        print(f"Erreur : le backend {args.format.upper()} n'est pas installé ({e}).")
+        sys.exit(1)
+    except RuntimeError as e:
+        print(f"Erreur : {e}")
+        sys.exit(1)
+    finally:
+        ecrire_profil(profil, args.profile)
+
+    if reutilise:
+        print(f"✓ Fiche inchangée, export existant : {chemin}")
+    else:
+        print(f"✓ Fichier {args.format.upper()} créé : {chemin}")
+
+    if args.ouvrir and args.format == 'html':
+        import webbrowser
+        webbrowser.open('file://' + os.path.abspath(chemin))
+
+if __name__ == "__main__":
+    main()
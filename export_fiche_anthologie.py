@@ -0,0 +1,505 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+from fiche_entree import est_multi_fiches, iter_fiches
+from fiche_manifeste import abandonner_temporaire, chemin_temporaire
+from fiche_modele import construire_document
+from fiche_profil import Profil, mesurer
+
+# Taille au-delà de laquelle un volume est clos et le suivant commencé (octets)
+VOLUME_MAX_DEFAUT = 50 * 1024 * 1024
+
+# Formats produits par défaut
+FORMATS = ('html', 'pdf')
+
+# Règles propres à l'anthologie, ajoutées à la feuille de style du thème
+CSS_ANTHOLOGIE = """
+.anthologie-entete { text-align: center; padding: 2rem 1rem 1rem; }
+.anthologie-entete h1 { font-size: 2rem; margin-bottom: .5rem; }
+.volumes a { margin: 0 .3rem; }
+.sommaire { max-width: 900px; margin: 0 auto 2rem; padding: 0 20px; }
+.sommaire ol { padding-left: 2rem; }
+.sommaire li { margin: .2rem 0; }
+.sommaire .auteur { color: #6c757d; font-style: italic; }
+.fiche { margin-bottom: 3rem; }
+.fiche-entete { border-bottom: 2px solid #ddd; margin: 2rem 0 1.5rem; padding-bottom: .5rem; }
+.fiche-entete h1 { font-size: 1.8rem; margin: 0; }
+.fiche-entete p { color: #6c757d; margin: .3rem 0 0; }
+@media print { .fiche { break-before: page; } .sommaire { break-after: page; } }
+"""
+
+EN_TETE = """<!DOCTYPE html>
+<html lang="fr">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{titre}</title>
+    <link rel="stylesheet" href="{feuille}">
+</head>
+<body>
+    <header class="anthologie-entete">
+        <h1>{titre}</h1>
+        <p>{nombre} fiche(s) • générée le {date_str}</p>
+        {volumes}
+    </header>
+    <nav class="sommaire">
+        <h2>Sommaire</h2>
+        <ol>
+"""
+
+PIED = """    </main>
+</body>
+</html>
+"""
+
+def chemin_volume(dossier, nom, extension, numero, total):
+    """Retourne le chemin d'un volume : <nom>.<ext> s'il est seul, <nom>-NN.<ext> sinon."""
+    if total == 1:
+        return os.path.join(dossier, f"{nom}.{extension}")
+    return os.path.join(dossier, f"{nom}-{numero:02d}.{extension}")
+
+def _titre(doc):
+    return 'Sans titre' if doc.titre is None else str(doc.titre)
+
+def _auteur(doc):
+    return 'Auteur inconnu' if doc.auteur is None else str(doc.auteur)
+
+def _supprimer(chemin):
+    try:
+        os.remove(chemin)
+    except FileNotFoundError:
+        pass
+
+class AnthologieHTML:
+    """Anthologie HTML : fiches mises bout à bout, sommaire et feuille de style partagée.
+
+    Chaque fiche est d'abord rendue en mémoire (preparer), puis ajoutée au
+    corps du volume en cours (valider) : une fiche dont le rendu échoue
+    n'apparaît ni dans le volume ni dans le sommaire. Le corps de chaque volume
+    (les fiches rendues par fiche_rendu.iter_sections) est écrit dans un
+    fichier temporaire ; un volume est clos dès que son corps dépasse
+    volume_max octets. À la fermeture, chaque volume reçoit son en-tête et le
+    sommaire de toute l'anthologie (liens vers les ancres #fiche-N des
+    volumes), puis son corps est recopié par blocs. Seules les entrées du
+    sommaire et la fiche en cours restent en mémoire.
+
+    La feuille de style, commune à tous les volumes, est calculée en dernier :
+    les polices du thème y sont réduites aux caractères de toutes les fiches.
+    Elle reprend le CSS minifié du thème et son nom contient l'empreinte de
+    son contenu (<nom>-<thème>.<empreinte>.css).
+    """
+
+    def __init__(self, dossier, nom, titre, theme, volume_max=VOLUME_MAX_DEFAUT, profil=None):
+        from fiche_cache import ouvrir_cache
+        from fiche_images import MagasinImages
+
+        self.dossier = dossier
+        self.nom = nom
+        self.titre = titre
+        self.theme = theme
+        self.volume_max = volume_max
+        self.profil = profil
+        self.cache = ouvrir_cache(os.path.join(dossier, '.cache'))
+        self.images = MagasinImages(os.path.join(dossier, 'images'))
+        self.caracteres = set()
+        # (numéro de la fiche, titre, auteur, numéro du volume)
+        self.entrees = []
+        self.corps = []
+        self.fichier = None
+
+    def _nouveau_volume(self):
+        if self.fichier is not None:
+            self.fichier.close()
+        chemin = os.path.join(self.dossier, f".{self.nom}-{len(self.corps) + 1:02d}.html.corps.tmp")
+        self.corps.append(chemin)
+        self.fichier = open(chemin, 'w', encoding='utf-8')
+
+    def preparer(self, doc):
+        """Rend une fiche (document intermédiaire) en mémoire, sans rien écrire ; à passer à valider()."""
+        from fiche_rendu import echapper, iter_sections
+
+        numero = len(self.entrees) + 1
+        titre, auteur = echapper(_titre(doc)), echapper(_auteur(doc))
+        caracteres = ()
+        if self.theme.fichiers_polices:
+            from fiche_assets import caracteres_document
+            caracteres = caracteres_document(doc)
+        html = ''.join((
+            f'\n    <article class="fiche" id="fiche-{numero}">\n'
+            f'        <header class="fiche-entete">\n            <h1>{titre}</h1>\n'
+            f'            <p>{auteur}</p>\n        </header>\n',
+            *iter_sections(doc, self.theme, self.cache, self.images, self.profil),
+            '\n    </article>\n',
+        ))
+        return numero, titre, auteur, caracteres, html
+
+    def valider(self, preparation):
+        """Ajoute au volume en cours une fiche rendue par preparer()."""
+        numero, titre, auteur, caracteres, html = preparation
+        if self.fichier is None or self.fichier.tell() >= self.volume_max:
+            self._nouveau_volume()
+        self.fichier.write(html)
+        self.entrees.append((numero, titre, auteur, len(self.corps)))
+        self.caracteres.update(caracteres)
+
+    def annuler(self, preparation):
+        """Oublie une fiche préparée : rien n'a été écrit."""
+
+    def abandonner(self):
+        """Supprime les corps temporaires des volumes (anthologie interrompue)."""
+        if self.fichier is not None:
+            self.fichier.close()
+        for corps in self.corps:
+            _supprimer(corps)
+
+    def _ecrire_feuille(self):
+        """Écrit la feuille de style partagée et retourne son chemin."""
+        import hashlib
+        from fiche_rendu import minifier_css
+
+        regles = [self.theme.css_minifie, minifier_css(CSS_ANTHOLOGIE)]
+        if self.theme.fichiers_polices:
+            from fiche_assets import faces_polices
+            with mesurer(self.profil, 'polices', 'anthologie'):
+                regles.insert(0, faces_polices(self.theme.police, self.theme.fichiers_polices,
+                                               frozenset(self.caracteres)))
+        contenu = '\n'.join(regles)
+        version = hashlib.sha256(contenu.encode('utf-8')).hexdigest()[:8]
+        chemin = os.path.join(self.dossier, f"{self.nom}-{self.theme.nom}.{version}.css")
+        try:
+            with open(chemin_temporaire(chemin), 'w', encoding='utf-8') as f:
+                f.write(contenu)
+            os.replace(chemin_temporaire(chemin), chemin)
+        finally:
+            abandonner_temporaire(chemin)
+        return chemin
+
+    def fermer(self):
+        """Assemble les volumes et écrit la feuille de style ; retourne les chemins écrits."""
+        from fiche_rendu import echapper
+
+        if self.fichier is None:
+            return []
+        self.fichier.close()
+        feuille = self._ecrire_feuille()
+        total = len(self.corps)
+        noms = [os.path.basename(chemin_volume(self.dossier, self.nom, 'html', numero, total))
+                for numero in range(1, total + 1)]
+        volumes = ''
+        if total > 1:
+            liens = ' '.join(f'<a href="{nom}">{numero}</a>' for numero, nom in enumerate(noms, 1))
+            volumes = f'<p class="volumes">Volumes : {liens}</p>'
+        date_str = datetime.now().strftime('%d/%m/%Y')
+        sommaire = ''.join(
+            f'            <li><a href="{noms[volume - 1]}#fiche-{numero}">{titre}</a> '
+            f'<span class="auteur">{auteur}</span></li>\n'
+            for numero, titre, auteur, volume in self.entrees
+        )
+
+        chemins = []
+        for numero, corps in enumerate(self.corps, 1):
+            titre = echapper(self.titre)
+            if total > 1:
+                titre += f" — volume {numero}/{total}"
+            chemin = os.path.join(self.dossier, noms[numero - 1])
+            try:
+                with open(chemin_temporaire(chemin), 'w', encoding='utf-8') as f:
+                    f.write(EN_TETE.format(titre=titre, feuille=os.path.basename(feuille), nombre=len(self.entrees),
+                                           date_str=date_str, volumes=volumes))
+                    f.write(sommaire)
+                    f.write('        </ol>\n    </nav>\n\n    <main class="container">\n')
+                    with open(corps, 'r', encoding='utf-8') as source:
+                        shutil.copyfileobj(source, f)
+                    f.write(PIED)
+                os.replace(chemin_temporaire(chemin), chemin)
+            finally:
+                abandonner_temporaire(chemin)
+            os.remove(corps)
+            chemins.append(chemin)
+        chemins.append(feuille)
+        return chemins
+
+class AnthologiePDF:
+    """Anthologie PDF écrite au fil de l'eau avec fiche_pdf_flux, en volumes.
+
+    Chaque fiche est mise en page par export_fiche_simple.ecrire_fiche_pdf, avec
+    un signet pour la fiche et pour chacune de ses sections. Elle est écrite
+    dès preparer(), après une marque du document (EcrivainPDF.marque) : si
+    elle doit être retirée (annuler), le volume revient à cette marque, sans
+    page, signet ni image de la fiche. Un volume est clos
+    dès que son fichier dépasse volume_max octets : son sommaire (titre, auteur,
+    numéro de page, lien vers la fiche) est alors écrit sur des pages placées en
+    tête du document. Le nombre de ces pages est connu d'avance, ce qui fixe
+    les numéros de page affichés avant même d'écrire le sommaire.
+    """
+
+    # Hauteur d'une ligne du sommaire et largeur de la colonne des numéros de page (mm)
+    LIGNE = 7
+    COLONNE_PAGE = 15
+
+    def __init__(self, dossier, nom, titre, volume_max=VOLUME_MAX_DEFAUT, profil=None):
+        from export_fiche_simple import polices_pdf
+        from fiche_images import MagasinImages
+
+        self.dossier = dossier
+        self.nom = nom
+        self.titre = titre
+        self.volume_max = volume_max
+        self.profil = profil
+        self.polices = polices_pdf()
+        self.images = MagasinImages(os.path.join(dossier, 'images'))
+        self.volumes = []
+        self.pdf = None
+        # (titre, auteur, destination, numéro de page dans le contenu) du volume en cours
+        self.entrees = []
+
+    def _nouveau_volume(self):
+        from fiche_pdf_flux import EcrivainPDF
+
+        self._clore_volume()
+        chemin = os.path.join(self.dossier, f".{self.nom}-{len(self.volumes) + 1:02d}.pdf.tmp")
+        self.volumes.append(chemin)
+        self.pdf = EcrivainPDF(chemin, self.titre, self.polices)
+
+    def preparer(self, doc):
+        """Met en page une fiche (document intermédiaire) dans le volume en cours ; à valider() ou annuler()."""
+        from export_fiche_simple import ecrire_fiche_pdf
+
+        if self.pdf is None or self.pdf.fichier.tell() >= self.volume_max:
+            self._nouveau_volume()
+        marque = self.pdf.marque()
+        try:
+            destination, page = ecrire_fiche_pdf(self.pdf, doc, self.images, self.profil, _titre(doc))
+        except BaseException:
+            self.pdf.revenir(marque)
+            raise
+        return marque, (_titre(doc), _auteur(doc), destination, page)
+
+    def valider(self, preparation):
+        """Inscrit au sommaire du volume une fiche mise en page par preparer()."""
+        self.entrees.append(preparation[1])
+
+    def annuler(self, preparation):
+        """Retire du volume une fiche mise en page par preparer()."""
+        self.pdf.revenir(preparation[0])
+
+    def abandonner(self):
+        """Supprime les volumes temporaires (anthologie interrompue)."""
+        if self.pdf is not None:
+            self.pdf.fichier.close()
+        for temporaire in self.volumes:
+            _supprimer(temporaire)
+
+    def _pages_sommaire(self, debut):
+        """Nombre de pages du sommaire, sa première ligne étant à debut mm du haut."""
+        from fiche_pdf_flux import MARGE
+
+        pages, y = 1, debut
+        for _ in self.entrees:
+            if y + self.LIGNE > self.pdf.declencheur:
+                pages += 1
+                y = MARGE
+            y += self.LIGNE
+        return pages
+
+    def _libelle(self, texte, largeur):
+        """Tronque un texte (points de suspension) pour qu'il tienne dans largeur mm."""
+        texte = texte[:200]
+        if self.pdf.largeur_texte(texte) <= largeur:
+            return texte
+        while texte and self.pdf.largeur_texte(texte + '…') > largeur:
+            texte = texte[:-1]
+        return texte + '…'
+
+    def _ecrire_sommaire(self):
+        from fiche_pdf_flux import MARGE, PAGE
+
+        pdf = self.pdf
+        contenu = pdf.page
+        pdf.ajouter_page()
+        pdf.choisir_police('B', 16)
+        pdf.cellule(0, 10, self.titre, 1, 'C')
+        pdf.choisir_police('B', 14)
+        pdf.cellule(0, 10, 'Sommaire', 1, 'C')
+        pdf.saut(5)
+        decalage = self._pages_sommaire(pdf.y)
+
+        largeur = PAGE[0] - 2 * MARGE
+        pdf.choisir_police('', 11)
+        for titre, auteur, destination, page in self.entrees:
+            if pdf.y + self.LIGNE > pdf.declencheur:
+                pdf.ajouter_page()
+            pdf.lien(MARGE, pdf.y, largeur, self.LIGNE, destination)
+            pdf.cellule(largeur - self.COLONNE_PAGE, self.LIGNE,
+                        self._libelle(f"{titre} — {auteur}", largeur - self.COLONNE_PAGE - 2))
+            pdf.cellule(self.COLONNE_PAGE, self.LIGNE, str(page + decalage), 1, 'R')
+        pdf.placer_en_tete(pdf.page - contenu)
+
+    def _clore_volume(self):
+        if self.pdf is None:
+            return
+        if not self.entrees:
+            # Volume ouvert pour des fiches toutes retirées : rien à garder
+            self.pdf.fichier.close()
+            _supprimer(self.volumes.pop())
+            self.pdf = None
+            return
+        with mesurer(self.profil, 'sommaire', 'anthologie', volume=len(self.volumes)):
+            self._ecrire_sommaire()
+        with mesurer(self.profil, 'pdf.fermer', 'anthologie', volume=len(self.volumes)):
+            self.pdf.fermer()
+        self.pdf = None
+        self.entrees = []
+
+    def fermer(self):
+        """Clôt le dernier volume et donne aux volumes leur nom définitif ; retourne leurs chemins."""
+        self._clore_volume()
+        chemins = []
+        for numero, temporaire in enumerate(self.volumes, 1):
+            chemin = chemin_volume(self.dossier, self.nom, 'pdf', numero, len(self.volumes))
+            os.replace(temporaire, chemin)
+            chemins.append(chemin)
+        return chemins
+
+def iter_sources(fichiers, echecs):
+    """Produit (source, fiche) pour chaque fiche des fichiers, archives NDJSON et tableaux compris.
+
+    Une fiche illisible est ajoutée à echecs (source, erreur) et sautée.
+    """
+    for json_file in fichiers:
+        try:
+            if est_multi_fiches(json_file):
+                for numero, data in enumerate(iter_fiches(json_file), 1):
+                    yield f"{json_file}#{numero}", data
+            else:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    yield json_file, json.load(f)
+        except (OSError, ValueError) as e:
+            echecs.append((json_file, f"{e.__class__.__name__} : {e}"))
+
+def exporter_anthologie(fiches, dossier, nom='anthologie', titre='Anthologie', formats=FORMATS,
+                        theme='modern', volume_max=VOLUME_MAX_DEFAUT, concordance=False, profil=None,
+                        palette=None):
+    """Réunit des fiches en une anthologie HTML et/ou PDF ; retourne (chemins, nombre de fiches, échecs).
+
+    fiches est un itérable de (source, fiche JSON), consommé une seule fois :
+    chaque fiche est analysée une fois, rendue dans chaque format, puis oubliée.
+    Une fiche n'entre dans les volumes qu'une fois rendue dans tous les
+    formats : si l'un échoue, elle est retirée des autres et comptée parmi les
+    échecs. La mémoire ne dépend ni du nombre de fiches ni de la taille des
+    volumes. Avec une palette (fiche_themes), le thème HTML en prend les
+    couleurs. Si l'anthologie est interrompue (erreur d'écriture...), ses
+    fichiers temporaires sont supprimés.
+    """
+    from export_fiche import theme_html
+
+    os.makedirs(dossier, exist_ok=True)
+    anthologies = []
+    if 'html' in formats:
+        anthologies.append(AnthologieHTML(dossier, nom, titre, theme_html(theme, palette), volume_max, profil))
+    if 'pdf' in formats:
+        anthologies.append(AnthologiePDF(dossier, nom, titre, volume_max, profil))
+
+    nombre = 0
+    echecs = []
+    try:
+        for source, data in fiches:
+            preparees = []
+            try:
+                with mesurer(profil, 'fiche', 'anthologie', source=source):
+                    doc = construire_document(data, concordance)
+                    for anthologie in anthologies:
+                        preparees.append((anthologie, anthologie.preparer(doc)))
+            except (AttributeError, TypeError, ValueError) as e:
+                for anthologie, preparation in reversed(preparees):
+                    anthologie.annuler(preparation)
+                echecs.append((source, f"{e.__class__.__name__} : {e}"))
+                continue
+            for anthologie, preparation in preparees:
+                anthologie.valider(preparation)
+            nombre += 1
+
+        chemins = []
+        for anthologie in anthologies:
+            chemins.extend(anthologie.fermer())
+    except BaseException:
+        for anthologie in anthologies:
+            anthologie.abandonner()
+        raise
+    return chemins, nombre, echecs
+
+def main():
+    from export_fiche import THEMES_HTML
+    from export_fiche_batch import lister_fiches
+
+    parser = argparse.ArgumentParser(
+        description="Réunit des fiches JSON en une anthologie HTML et PDF avec sommaire."
+    )
+    parser.add_argument('chemins', nargs='+',
+                        help="dossiers, motifs (ex. 'fiches/**/*.json') ou archives NDJSON (.ndjson, .jsonl)")
+    parser.add_argument('-o', '--sortie', default='anthologie',
+                        help="dossier de sortie (défaut : %(default)s)")
+    parser.add_argument('-n', '--nom', default='anthologie',
+                        help="nom des fichiers produits (défaut : %(default)s)")
+    parser.add_argument('--titre', default='Anthologie',
+                        help="titre de l'anthologie (défaut : %(default)s)")
+    parser.add_argument('-f', '--format', choices=FORMATS, action='append', default=None,
+                        help="format à produire, répétable (défaut : html et pdf)")
+    parser.add_argument('-t', '--theme', choices=sorted(THEMES_HTML), default='modern',
+                        help="thème du format html (défaut : modern)")
+    parser.add_argument('--theme-json', default=None, metavar='FICHIER',
+                        help="thème personnalisé de l'application (JSON de useCustomThemes ; "
+                             "FICHIER#id pour choisir dans une liste) appliqué au thème HTML")
+    parser.add_argument('--volume-max-mo', type=float, default=VOLUME_MAX_DEFAUT / (1024 * 1024),
+                        help="taille au-delà de laquelle un nouveau volume est commencé, en Mo "
+                             "(défaut : %(default)s)")
+    parser.add_argument('-r', '--recursif', action='store_true',
+                        help="parcourir les sous-dossiers des dossiers donnés")
+    parser.add_argument('--concordance', action='store_true',
+                        help="ajouter à chaque fiche l'annexe des citations triées par page")
+    parser.add_argument('--profile', nargs='?', const='trace_anthologie.json', default=None, metavar='FICHIER',
+                        help="écrire une trace Chrome (chrome://tracing, Perfetto) de l'anthologie "
+                             "(défaut : trace_anthologie.json)")
+    args = parser.parse_args()
+
+    fichiers = lister_fiches(args.chemins, args.recursif)
+    if not fichiers:
+        print("Erreur : aucun fichier JSON ou NDJSON trouvé.")
+        sys.exit(1)
+
+    palette = None
+    if args.theme_json:
+        from fiche_themes import charger_palette
+        try:
+            palette = charger_palette(args.theme_json)
+        except (OSError, ValueError) as e:
+            print(f"Erreur lors de la lecture du thème JSON : {e}")
+            sys.exit(1)
+
+    profil = Profil() if args.profile else None
+    debut = time.perf_counter()
+    echecs = []
+    chemins, nombre, erreurs = exporter_anthologie(
+        iter_sources(fichiers, echecs), args.sortie, args.nom, args.titre, tuple(args.format or FORMATS),
+        args.theme, int(args.volume_max_mo * 1024 * 1024), args.concordance, profil, palette
+    )
+    echecs.extend(erreurs)
+    print(f"{nombre} fiche(s) réunie(s) en {time.perf_counter() - debut:.2f} s")
+    for chemin in chemins:
+        print(f"✓ {chemin}")
+    if echecs:
+        print(f"✗ Échecs : {len(echecs)}")
+        for source, erreur in echecs:
+            print(f"  - {source} : {erreur}")
+    if profil is not None:
+        profil.ecrire(args.profile)
+        print(f"✓ Trace de profilage : {args.profile}")
+    sys.exit(1 if echecs else 0)
+
+if __name__ == "__main__":
+    main()
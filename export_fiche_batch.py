@@ -0,0 +1,447 @@
+import argparse
+import glob
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from fiche_cache import TAILLE_MAX_DEFAUT, empreinte, empreinte_fiche, nom_sortie, ouvrir_cache
+from fiche_entree import EXTENSIONS_NDJSON, est_multi_fiches, iter_fiches
+from fiche_images import MagasinImages
+from fiche_manifeste import Manifeste, abandonner_temporaire, chemin_temporaire, empreinte_fichier
+from fiche_modele import construire_document
+from fiche_profil import Profil, mesurer, profiler
+from fiche_rendu import ecrire_feuille, iter_html
+from fiche_wkhtmltopdf import TENTATIVES_DEFAUT, TIMEOUT_DEFAUT, trouver_binaire
+
+# Modules d'export disponibles en mode lot
+EXPORTEURS = {
+    'simple': 'export_fiche_simple',
+    'modern': 'export_fiche_modern',
+    'webstyle': 'export_fiche_webstyle',
+    'simple_web': 'export_fiche_simple_web',
+}
+
+# Fiches soumises au pool et non encore terminées, par processus de travail :
+# une archive NDJSON n'est lue qu'au rythme du rendu
+EN_VOL_PAR_WORKER = 4
+
+def lister_fiches(chemins, recursif=False):
+    """Retourne la liste triée des fichiers JSON et NDJSON désignés par des dossiers ou des motifs."""
+    fichiers = set()
+    for chemin in chemins:
+        if os.path.isdir(chemin):
+            for extension in ('.json',) + EXTENSIONS_NDJSON:
+                nom = f"*{extension}"
+                motif = os.path.join(chemin, '**', nom) if recursif else os.path.join(chemin, nom)
+                fichiers.update(glob.glob(motif, recursive=recursif))
+        else:
+            fichiers.update(glob.glob(chemin, recursive=True))
+    return sorted(f for f in fichiers if os.path.isfile(f))
+
+def dossier_sortie(json_file, sortie=None):
+    """Retourne le dossier d'export d'une fiche (dossier 'exports' voisin par défaut)."""
+    if sortie:
+        return sortie
+    return os.path.join(os.path.dirname(os.path.abspath(json_file)), 'exports')
+
+def nom_source(json_file, racine=None):
+    """Retourne le nom de base des sorties d'une source (nom du fichier sans extension).
+
+    Quand les sorties de tout le lot vont dans un même dossier (-o), le nom est
+    précédé du chemin relatif du fichier à la racine du lot : a/fiche.json et
+    b/fiche.json donnent a_fiche et b_fiche au lieu de s'écraser.
+    """
+    nom = os.path.splitext(os.path.basename(json_file))[0]
+    if racine is None:
+        return nom
+    relatif = os.path.relpath(os.path.dirname(os.path.abspath(json_file)), racine)
+    if relatif == os.curdir:
+        return nom
+    return '_'.join(relatif.split(os.sep) + [nom])
+
+def racine_lot(fichiers):
+    """Retourne le dossier commun à toutes les sources d'un lot, ou None s'il n'y en a pas."""
+    try:
+        return os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in fichiers])
+    except ValueError:
+        # Lot vide, ou sources sur des lecteurs différents (Windows)
+        return None
+
+def theme_exporteur(module, palette=None):
+    """Retourne le thème HTML d'un exporteur, recoloré selon une palette s'il y en a une."""
+    if palette is None:
+        return module.THEME
+    from fiche_themes import theme_personnalise
+    return theme_personnalise(module.THEME, palette)
+
+def version_exporteur(module, css_externe=False, palette=None):
+    """Retourne la version d'un exporteur, utilisée pour nommer ses sorties en cache.
+
+    Une page qui lie la feuille de style partagée diffère de la page autonome :
+    la version comprend alors le nom versionné de la feuille. Une palette de
+    thème personnalisé change le thème, donc la version.
+    """
+    if getattr(module, 'THEME', None) is None:
+        return module.EXPORT_VERSION
+    theme = theme_exporteur(module, palette)
+    return f"{theme.empreinte}:{theme.feuille}" if css_externe else theme.empreinte
+
+def exporter_fiche(json_file, exporteur, sortie=None, nom=None, pdf=True, cache_dir=None, cache_max=TAILLE_MAX_DEFAUT,
+                   concordance=False, incremental=False, css_externe=False, glossaire=False, palette=None,
+                   profil=None):
+    """Lit une fiche JSON et l'exporte avec exporter_donnees ; retourne (fichiers, réutilisée).
+
+    nom est le nom de base des sorties (nom_source) ; par défaut, celui du fichier.
+    """
+    with mesurer(profil, 'json', fichier=json_file), open(json_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    nom = nom or nom_source(json_file)
+    return exporter_donnees(data, nom, exporteur, dossier_sortie(json_file, sortie), pdf, cache_dir, cache_max,
+                            concordance, incremental, css_externe, glossaire, palette, profil)
+
+def exporter_donnees(data, nom, exporteur, export_dir, pdf=True, cache_dir=None, cache_max=TAILLE_MAX_DEFAUT,
+                     concordance=False, incremental=False, css_externe=False, glossaire=False, palette=None,
+                     profil=None):
+    """Exporte une fiche déjà lue avec l'exporteur donné et retourne (fichiers, réutilisée).
+
+    Exécutée dans un processus de travail : aucune fenêtre de navigateur n'est ouverte
+    et toute erreur est levée pour être comptabilisée dans le résumé. Les sorties sont
+    nommées <nom>_<exporteur> ; avec un dossier de cache ou en mode incrémental, le
+    nom dépend aussi du contenu de la fiche : si elles existent déjà, la fiche n'est
+    pas regénérée. Chaque sortie est écrite sous un nom temporaire propre au
+    processus, puis renommée. Avec concordance=True, une annexe reprend les
+    citations triées par page. Avec css_externe=True, les pages HTML lient la
+    feuille de style partagée du thème, écrite une fois dans le dossier de sortie.
+    Avec glossaire=True, les termes du lexique et du glossaire sont liés à leur
+    définition dans les autres sections. Avec une palette (fiche_themes), les
+    pages HTML prennent les couleurs du thème personnalisé ; le thème recoloré
+    est compilé une fois par processus, non une fois par fiche.
+
+    Le PDF de l'exporteur webstyle n'est pas produit ici : son chemin figure dans
+    les fichiers retournés et exporter_lot le convertit sur un pool commun.
+    Avec un profil (fiche_profil.Profil), modèle et rendu sont chronométrés.
+    """
+    module = importlib.import_module(EXPORTEURS[exporteur])
+    os.makedirs(export_dir, exist_ok=True)
+
+    # Nom de sortie dérivé de la source (nom_source), unique dans le lot
+    base_name = f"{nom}_{exporteur}"
+    if concordance:
+        base_name += "_concordance"
+    if glossaire:
+        base_name += "_glossaire"
+    if palette is not None and exporteur != 'simple':
+        from fiche_themes import nom_palette
+        base_name += f"_theme-{nom_palette(palette)}"
+    cache = None
+    if cache_dir or incremental:
+        base_name = nom_sortie(base_name, data, version_exporteur(module, css_externe, palette))
+    if cache_dir:
+        cache = ouvrir_cache(cache_dir, cache_max)
+    base_path = os.path.join(export_dir, base_name)
+    with mesurer(profil, 'modele', fiche=nom):
+        doc = construire_document(data, concordance, glossaire)
+
+    if exporteur == 'simple':
+        crees = [f"{base_path}.pdf", f"{base_path}.docx"]
+        if (cache or incremental) and all(os.path.exists(chemin) for chemin in crees):
+            return crees, True
+        try:
+            if not module.creer_pdf(doc, chemin_temporaire(crees[0]), profil=profil):
+                raise RuntimeError("échec de la création du PDF")
+            if not module.creer_docx(doc, chemin_temporaire(crees[1]), profil=profil):
+                raise RuntimeError("échec de la création du DOCX")
+            for chemin in crees:
+                os.replace(chemin_temporaire(chemin), chemin)
+        finally:
+            for chemin in crees:
+                abandonner_temporaire(chemin)
+        return crees, False
+
+    html_path = f"{base_path}.html"
+    crees = [html_path]
+    convertir = exporteur == 'webstyle' and pdf
+    if convertir:
+        crees.append(f"{base_path}.pdf")
+    if (cache or incremental) and all(os.path.exists(chemin) for chemin in crees):
+        return crees, True
+
+    images = MagasinImages(os.path.join(export_dir, 'images'))
+    theme = theme_exporteur(module, palette)
+    if css_externe:
+        ecrire_feuille(theme, export_dir)
+    temporaire = chemin_temporaire(html_path)
+    try:
+        with mesurer(profil, os.path.basename(html_path), 'export'), open(temporaire, 'w', encoding='utf-8') as f:
+            if palette is None:
+                f.writelines(module.generate_html_stream(doc, cache, images, profil, css_externe=css_externe))
+            else:
+                f.writelines(iter_html(doc, theme, cache, images, profil, css_externe))
+        os.replace(temporaire, html_path)
+    finally:
+        abandonner_temporaire(html_path)
+    return crees, False
+
+def convertir_pdfs(reussites, echecs, profil=None, **options):
+    """Convertit en PDF les exports HTML qui en attendent un, sur un pool wkhtmltopdf borné.
+
+    Les fiches dont la conversion échoue passent des réussites aux échecs.
+    """
+    from fiche_wkhtmltopdf import convertir_lot
+
+    attente = [
+        (json_file, crees[0], crees[1])
+        for json_file, crees, _ in reussites
+        if len(crees) == 2 and not os.path.exists(crees[1])
+    ]
+    if not attente:
+        return
+    # Les pages lient le magasin d'images (et la feuille partagée) du dossier de sortie
+    resultats = convertir_lot([(html, pdf) for _, html, pdf in attente], profil=profil,
+                              fichiers_locaux=True, **options)
+    rates = {}
+    for (json_file, _, _), resultat in zip(attente, resultats):
+        if isinstance(resultat, Exception):
+            rates[json_file] = f"{resultat.__class__.__name__} : {resultat}"
+    reussites[:] = [r for r in reussites if r[0] not in rates]
+    echecs.extend(rates.items())
+
+def exporter_lot(fichiers, exporteur, workers=None, sortie=None, pdf=True,
+                 cache_dir=None, cache_max=TAILLE_MAX_DEFAUT, concordance=False, options_pdf=None,
+                 profil=None, incremental=False, css_externe=True, glossaire=False, palette=None):
+    """Exporte toutes les fiches sur un pool de processus et retourne (réussites, échecs, durée).
+
+    Un fichier NDJSON (.ndjson, .jsonl) ou un tableau JSON de fiches est lu au fil
+    de l'eau par le processus principal : chaque fiche est soumise au pool dès
+    qu'elle est décodée, et la lecture attend tant que EN_VOL_PAR_WORKER fiches
+    par processus sont en cours. Le rendu commence donc sur la première fiche et
+    la mémoire ne dépend pas de la taille de l'archive.
+
+    En mode incrémental, le manifeste de chaque dossier de sortie (fiche_manifeste)
+    est consulté avant soumission : une fiche dont le contenu et la version de
+    l'exporteur n'ont pas changé n'est pas soumise au pool. Les sorties sont
+    nommées d'après le contenu ; celles qu'une fiche modifiée remplace, et celles
+    des fiches disparues, sont supprimées une fois le lot terminé.
+
+    Par défaut (css_externe=True), les pages HTML d'un dossier partagent une
+    feuille de style minifiée et versionnée au lieu d'intégrer chacune le CSS
+    du thème ; css_externe=False produit des pages autonomes. Avec une palette
+    de thème personnalisé (fiche_themes.charger_palette), le thème HTML en
+    prend les couleurs.
+
+    options_pdf est transmis au pool de conversion wkhtmltopdf (binaire, concurrence, timeout, tentatives).
+    Avec un profil, les événements des processus de travail et des conversions y sont fusionnés.
+    """
+    reussites = []
+    echecs = []
+    debut = time.perf_counter()
+    options_pdf = options_pdf or {}
+    if exporteur == 'webstyle' and pdf and trouver_binaire(options_pdf.get('binaire')) is None:
+        print("⚠ wkhtmltopdf est introuvable : les PDF ne seront pas générés.")
+        pdf = False
+    workers = workers or os.cpu_count()
+    options = (pdf, cache_dir, cache_max, concordance, incremental, css_externe, glossaire, palette)
+    # Sorties réunies dans un même dossier : noms préfixés du chemin relatif de la source
+    racine = racine_lot(fichiers) if sortie else None
+
+    # Mode incrémental : manifeste par dossier de sortie, sources vues par dossier,
+    # fichiers lus jusqu'au bout et source -> (dossier, clé, fichier, empreinte) des fiches soumises
+    manifestes = {}
+    vues = {}
+    lus = set()
+    soumises = {}
+    if incremental:
+        version = version_exporteur(importlib.import_module(EXPORTEURS[exporteur]), css_externe, palette)
+
+    def inchangee(source, json_file, export_dir, contenu, numero=None):
+        """En mode incrémental, retient la source et indique si ses exports sont à jour (réutilisés)."""
+        if not incremental:
+            return False
+        fichier = os.path.abspath(json_file)
+        cle = fichier if numero is None else f"{fichier}#{numero}"
+        manifeste = manifestes.get(export_dir)
+        if manifeste is None:
+            manifeste = manifestes[export_dir] = Manifeste(export_dir)
+        vues.setdefault(export_dir, set()).add(cle)
+        empreinte_source = empreinte(version, concordance, glossaire, pdf, contenu)
+        sorties = manifeste.a_jour(exporteur, cle, empreinte_source)
+        if sorties is not None:
+            reussites.append((source, sorties, True))
+            return True
+        soumises[source] = (export_dir, cle, fichier, empreinte_source)
+        return False
+
+    def taches():
+        """Produit (source, fonction, arguments) : un fichier à une fiche, ou chaque fiche d'une archive."""
+        for json_file in fichiers:
+            try:
+                export_dir = dossier_sortie(json_file, sortie)
+                if not est_multi_fiches(json_file):
+                    if not inchangee(json_file, json_file, export_dir,
+                                     empreinte_fichier(json_file) if incremental else None):
+                        yield (json_file, exporter_fiche,
+                               (json_file, exporteur, sortie, nom_source(json_file, racine)) + options)
+                else:
+                    base = nom_source(json_file, racine)
+                    for numero, data in enumerate(iter_fiches(json_file), 1):
+                        source = f"{json_file}#{numero}"
+                        if inchangee(source, json_file, export_dir,
+                                     empreinte_fiche(data, version) if incremental else None, numero):
+                            continue
+                        yield (source, exporter_donnees,
+                               (data, f"{base}_{numero:05d}", exporteur, export_dir) + options)
+                lus.add(os.path.abspath(json_file))
+            except (OSError, ValueError) as e:
+                # Archive illisible ou tronquée : les fiches déjà lues restent soumises
+                echecs.append((json_file, f"{e.__class__.__name__} : {e}"))
+
+    en_vol = {}
+
+    def recolter(terminees):
+        for future in terminees:
+            source = en_vol.pop(future)
+            try:
+                resultat = future.result()
+                if profil is not None:
+                    resultat, evenements = resultat
+                    profil.etendre(evenements)
+                crees, reutilise = resultat
+                reussites.append((source, crees, reutilise))
+            except Exception as e:
+                echecs.append((source, f"{e.__class__.__name__} : {e}"))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for source, fonction, arguments in taches():
+            if len(en_vol) >= EN_VOL_PAR_WORKER * workers:
+                recolter(wait(en_vol, return_when=FIRST_COMPLETED).done)
+            if profil is None:
+                future = executor.submit(fonction, *arguments)
+            else:
+                future = executor.submit(profiler, fonction, *arguments)
+            en_vol[future] = source
+        recolter(wait(en_vol).done)
+
+    if exporteur == 'webstyle' and pdf:
+        with mesurer(profil, 'conversions PDF', 'lot'):
+            convertir_pdfs(reussites, echecs, profil, **options_pdf)
+
+    if incremental:
+        with mesurer(profil, 'manifeste', 'lot'):
+            mettre_a_jour_manifestes(manifestes, exporteur, lus, vues, soumises, reussites)
+
+    return reussites, echecs, time.perf_counter() - debut
+
+def mettre_a_jour_manifestes(manifestes, exporteur, lus, vues, soumises, reussites):
+    """Enregistre les sorties des fiches reconstruites, supprime les sorties orphelines et écrit les manifestes.
+
+    Une fiche en échec garde son entrée précédente : elle sera de nouveau
+    soumise au prochain lot. Seuls les fichiers lus jusqu'au bout (lus) peuvent
+    perdre des entrées : une archive illisible ou tronquée ne supprime rien.
+    """
+    supprimes = 0
+    for source, crees, _ in reussites:
+        if source in soumises:
+            export_dir, cle, fichier, empreinte_source = soumises[source]
+            supprimes += manifestes[export_dir].enregistrer(exporteur, cle, fichier, empreinte_source, crees)
+    for export_dir, manifeste in manifestes.items():
+        supprimes += manifeste.nettoyer(exporteur, lus, vues.get(export_dir, set()))
+        manifeste.ecrire()
+    if supprimes:
+        print(f"✓ {supprimes} export(s) périmé(s) ou orphelin(s) supprimé(s)")
+
+def afficher_resume(reussites, echecs, duree):
+    """Affiche le résumé d'un lot : nombre de fiches, débit et échecs."""
+    total = len(reussites) + len(echecs)
+    debit = total / duree if duree > 0 else 0.0
+    reutilisees = sum(1 for _, _, reutilise in reussites if reutilise)
+    print(f"\n{total} fiche(s) traitée(s) en {duree:.2f} s ({debit:.1f} fichiers/s)")
+    print(f"✓ Réussites : {len(reussites)}")
+    if reutilisees:
+        print(f"  dont {reutilisees} inchangée(s), exports existants réutilisés")
+    if echecs:
+        print(f"✗ Échecs : {len(echecs)}")
+        for json_file, erreur in sorted(echecs):
+            print(f"  - {json_file} : {erreur}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exporte en lot un dossier ou un motif de fiches JSON."
+    )
+    parser.add_argument('chemins', nargs='+',
+                        help="dossiers, motifs (ex. 'fiches/**/*.json') ou archives NDJSON (.ndjson, .jsonl)")
+    parser.add_argument('-e', '--exporteur', choices=sorted(EXPORTEURS), default='modern',
+                        help="exporteur à utiliser (défaut : modern)")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="nombre de processus (défaut : nombre de cœurs)")
+    parser.add_argument('-o', '--sortie', default=None,
+                        help="dossier de sortie commun (défaut : 'exports' à côté de chaque fiche)")
+    parser.add_argument('-r', '--recursif', action='store_true',
+                        help="parcourir les sous-dossiers des dossiers donnés")
+    parser.add_argument('--sans-pdf', action='store_true',
+                        help="ne pas convertir en PDF avec wkhtmltopdf (exporteur webstyle)")
+    parser.add_argument('--wkhtmltopdf', default=None, metavar='CHEMIN',
+                        help="binaire wkhtmltopdf (défaut : variable WKHTMLTOPDF, puis le PATH)")
+    parser.add_argument('--pdf-concurrence', type=int, default=None,
+                        help="conversions PDF simultanées (défaut : nombre de cœurs)")
+    parser.add_argument('--pdf-timeout', type=float, default=TIMEOUT_DEFAUT,
+                        help="délai maximal d'une conversion PDF en secondes (défaut : %(default)s)")
+    parser.add_argument('--pdf-tentatives', type=int, default=TENTATIVES_DEFAUT,
+                        help="essais par conversion PDF (défaut : %(default)s)")
+    parser.add_argument('--cache', default=None, metavar='DOSSIER',
+                        help="cache de fragments : les fiches inchangées ne sont pas regénérées")
+    parser.add_argument('--cache-max-mo', type=int, default=TAILLE_MAX_DEFAUT // (1024 * 1024),
+                        help="taille maximale du cache en Mo (défaut : %(default)s)")
+    parser.add_argument('--concordance', action='store_true',
+                        help="ajouter en annexe les citations triées par page")
+    parser.add_argument('--glossaire', action='store_true',
+                        help="lier chaque terme du lexique et du glossaire à sa définition")
+    parser.add_argument('--theme-json', default=None, metavar='FICHIER',
+                        help="thème personnalisé de l'application (JSON de useCustomThemes ; "
+                             "FICHIER#id pour choisir dans une liste) appliqué aux pages HTML")
+    parser.add_argument('--css-integre', action='store_true',
+                        help="intégrer le CSS du thème à chaque page HTML (pages autonomes) au lieu "
+                             "de lier une feuille de style partagée")
+    parser.add_argument('--incremental', action='store_true',
+                        help="ne reconstruire que les fiches nouvelles ou modifiées depuis le dernier lot "
+                             "(manifeste du dossier de sortie) et supprimer les exports orphelins")
+    parser.add_argument('--profile', nargs='?', const='trace_lot.json', default=None, metavar='FICHIER',
+                        help="écrire une trace Chrome (chrome://tracing, Perfetto) de tous les "
+                             "processus du lot (défaut : trace_lot.json)")
+    args = parser.parse_args()
+
+    fichiers = lister_fiches(args.chemins, args.recursif)
+    if not fichiers:
+        print("Erreur : aucun fichier JSON ou NDJSON trouvé.")
+        sys.exit(1)
+
+    palette = None
+    if args.theme_json:
+        from fiche_themes import charger_palette
+        try:
+            palette = charger_palette(args.theme_json)
+        except (OSError, ValueError) as e:
+            print(f"Erreur lors de la lecture du thème JSON : {e}")
+            sys.exit(1)
+
+    profil = Profil() if args.profile else None
+    print(f"Exportation de {len(fichiers)} fichier(s) de fiches avec l'exporteur '{args.exporteur}'...")
+    reussites, echecs, duree = exporter_lot(
+        fichiers, args.exporteur, args.workers, args.sortie, not args.sans_pdf,
+        args.cache, args.cache_max_mo * 1024 * 1024, args.concordance,
+        {'binaire': args.wkhtmltopdf, 'concurrence': args.pdf_concurrence,
+         'timeout': args.pdf_timeout, 'tentatives': args.pdf_tentatives},
+        profil, args.incremental, not args.css_integre, args.glossaire, palette
+    )
+    afficher_resume(reussites, echecs, duree)
+    if profil is not None:
+        profil.ecrire(args.profile)
+        print(f"✓ Trace de profilage : {args.profile}")
+
+    if echecs:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
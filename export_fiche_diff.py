@@ -0,0 +1,523 @@
+import argparse
+import json
+import os
+import re
+import sys
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+from fiche_cache import empreinte, nom_sortie
+from fiche_manifeste import chemin_temporaire
+from fiche_modele import SECTIONS_ORDER, titre_section
+
+# Version du rendu des différences, dans le nom des exports
+VERSION_DIFF = 1
+
+# Au-delà de ce nombre d'insertions et suppressions entre deux passages, le
+# script d'édition n'est pas cherché : le passage est montré remplacé en bloc
+MODIFICATIONS_MAX = 2000
+
+# Révisions gardées en mémoire pendant un lot (deux paires consécutives en partagent une)
+REVISIONS_EN_MEMOIRE = 8
+
+# Découpages successifs d'un passage modifié : lignes, phrases, puis mots
+_PHRASES = re.compile(r'[^.!?…]*[.!?…]*\s*')
+_MOTS = re.compile(r'\w+|\s+|[^\w\s]')
+DECOUPAGES = (
+    lambda texte: texte.splitlines(keepends=True),
+    lambda texte: [phrase for phrase in _PHRASES.findall(texte) if phrase],
+    _MOTS.findall,
+)
+
+# Balise et classe HTML de chaque opération ('=' : texte commun)
+BALISES = {'+': ('ins', 'diff-ajout'), '-': ('del', 'diff-retrait')}
+
+CSS_DIFF = """
+    ins.diff-ajout { background: #e6ffec; color: #116329; text-decoration: none; border-bottom: 1px solid #4ac26b; }
+    del.diff-retrait { background: #ffebe9; color: #82071e; }
+    .diff-etat { font-style: italic; opacity: 0.75; }
+    .diff-resume li { margin: 2px 0; }
+"""
+
+# Libellé de l'état d'une section
+ETATS = {
+    'ajoutee': 'Section ajoutée',
+    'supprimee': 'Section supprimée',
+    'modifiee': 'Section modifiée',
+    'inchangee': 'Section inchangée',
+}
+
+# Différence d'une section : etat parmi ETATS, segments (op, texte) avec op
+# '=', '+' ou '-' (vides pour une section inchangée)
+Difference = namedtuple('Difference', 'cle etat segments')
+
+# Révision d'une fiche : nom affiché, fiche JSON et empreinte de chaque section
+Revision = namedtuple('Revision', 'nom data empreintes')
+
+def _myers(a, b, d_max):
+    """Retourne un script d'édition minimal de a vers b, suite d'opérations '=', '-' et '+'.
+
+    Algorithme glouton de Myers en O((N+M)·D) : à chaque nombre d de
+    modifications, l'avancée la plus lointaine sur chaque diagonale k = x - y
+    est gardée (une tranche par d) pour remonter ensuite le chemin. Retourne
+    None si le script demande plus de d_max modifications.
+    """
+    n, m = len(a), len(b)
+    decalage = d_max + 1
+    v = [0] * (2 * d_max + 3)
+    traces = []
+    for d in range(min(d_max, n + m) + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[decalage + k - 1] < v[decalage + k + 1]):
+                x = v[decalage + k + 1]
+            else:
+                x = v[decalage + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[decalage + k] = x
+            if x >= n and y >= m:
+                traces.append(v[decalage - d:decalage + d + 1])
+                return _remonter(traces, n, m)
+        traces.append(v[decalage - d:decalage + d + 1])
+    return None
+
+def _remonter(traces, x, y):
+    """Reconstitue le script d'édition depuis les avancées gardées par _myers."""
+    ops = []
+    for d in range(len(traces) - 1, 0, -1):
+        precedente = traces[d - 1]
+        k = x - y
+        # La tranche n°d-1 couvre les diagonales -(d-1) à d-1
+        if k == -d or (k != d and precedente[k - 1 + d - 1] < precedente[k + 1 + d - 1]):
+            k_precedent = k + 1
+        else:
+            k_precedent = k - 1
+        x_precedent = precedente[k_precedent + d - 1]
+        y_precedent = x_precedent - k_precedent
+        milieu = x_precedent if k_precedent == k + 1 else x_precedent + 1
+        ops.extend('=' * (x - milieu))
+        ops.append('+' if k_precedent == k + 1 else '-')
+        x, y = x_precedent, y_precedent
+    ops.extend('=' * x)
+    ops.reverse()
+    return ops
+
+def _passages(unites_a, unites_b):
+    """Produit les passages de deux suites d'unités : ('=', texte) ou ('~', texte_a, texte_b).
+
+    Le préfixe et le suffixe communs sont écartés avant l'algorithme de Myers,
+    qui compare les unités par numéro. Les passages communs et modifiés
+    alternent ; None si les suites diffèrent de plus de MODIFICATIONS_MAX unités.
+    """
+    n, m = len(unites_a), len(unites_b)
+    debut = 0
+    while debut < n and debut < m and unites_a[debut] == unites_b[debut]:
+        debut += 1
+    fin = 0
+    while fin < n - debut and fin < m - debut and unites_a[n - 1 - fin] == unites_b[m - 1 - fin]:
+        fin += 1
+
+    numeros = {}
+    a = [numeros.setdefault(unite, len(numeros)) for unite in unites_a[debut:n - fin]]
+    b = [numeros.setdefault(unite, len(numeros)) for unite in unites_b[debut:m - fin]]
+    ops = _myers(a, b, MODIFICATIONS_MAX)
+    if ops is None:
+        return None
+
+    passages = []
+    if debut:
+        passages.append(('=', ''.join(unites_a[:debut])))
+    i = j = debut
+    commun, retires, ajoutes = [], [], []
+    for op in ops:
+        if op == '=':
+            if retires or ajoutes:
+                passages.append(('~', ''.join(retires), ''.join(ajoutes)))
+                retires, ajoutes = [], []
+            commun.append(unites_a[i])
+            i += 1
+            j += 1
+            continue
+        if commun:
+            passages.append(('=', ''.join(commun)))
+            commun = []
+        if op == '-':
+            retires.append(unites_a[i])
+            i += 1
+        else:
+            ajoutes.append(unites_b[j])
+            j += 1
+    if commun:
+        passages.append(('=', ''.join(commun)))
+    if retires or ajoutes:
+        passages.append(('~', ''.join(retires), ''.join(ajoutes)))
+    if fin:
+        passages.append(('=', ''.join(unites_a[n - fin:])))
+    return passages
+
+def _differences(texte_a, texte_b, niveau, segments):
+    """Ajoute aux segments les différences de deux textes, du découpage n°niveau aux mots.
+
+    Seuls les passages modifiés à un niveau sont découpés au niveau suivant :
+    une ligne modifiée dans un texte de plusieurs Mo ne coûte que le découpage
+    en mots de cette ligne. Au niveau des mots, un espace seul entre deux
+    modifications leur est rattaché, ce qui les regroupe à la lecture.
+    """
+    passages = _passages(DECOUPAGES[niveau](texte_a), DECOUPAGES[niveau](texte_b))
+    if passages is None:
+        segments.append(('-', texte_a))
+        segments.append(('+', texte_b))
+        return
+
+    dernier = len(passages) - 1
+    retire, ajoute = [], []
+    for rang, passage in enumerate(passages):
+        if passage[0] == '=':
+            if niveau == len(DECOUPAGES) - 1 and 0 < rang < dernier and passage[1].isspace():
+                retire.append(passage[1])
+                ajoute.append(passage[1])
+                continue
+            segments.append(('-', ''.join(retire)))
+            segments.append(('+', ''.join(ajoute)))
+            retire, ajoute = [], []
+            segments.append(passage)
+        elif niveau < len(DECOUPAGES) - 1 and passage[1] and passage[2]:
+            _differences(passage[1], passage[2], niveau + 1, segments)
+        else:
+            retire.append(passage[1])
+            ajoute.append(passage[2])
+    segments.append(('-', ''.join(retire)))
+    segments.append(('+', ''.join(ajoute)))
+
+def differences_texte(texte_a, texte_b):
+    """Retourne les segments (op, texte) qui mènent de texte_a à texte_b, au mot près.
+
+    op vaut '=' (commun), '-' (supprimé) ou '+' (inséré) ; les segments vides
+    sont omis et deux segments voisins de même nature fusionnés. Concaténer
+    les segments '=' et '-' redonne texte_a, les segments '=' et '+' texte_b.
+    """
+    if texte_a == texte_b:
+        return [('=', texte_a)] if texte_a else []
+    brut = []
+    _differences(texte_a, texte_b, 0, brut)
+    segments = []
+    for op, texte in brut:
+        if not texte:
+            continue
+        if segments and segments[-1][0] == op:
+            segments[-1] = (op, segments[-1][1] + texte)
+        else:
+            segments.append((op, texte))
+    return segments
+
+def texte_section(cle, valeur):
+    """Retourne le texte comparé d'une section : une ligne par citation, images réduites à leur empreinte."""
+    if valeur is None:
+        return ''
+    if cle == 'citations':
+        from fiche_citations import Citations
+        return ''.join(
+            f"{texte} (p. {page})\n" if page else f"{texte}\n"
+            for texte, page in Citations(valeur).entrees
+        )
+    if isinstance(valeur, str):
+        if 'data:image/' not in valeur:
+            return valeur
+        from fiche_images import decouper
+        return ''.join(
+            f"[image {morceau[1][:12]}]" if isinstance(morceau, tuple) else morceau
+            for morceau in decouper(valeur)
+        )
+    return json.dumps(valeur, ensure_ascii=False, indent=2)
+
+def empreintes_sections(data):
+    """Retourne l'empreinte de chaque section d'une fiche."""
+    return {cle: empreinte(valeur) for cle, valeur in data.items()}
+
+def comparer(ancienne, nouvelle):
+    """Compare deux révisions (Revision) section par section ; retourne la liste des Difference.
+
+    Les sections sont d'abord comparées par empreinte : seules celles dont
+    l'empreinte diffère sont découpées et comparées au mot près. L'ordre est
+    celui de SECTIONS_ORDER, puis celui des autres clés.
+    """
+    cles = [cle for cle in SECTIONS_ORDER if cle in ancienne.data or cle in nouvelle.data]
+    cles += [cle for cle in {**ancienne.data, **nouvelle.data} if cle not in SECTIONS_ORDER]
+    resultat = []
+    for cle in cles:
+        avant, apres = ancienne.empreintes.get(cle), nouvelle.empreintes.get(cle)
+        if avant == apres:
+            resultat.append(Difference(cle, 'inchangee', ()))
+            continue
+        texte_a = texte_section(cle, ancienne.data.get(cle))
+        texte_b = texte_section(cle, nouvelle.data.get(cle))
+        if avant is None:
+            etat = 'ajoutee'
+        elif apres is None:
+            etat = 'supprimee'
+        else:
+            etat = 'modifiee'
+        resultat.append(Difference(cle, etat, differences_texte(texte_a, texte_b)))
+    return resultat
+
+def _decompte(segments):
+    """Retourne le nombre de caractères insérés et supprimés."""
+    ajoutes = sum(len(texte) for op, texte in segments if op == '+')
+    retires = sum(len(texte) for op, texte in segments if op == '-')
+    return ajoutes, retires
+
+def _iter_segments(segments):
+    """Produit le HTML des segments : texte commun, <ins> et <del>, par tranches bornées."""
+    from fiche_rendu import _iter_texte
+
+    for op, texte in segments:
+        balise = BALISES.get(op)
+        if balise is not None:
+            yield f'<{balise[0]} class="{balise[1]}">'
+        yield from _iter_texte(texte, True)
+        if balise is not None:
+            yield f'</{balise[0]}>'
+
+def iter_html_diff(ancienne, nouvelle, differences, theme, tout=False):
+    """Génère la page HTML des différences entre deux révisions, dans les fragments d'un thème.
+
+    Une première section résume les modifications ; suivent les sections
+    modifiées, insertions en <ins> et suppressions en <del>. Avec tout=True,
+    les sections inchangées sont reproduites aussi. Les sections que le thème
+    n'affiche pas (titre, auteur) reçoivent un début de section à leur nom.
+    """
+    from fiche_rendu import _rendre, echapper, minifier_css
+
+    donnees = nouvelle.data if nouvelle.data else ancienne.data
+    titre = donnees.get('titre') or 'Sans titre'
+    auteur = donnees.get('auteur') or 'Auteur inconnu'
+    date_str = datetime.now().strftime(theme.format_date)
+    styles = f"<style>\n{minifier_css(CSS_DIFF)}\n</style>"
+    yield _rendre(theme.en_tete, titre=titre, auteur=auteur, date_str=date_str, polices=styles)
+
+    modifiees = [difference for difference in differences if difference.etat != 'inchangee']
+    lignes = []
+    for difference in modifiees:
+        ajoutes, retires = _decompte(difference.segments)
+        lignes.append(
+            f'<li><a href="#diff-{echapper(difference.cle)}">{echapper(titre_section(difference.cle))}</a> : '
+            f'{ETATS[difference.etat].lower()}, +{ajoutes} / −{retires} caractères</li>'
+        )
+    resume = (
+        f'{echapper(ancienne.nom)} → {echapper(nouvelle.nom)} : {len(modifiees)} section(s) modifiée(s), '
+        f'{len(differences) - len(modifiees)} inchangée(s).'
+    )
+    yield _rendre(theme.debut_section('Modifications'))
+    yield from theme.paragraphe.iter(texte=(resume,))
+    if lignes:
+        yield f'<ul class="diff-resume">{"".join(lignes)}</ul>'
+    yield theme.section_fin
+
+    for difference in differences:
+        if difference.etat == 'inchangee' and not tout:
+            continue
+        debut = theme.sections.get(difference.cle)
+        if debut is None:
+            debut = theme.debut_section(echapper(titre_section(difference.cle)))
+        yield f'<div id="diff-{echapper(difference.cle)}">'
+        yield _rendre(debut)
+        if difference.etat != 'modifiee':
+            yield from theme.paragraphe.iter(texte=(f'<span class="diff-etat">{ETATS[difference.etat]}</span>',))
+        if difference.etat == 'inchangee':
+            texte = texte_section(difference.cle, nouvelle.data.get(difference.cle))
+            segments = [('=', texte)] if texte else ()
+        else:
+            segments = difference.segments
+        if segments:
+            yield from theme.paragraphe.iter(texte=_iter_segments(segments))
+        yield theme.section_fin
+        yield '</div>'
+
+    yield _rendre(theme.pied, date_str=date_str)
+
+class Revisions:
+    """Chargement des révisions d'un lot, chacune une seule fois.
+
+    Une révision est une fiche JSON (chemin) ou un état d'un historique
+    d'annulation : « historique.json@index », historique compressé par
+    fiche_historique ou dump brut {history, currentIndex}. Chaque historique
+    est chargé une fois ; les REVISIONS_EN_MEMOIRE dernières révisions sont
+    gardées avec l'empreinte de leurs sections, si bien que dans un lot de
+    paires consécutives (r1→r2, r2→r3...) chaque révision n'est lue et
+    hachée qu'une fois.
+    """
+
+    def __init__(self):
+        self._historiques = {}
+        self._revisions = OrderedDict()
+
+    def _historique(self, chemin):
+        from fiche_historique import Historique
+
+        historique = self._historiques.get(chemin)
+        if historique is None:
+            with open(chemin, 'r', encoding='utf-8') as f:
+                contenu = json.load(f)
+            if isinstance(contenu, dict) and 'history' in contenu:
+                historique = Historique.depuis_dump(contenu)
+            else:
+                historique = Historique.charger(chemin)
+            self._historiques[chemin] = historique
+        return historique
+
+    def charger(self, reference):
+        """Retourne la révision (Revision) désignée par une référence."""
+        revision = self._revisions.get(reference)
+        if revision is not None:
+            self._revisions.move_to_end(reference)
+            return revision
+
+        chemin, arobase, index = reference.rpartition('@')
+        if arobase and chemin and index.lstrip('-').isdigit():
+            data = self._historique(chemin).fiche(int(index))
+            nom = f"{os.path.basename(chemin)}@{index}"
+        else:
+            with open(reference, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError(f"{reference} : fiche JSON (objet) attendue")
+            nom = os.path.basename(reference)
+        revision = self._revisions[reference] = Revision(nom, data, empreintes_sections(data))
+        if len(self._revisions) > REVISIONS_EN_MEMOIRE:
+            self._revisions.popitem(last=False)
+        return revision
+
+def chemin_diff(ancienne, nouvelle, dossier, theme, tout=False):
+    """Retourne le chemin de la page de différences, dérivé des empreintes des deux révisions."""
+    contenu = {'ancienne': ancienne.empreintes, 'nouvelle': nouvelle.empreintes, 'tout': tout}
+    nom = nom_sortie(f"fiche_diff_{theme.nom}", contenu, f"{VERSION_DIFF}:{theme.empreinte}")
+    return os.path.join(dossier, f"{nom}.html")
+
+def exporter_diff(ancienne, nouvelle, dossier, theme, tout=False):
+    """Écrit la page HTML des différences entre deux révisions ; retourne (chemin, réutilisé).
+
+    Une paire déjà exportée à l'identique n'est pas recalculée.
+    """
+    chemin = chemin_diff(ancienne, nouvelle, dossier, theme, tout)
+    if os.path.exists(chemin):
+        return chemin, True
+    os.makedirs(dossier, exist_ok=True)
+    differences = comparer(ancienne, nouvelle)
+    with open(chemin_temporaire(chemin), 'w', encoding='utf-8') as f:
+        f.writelines(iter_html_diff(ancienne, nouvelle, differences, theme, tout))
+    os.replace(chemin_temporaire(chemin), chemin)
+    return chemin, False
+
+def exporter_diffs(paires, dossier, theme='modern', pdf=False, tout=False, palette=None):
+    """Exporte les différences d'un lot de paires (référence ancienne, référence nouvelle).
+
+    Produit, pour chaque paire, (paire, chemins écrits ou exception). Les
+    révisions sont chargées une fois pour tout le lot (Revisions) ; avec
+    pdf=True, les pages sont converties ensemble par le pool de wkhtmltopdf
+    (fiche_wkhtmltopdf), une fois toutes écrites. Avec une palette
+    (fiche_themes), le thème HTML en prend les couleurs.
+    """
+    from export_fiche import theme_html
+
+    module_theme = theme_html(theme, palette)
+    revisions = Revisions()
+    resultats = []
+    for paire in paires:
+        try:
+            chemin, _ = exporter_diff(revisions.charger(paire[0]), revisions.charger(paire[1]),
+                                      dossier, module_theme, tout)
+            resultats.append((paire, [chemin]))
+        except (OSError, ValueError, IndexError) as e:
+            resultats.append((paire, e))
+
+    if pdf:
+        from fiche_wkhtmltopdf import convertir_lot, trouver_binaire
+
+        a_convertir = [
+            (chemins[0], os.path.splitext(chemins[0])[0] + '.pdf')
+            for _, chemins in resultats
+            if not isinstance(chemins, Exception) and not os.path.exists(os.path.splitext(chemins[0])[0] + '.pdf')
+        ]
+        if trouver_binaire() is None:
+            print("⚠ wkhtmltopdf introuvable : les PDF ne sont pas générés.")
+        elif a_convertir:
+            erreurs = {html: resultat for (html, _), resultat in zip(a_convertir, convertir_lot(a_convertir))
+                       if isinstance(resultat, Exception)}
+            for _, chemins in resultats:
+                if not isinstance(chemins, Exception) and chemins[0] not in erreurs:
+                    chemins.append(os.path.splitext(chemins[0])[0] + '.pdf')
+            for html, erreur in erreurs.items():
+                print(f"Erreur lors de la conversion en PDF de {os.path.basename(html)} : {erreur}")
+        else:
+            for _, chemins in resultats:
+                if not isinstance(chemins, Exception):
+                    chemins.append(os.path.splitext(chemins[0])[0] + '.pdf')
+    return resultats
+
+def lire_paires(chemin):
+    """Lit un fichier de paires : une par ligne, « ancienne<TAB>nouvelle » (ou séparées par des espaces)."""
+    paires = []
+    with open(chemin, 'r', encoding='utf-8') as f:
+        for numero, ligne in enumerate(f, 1):
+            ligne = ligne.strip()
+            if not ligne or ligne.startswith('#'):
+                continue
+            parties = ligne.split('\t') if '\t' in ligne else ligne.split()
+            if len(parties) != 2:
+                raise ValueError(f"{chemin}:{numero} : deux révisions attendues")
+            paires.append((parties[0].strip(), parties[1].strip()))
+    return paires
+
+def main():
+    from export_fiche import THEMES_HTML
+
+    parser = argparse.ArgumentParser(description="Export des différences entre révisions de fiches de lecture")
+    parser.add_argument('revisions', nargs='*',
+                        help="révisions comparées deux à deux dans l'ordre (r1→r2, r2→r3...) : "
+                             "fiche JSON ou historique.json@index")
+    parser.add_argument('--paires', default=None, metavar='FICHIER',
+                        help="fichier de paires « ancienne<TAB>nouvelle », une par ligne")
+    parser.add_argument('-t', '--theme', choices=sorted(THEMES_HTML), default='modern',
+                        help="thème HTML (défaut : modern)")
+    parser.add_argument('--theme-json', default=None, metavar='FICHIER',
+                        help="thème personnalisé de l'application (JSON de useCustomThemes ; "
+                             "FICHIER#id pour choisir dans une liste) appliqué au thème HTML")
+    parser.add_argument('-o', '--sortie', default='exports', help="dossier des exports (défaut : exports)")
+    parser.add_argument('--pdf', action='store_true', help="convertit aussi chaque page en PDF (wkhtmltopdf)")
+    parser.add_argument('--tout', action='store_true', help="reproduit aussi les sections inchangées")
+    args = parser.parse_args()
+
+    try:
+        paires = list(zip(args.revisions, args.revisions[1:]))
+        if args.paires:
+            paires += lire_paires(args.paires)
+    except (OSError, ValueError) as e:
+        print(f"Erreur : {e}")
+        sys.exit(1)
+    if not paires:
+        parser.error("au moins deux révisions, ou --paires, sont nécessaires")
+
+    palette = None
+    if args.theme_json:
+        from fiche_themes import charger_palette
+        try:
+            palette = charger_palette(args.theme_json)
+        except (OSError, ValueError) as e:
+            print(f"Erreur lors de la lecture du thème JSON : {e}")
+            sys.exit(1)
+
+    echecs = 0
+    resultats = exporter_diffs(paires, args.sortie, args.theme, args.pdf, args.tout, palette)
+    for (ancienne, nouvelle), chemins in resultats:
+        if isinstance(chemins, Exception):
+            echecs += 1
+            print(f"Erreur : {ancienne} → {nouvelle} : {chemins}")
+        else:
+            print(f"✓ {ancienne} → {nouvelle} : {', '.join(chemins)}")
+    if echecs:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 import json
 import os
 import sys
-from datetime import datetime
-import webbrowser
+from fiche_assets import symbole
+from fiche_cache import nom_sortie, ouvrir_cache
+from fiche_manifeste import abandonner_temporaire, chemin_temporaire
+from fiche_rendu import Theme, iter_html, rendre_html
 
 def get_icon(section_name):
     """Retourne une icône Font Awesome pour chaque section."""
@@ -37,27 +39,18 @@ def get_icon(section_name):
         'convergence': 'random',
         'glossaire': 'spell-check',
         'notes': 'sticky-note',
-        'schemas': 'project-diagram'
+        'schemas': 'project-diagram',
+        'concordance': 'list-ul'
     }
     return icons.get(section_name, 'file-alt')
 
-def generate_html(data):
-    """Génère le contenu HTML avec un style moderne."""
-    titre = data.get('titre', 'Sans titre')
-    auteur = data.get('auteur', 'Auteur inconnu')
-    date_str = datetime.now().strftime('%d %B %Y')
-    
-    # En-tête HTML avec CSS intégré
-    html = f"""<!DOCTYPE html>
-<html lang="fr">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Fiche de Lecture - {titre}</title>
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css">
-    <link href="https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;500;600;700&display=swap" rel="stylesheet">
-    <style>
-        :root {{
+def icone_locale(section_name):
+    """Retourne le symbole Unicode de l'icône d'une section, affiché sans police d'icônes."""
+    return symbole(get_icon(section_name))
+
+# Style CSS du thème, intégré à l'en-tête
+CSS_STYLE = """<style>
+        :root {
             --primary: #4a6fa5;
             --secondary: #6c757d;
             --light: #f8f9fa;
@@ -66,65 +59,65 @@ def generate_html(data):
             --info: #17a2b8;
             --warning: #ffc107;
             --danger: #dc3545;
-        }}
+        }
         
-        * {{
+        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
-        }}
+        }
         
-        body {{
-            font-family: 'Poppins', sans-serif;
+        body {
+            font-family: 'Poppins', system-ui, -apple-system, 'Segoe UI', Roboto, Arial, sans-serif;
             line-height: 1.7;
             color: #333;
             background-color: #f5f7fb;
             margin: 0;
             padding: 0;
-        }}
+        }
         
-        .container {{
+        .container {
             max-width: 1200px;
             margin: 0 auto;
             padding: 0 20px;
-        }}
+        }
         
         /* En-tête */
-        .header {{
+        .header {
             background: linear-gradient(135deg, var(--primary), #6a11cb);
             color: white;
             padding: 2rem 0;
             margin-bottom: 2rem;
             box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }}
+        }
         
-        .header-content {{
+        .header-content {
             display: flex;
             justify-content: space-between;
             align-items: center;
             flex-wrap: wrap;
-        }}
+        }
         
-        .header-text h1 {{
+        .header-text h1 {
             font-size: 2.2rem;
             margin-bottom: 0.5rem;
             font-weight: 700;
-        }}
+        }
         
-        .header-text p {{
+        .header-text p {
             font-size: 1.1rem;
             opacity: 0.9;
-        }}
+        }
         
-        .meta {{
+        .meta {
             background: rgba(255, 255, 255, 0.1);
             padding: 0.8rem 1.2rem;
             border-radius: 30px;
             font-size: 0.9rem;
-        }}
+        }
         
         /* Cartes de section */
-        .section {{
+        .section {
             background: white;
             border-radius: 10px;
             padding: 1.8rem;
@@ -132,22 +125,22 @@ def generate_html(data):
             box-shadow: 0 2px 15px rgba(0, 0, 0, 0.05);
             border-left: 4px solid var(--primary);
             transition: transform 0.3s ease, box-shadow 0.3s ease;
-        }}
+        }
         
-        .section:hover {{
+        .section:hover {
             transform: translateY(-3px);
             box-shadow: 0 5px 20px rgba(0, 0, 0, 0.1);
-        }}
+        }
         
-        .section-header {{
+        .section-header {
             display: flex;
             align-items: center;
             margin-bottom: 1.2rem;
             padding-bottom: 0.8rem;
             border-bottom: 1px dashed #e1e4e8;
-        }}
+        }
         
-        .section-icon {{
+        .section-icon {
             width: 40px;
             height: 40px;
             background: var(--primary);
@@ -159,26 +152,26 @@ def generate_html(data):
             color: white;
             font-size: 1rem;
             flex-shrink: 0;
-        }}
+        }
         
-        .section-title {{
+        .section-title {
             font-size: 1.3rem;
             color: var(--dark);
             margin: 0;
             font-weight: 600;
-        }}
+        }
         
         /* Citations */
-        .citation {{
+        .citation {
             background: #f8f9ff;
             border-left: 4px solid var(--info);
             padding: 1.2rem;
             margin: 1rem 0;
             border-radius: 0 8px 8px 0;
             position: relative;
-        }}
+        }
         
-        .citation:before {{
+        .citation:before {
             content: '\201C';
             font-family: Georgia, serif;
             font-size: 4rem;
@@ -187,16 +180,16 @@ def generate_html(data):
             left: 10px;
             top: -10px;
             line-height: 1;
-        }}
+        }
         
-        .citation-text {{
+        .citation-text {
             font-style: italic;
             margin-bottom: 0.5rem;
             position: relative;
             z-index: 1;
-        }}
+        }
         
-        .citation-page {{
+        .citation-page {
             display: inline-block;
             background: var(--info);
             color: white;
@@ -205,71 +198,81 @@ def generate_html(data):
             font-size: 0.8rem;
             font-weight: 500;
             margin-top: 0.5rem;
-        }}
+        }
         
         /* Champs vides */
-        .empty-field {{
+        .empty-field {
             color: #6c757d;
             font-style: italic;
             opacity: 0.7;
-        }}
+        }
         
         /* Pied de page */
-        .footer {{
+        .footer {
             text-align: center;
             padding: 2rem 0;
             margin-top: 3rem;
             color: #6c757d;
             font-size: 0.9rem;
             border-top: 1px solid #e1e4e8;
-        }}
+        }
         
         /* Réactivité */
-        @media (max-width: 768px) {{
-            .header-content {{
+        @media (max-width: 768px) {
+            .header-content {
                 flex-direction: column;
                 text-align: center;
-            }}
+            }
             
-            .meta {{
+            .meta {
                 margin-top: 1rem;
-            }}
+            }
             
-            .section-header {{
+            .section-header {
                 flex-direction: column;
                 align-items: flex-start;
-            }}
+            }
             
-            .section-icon {{
+            .section-icon {
                 margin-bottom: 0.8rem;
-            }}
-        }}
+            }
+        }
         
         /* Styles d'impression */
-        @media print {{
-            body {{
+        @media print {
+            body {
                 background: white;
                 font-size: 12pt;
                 line-height: 1.5;
-            }}
+            }
             
-            .header {{
+            .header {
                 background: #4a6fa5 !important;
                 -webkit-print-color-adjust: exact;
                 print-color-adjust: exact;
-            }}
+            }
             
-            .section {{
+            .section {
                 break-inside: avoid;
                 page-break-inside: avoid;
                 border: 1px solid #e1e4e8;
-            }}
+            }
             
-            .footer {{
+            .footer {
                 display: none;
-            }}
-        }}
-    </style>
+            }
+        }
+    </style>"""
+
+# En-tête HTML avec CSS intégré ; polices et icônes sont locales : aucune requête réseau
+EN_TETE = """<!DOCTYPE html>
+<html lang="fr">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Fiche de Lecture - {titre}</title>
+    {polices}
+    {css}
 </head>
 <body>
     <header class="header">
@@ -280,8 +283,8 @@ def generate_html(data):
                     <p>{titre}</p>
                 </div>
                 <div class="meta">
-                    <i class="fas fa-user-edit"></i> {auteur} • 
-                    <i class="far fa-calendar-alt"></i> {date_str}
+                    <span class="icon" aria-hidden="true">✍</span> {auteur} • 
+                    <span class="icon" aria-hidden="true">📅</span> {date_str}
                 </div>
             </div>
         </div>
@@ -289,69 +292,48 @@ def generate_html(data):
 
     <main class="container">"""
 
-    # Sections ordonnées
-    sections_order = [
-        'titre', 'auteur', 'resume', 'plan', 'temporalites',
-        'pointsVue', 'personnages', 'registres', 'rythme', 'figures',
-        'procedes', 'lexique', 'citations', 'axes', 'tensions',
-        'lectures', 'intuitions', 'images', 'fonction', 'references',
-        'biographie', 'place', 'courants', 'contexte', 'reception',
-        'oeuvres', 'thematiques', 'convergence', 'glossaire', 'notes', 'schemas'
-    ]
-    
-    # Génération du contenu des sections
-    for section in sections_order:
-        if section in data:
-            value = data[section]
-            icon = get_icon(section)
-            
-            # Sauter l'affichage des sections titre et auteur déjà dans l'en-tête
-            if section in ['titre', 'auteur']:
-                continue
-                
-            html += f"""
+# Rôle de chaque couleur du thème dans une palette personnalisée (fiche_themes)
+COULEURS_PALETTE = {
+    '#4a6fa5': 'primary',
+    '#6a11cb': 'secondary',
+    '#17a2b8': 'accent',
+    '#f5f7fb': 'background',
+    '#f8f9ff': 'background',
+    '#333': 'text',
+    '#343a40': 'text',
+    '#6c757d': 'textLight',
+    '#e1e4e8': 'border',
+}
+
+THEME = Theme(
+    nom='modern',
+    en_tete=EN_TETE,
+    css=CSS_STYLE,
+    section_debut="""
             <section class="section">
                 <div class="section-header">
                     <div class="section-icon">
-                        <i class="fas fa-{icon}"></i>
+                        <span class="icon" aria-hidden="true">{icone}</span>
                     </div>
-                    <h2 class="section-title">{section.capitalize().replace('_', ' ')}</h2>
+                    <h2 class="section-title">{titre_section}</h2>
                 </div>
-                <div class="section-content">"""
-            
-            if section == 'citations':
-                if value and any(cit.get('text') for cit in value):
-                    for citation in value:
-                        if citation.get('text'):
-                            html += f"""
-                    <div class="citation">
-                        <p class="citation-text">{citation['text']}</p>
-                        {f'<span class="citation-page">Page {citation["page"]}</span>' if citation.get('page') else ''}
-                    </div>"""
-                else:
-                    html += """
-                    <p class="empty-field">Aucune citation renseignée</p>"""
-            
-            elif isinstance(value, str):
-                if value.strip():
-                    # Échapper les caractères HTML et remplacer les retours à la ligne par des <br>
-                    escaped = value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                    html += f"""
-                    <p>{escaped.replace(chr(10), '<br>')}</p>"""
-                else:
-                    html += """
-                    <p class="empty-field">Non renseigné</p>"""
-            
-            elif value is not None:
-                html += f"""
-                    <p>{str(value)}</p>"""
-            
-            html += """
+                <div class="section-content">""",
+    section_fin="""
                 </div>
-            </section>"""
-    
-    # Pied de page
-    html += """
+            </section>""",
+    paragraphe="""
+                    <p>{texte}</p>""",
+    vide="""
+                    <p class="empty-field">Non renseigné</p>""",
+    citation="""
+                    <div class="citation">
+                        <p class="citation-text">{texte}</p>
+                        {page}
+                    </div>""",
+    citation_page='<span class="citation-page">Page {page}</span>',
+    citations_vides="""
+                    <p class="empty-field">Aucune citation renseignée</p>""",
+    pied="""
     </main>
 
     <footer class="footer">
@@ -360,18 +342,30 @@ def generate_html(data):
         </div>
     </footer>
 </body>
-</html>""".format(
-        titre=titre,
-        auteur=auteur,
-        date_str=date_str
-    )
-    
-    return html
+</html>""",
+    format_date='%d %B %Y',
+    # Les sections titre et auteur sont déjà affichées dans l'en-tête
+    sections_ignorees=('titre', 'auteur'),
+    icone=icone_locale,
+    police='Poppins',
+    couleurs=COULEURS_PALETTE
+)
+
+def generate_html(data, cache=None, images=None, profil=None, css_externe=False):
+    """Génère le contenu HTML avec un style moderne."""
+    return rendre_html(data, THEME, cache, images, profil, css_externe)
+
+def generate_html_stream(data, cache=None, images=None, profil=None, css_externe=False):
+    """Génère le HTML moderne morceau par morceau, pour l'écrire au fil de l'eau."""
+    return iter_html(data, THEME, cache, images, profil, css_externe)
 
 def save_file(content, filepath):
-    """Enregistre le contenu dans un fichier."""
+    """Enregistre le contenu (chaîne ou morceaux successifs) dans un fichier."""
     with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(content)
+        if isinstance(content, str):
+            f.write(content)
+        else:
+            f.writelines(content)
 
 def main():
     # Vérifier les arguments
@@ -398,15 +392,27 @@ def main():
     export_dir = os.path.join(os.path.dirname(os.path.abspath(json_file)), 'exports')
     os.makedirs(export_dir, exist_ok=True)
     
-    # Générer un nom de base pour les fichiers de sortie
-    base_name = f"fiche_lecture_modern_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    # Nom de base dérivé du contenu : une fiche inchangée garde le même nom
+    base_name = nom_sortie('fiche_lecture_modern', data, THEME.empreinte)
     
-    # Générer et sauvegarder le HTML
-    html_content = generate_html(data)
+    # Générer le HTML en flux, sauf si cette fiche a déjà été exportée à l'identique
     html_path = os.path.join(export_dir, f"{base_name}.html")
-    save_file(html_content, html_path)
+    if os.path.exists(html_path):
+        print("✓ Fiche inchangée : export existant réutilisé.")
+    else:
+        # Les sections inchangées sont reprises du cache ; écriture dans un fichier
+        # temporaire pour ne jamais laisser d'export partiel sous le nom final
+        from fiche_images import MagasinImages
+        cache = ouvrir_cache(os.path.join(export_dir, '.cache'))
+        images = MagasinImages(os.path.join(export_dir, 'images'))
+        try:
+            save_file(generate_html_stream(data, cache, images), chemin_temporaire(html_path))
+            os.replace(chemin_temporaire(html_path), html_path)
+        finally:
+            abandonner_temporaire(html_path)
     
-    # Ouvrir le fichier HTML généré dans le navigateur
+    # Ouvrir le fichier HTML généré dans le navigateur (module chargé seulement ici)
+    import webbrowser
     webbrowser.open('file://' + os.path.abspath(html_path))
     
     print(f"✓ Fichier HTML moderne créé : {html_path}")
@@ -0,0 +1,421 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import signal
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from export_fiche_batch import EXPORTEURS, version_exporteur
+from fiche_cache import CacheExport, empreinte_fiche, nom_sortie
+from fiche_wkhtmltopdf import ErreurConversion, PoolConversion
+
+# Formats servis par chaque exporteur
+FORMATS = {
+    'simple': ('pdf', 'docx'),
+    'modern': ('html',),
+    'webstyle': ('html', 'pdf'),
+    'simple_web': ('html',),
+}
+
+TYPES_CONTENU = {
+    'html': 'text/html; charset=utf-8',
+    'pdf': 'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+
+# Taille maximale d'une fiche reçue (octets)
+TAILLE_MAX_REQUETE = 64 * 1024 * 1024
+
+# Taille maximale du cache de réponses en mémoire (octets)
+TAILLE_MAX_REPONSES = 128 * 1024 * 1024
+
+# Origines autorisées par défaut : l'application web servie par Vite (npm run dev).
+# Aucune autre page ne peut lire les exports ni en demander : une fiche reçue
+# pourrait sinon faire lire un fichier local au rendu PDF et en renvoyer le contenu.
+ORIGINES_DEFAUT = ('http://localhost:5173', 'http://127.0.0.1:5173')
+
+class ErreurRequete(Exception):
+    """Erreur renvoyée au client avec un statut HTTP."""
+
+    def __init__(self, statut, message):
+        super().__init__(message)
+        self.statut = statut
+
+class CacheReponses:
+    """Cache LRU en mémoire des exports déjà produits, borné en octets."""
+
+    def __init__(self, taille_max=TAILLE_MAX_REPONSES):
+        self.taille_max = taille_max
+        self.taille = 0
+        self.entrees = OrderedDict()
+
+    def lire(self, cle):
+        contenu = self.entrees.get(cle)
+        if contenu is not None:
+            self.entrees.move_to_end(cle)
+        return contenu
+
+    def ecrire(self, cle, contenu):
+        if len(contenu) > self.taille_max:
+            return
+        ancien = self.entrees.pop(cle, None)
+        if ancien is not None:
+            self.taille -= len(ancien)
+        self.entrees[cle] = contenu
+        self.taille += len(contenu)
+        while self.taille > self.taille_max:
+            _, supprime = self.entrees.popitem(last=False)
+            self.taille -= len(supprime)
+
+def prechauffer():
+    """Importe tous les exporteurs et leurs bibliothèques une fois pour toutes (processus de travail)."""
+    for module in EXPORTEURS.values():
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            print(f"⚠ Exporteur {module} indisponible : {e}")
+
+def rendre_binaire(exporteur, fmt, data):
+    """Produit un export PDF ou DOCX avec le moteur par défaut de l'exporteur et retourne son contenu.
+
+    Exécutée dans un processus de travail ; pour l'exporteur simple, les
+    moteurs par défaut sont fiche_pdf_flux et fiche_docx_flux.
+    """
+    module = importlib.import_module(EXPORTEURS[exporteur])
+    with tempfile.TemporaryDirectory() as dossier:
+        chemin = os.path.join(dossier, f"fiche.{fmt}")
+        ok = module.creer_pdf(data, chemin) if fmt == 'pdf' else module.creer_docx(data, chemin)
+        if not ok:
+            raise RuntimeError(f"échec de la création du fichier {fmt.upper()}")
+        with open(chemin, 'rb') as f:
+            return f.read()
+
+def analyser_fiche(corps, exporteur, module):
+    """Décode une fiche reçue ; retourne (fiche, empreinte, nom de sortie) (fil de rendu)."""
+    try:
+        data = json.loads(corps)
+    except ValueError as e:
+        raise ErreurRequete(HTTPStatus.BAD_REQUEST, f"JSON invalide : {e}")
+    if not isinstance(data, dict):
+        raise ErreurRequete(HTTPStatus.BAD_REQUEST, "la fiche doit être un objet JSON")
+    version = version_exporteur(module)
+    return data, empreinte_fiche(data, version), nom_sortie(f"fiche_lecture_{exporteur}", data, version)
+
+class ServeurExport:
+    """Service HTTP d'export des fiches, à processus chauds et caches de rendu.
+
+    La boucle d'événements ne fait que lire et écrire sur les connexions :
+    décodage des fiches, empreintes et rendu HTML se font dans des fils de
+    rendu, les PDF et DOCX dans des processus de travail. Chaque fil de rendu
+    ouvre sa propre connexion au cache de fragments (une connexion SQLite ne
+    se partage pas entre fils).
+
+    Seules les pages des origines autorisées (ORIGINES_DEFAUT par défaut)
+    reçoivent les en-têtes CORS et peuvent envoyer une fiche ; un POST venu
+    d'une autre origine est refusé (403). Les clients sans en-tête Origin
+    (curl, scripts) restent acceptés.
+    """
+
+    def __init__(self, workers=None, cache_dir=None, options_pdf=None, origines=ORIGINES_DEFAUT):
+        self.workers = workers or os.cpu_count()
+        self.origines = frozenset(origine.rstrip('/') for origine in origines)
+        # Le HTML reçu n'est pas de confiance : wkhtmltopdf n'a jamais accès aux fichiers locaux
+        self.options_pdf = {**(options_pdf or {}), 'fichiers_locaux': False}
+        self.pool_pdf = None
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=prechauffer)
+        self.fils = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='rendu')
+        self.cache_dir = cache_dir
+        self._locaux = threading.local()
+        self.reponses = CacheReponses()
+        self.modules = {nom: importlib.import_module(EXPORTEURS[nom]) for nom in ('modern', 'webstyle', 'simple_web')}
+
+    def _cache(self):
+        """Cache de fragments du fil de rendu courant, ouvert à sa première utilisation."""
+        if self.cache_dir is None:
+            return None
+        cache = getattr(self._locaux, 'cache', None)
+        if cache is None:
+            cache = self._locaux.cache = CacheExport(self.cache_dir)
+        return cache
+
+    def _ecrire_html(self, module, data, chemin):
+        module.save_html(module.generate_html_stream(data, self._cache()), chemin)
+
+    async def flux_html(self, module, data):
+        """Rend le HTML d'une fiche dans un fil de rendu ; produit ses morceaux encodés au fil de l'eau.
+
+        Les morceaux passent du fil à la boucle par une file ; quand le client
+        s'en va, le fil s'arrête au morceau suivant.
+        """
+        boucle = asyncio.get_running_loop()
+        file = asyncio.Queue()
+        arret = threading.Event()
+
+        def produire():
+            try:
+                for morceau in module.generate_html_stream(data, self._cache()):
+                    if arret.is_set():
+                        return
+                    donnees = morceau.encode('utf-8')
+                    if donnees:
+                        boucle.call_soon_threadsafe(file.put_nowait, donnees)
+                boucle.call_soon_threadsafe(file.put_nowait, None)
+            except Exception as e:
+                boucle.call_soon_threadsafe(file.put_nowait, e)
+
+        boucle.run_in_executor(self.fils, produire)
+        try:
+            while True:
+                element = await file.get()
+                if element is None:
+                    return
+                if isinstance(element, Exception):
+                    raise element
+                yield element
+        finally:
+            arret.set()
+
+    async def lire_requete(self, reader):
+        """Lit une requête HTTP/1.1 et retourne (méthode, chemin, en-têtes, corps), ou None en fin de connexion."""
+        ligne = await reader.readline()
+        if not ligne:
+            return None
+        try:
+            methode, cible, _ = ligne.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise ErreurRequete(HTTPStatus.BAD_REQUEST, "ligne de requête invalide")
+
+        entetes = {}
+        while True:
+            ligne = await reader.readline()
+            if ligne in (b'\r\n', b'\n', b''):
+                break
+            nom, _, valeur = ligne.decode('latin-1').partition(':')
+            entetes[nom.strip().lower()] = valeur.strip()
+
+        try:
+            longueur = int(entetes.get('content-length', 0) or 0)
+        except ValueError:
+            longueur = -1
+        if longueur < 0:
+            raise ErreurRequete(HTTPStatus.BAD_REQUEST, "en-tête Content-Length invalide")
+        if longueur > TAILLE_MAX_REQUETE:
+            raise ErreurRequete(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "fiche trop volumineuse")
+        corps = await reader.readexactly(longueur) if longueur else b''
+        return methode.upper(), urlsplit(cible).path, entetes, corps
+
+    async def envoyer(self, writer, statut, corps=b'', type_contenu='application/json; charset=utf-8', entetes=()):
+        """Envoie une réponse complète."""
+        writer.write(self._entetes(statut, type_contenu, entetes, f"Content-Length: {len(corps)}"))
+        writer.write(corps)
+        await writer.drain()
+
+    async def envoyer_flux(self, writer, morceaux, type_contenu, entetes=()):
+        """Envoie une réponse en transfert par morceaux (chunked) et retourne le corps envoyé.
+
+        morceaux est un itérable asynchrone d'octets. Les en-têtes ne partent
+        qu'avec le premier morceau : une erreur avant lui devient une réponse
+        d'erreur ordinaire. Une erreur après lui interrompt la connexion
+        (ConnectionAbortedError) : le client voit une réponse tronquée, jamais
+        une seconde réponse mêlée au flux.
+        """
+        try:
+            premier = await anext(morceaux, b'')
+            writer.write(self._entetes(HTTPStatus.OK, type_contenu, entetes, "Transfer-Encoding: chunked"))
+            envoye = []
+            donnees = premier
+            try:
+                while donnees:
+                    envoye.append(donnees)
+                    writer.write(b'%x\r\n%s\r\n' % (len(donnees), donnees))
+                    await writer.drain()
+                    donnees = await anext(morceaux, b'')
+            except (ConnectionError, asyncio.CancelledError):
+                raise
+            except Exception as e:
+                print(f"Erreur pendant l'envoi de la réponse, connexion interrompue : {e}")
+                writer.transport.abort()
+                raise ConnectionAbortedError(str(e)) from e
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+            return b''.join(envoye)
+        finally:
+            await morceaux.aclose()
+
+    def _entetes(self, statut, type_contenu, entetes, longueur):
+        lignes = [
+            f"HTTP/1.1 {statut.value} {statut.phrase}",
+            f"Content-Type: {type_contenu}",
+            longueur,
+            *entetes,
+        ]
+        return ('\r\n'.join(lignes) + '\r\n\r\n').encode('latin-1')
+
+    def entetes_cors(self, origine):
+        """En-têtes CORS d'une réponse : seulement pour une origine autorisée, jamais « * »."""
+        if origine is None or origine not in self.origines:
+            return ()
+        return (
+            f"Access-Control-Allow-Origin: {origine}",
+            "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+            "Access-Control-Allow-Headers: Content-Type",
+            "Vary: Origin",
+        )
+
+    async def convertir_pdf(self, module, data):
+        """Produit le PDF webstyle : HTML rendu ici, conversion sur le pool wkhtmltopdf partagé."""
+        try:
+            if self.pool_pdf is None:
+                self.pool_pdf = PoolConversion(**self.options_pdf)
+        except ErreurConversion as e:
+            raise ErreurRequete(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+        with tempfile.TemporaryDirectory() as dossier:
+            html_path = os.path.join(dossier, 'fiche.html')
+            pdf_path = os.path.join(dossier, 'fiche.pdf')
+            await asyncio.get_running_loop().run_in_executor(
+                self.fils, self._ecrire_html, module, data, html_path
+            )
+            try:
+                await self.pool_pdf.convertir(html_path, pdf_path)
+            except ErreurConversion as e:
+                raise ErreurRequete(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+            with open(pdf_path, 'rb') as f:
+                return f.read()
+
+    async def erreur(self, writer, statut, message, entetes=()):
+        corps = json.dumps({'erreur': message}, ensure_ascii=False).encode('utf-8')
+        await self.envoyer(writer, statut, corps, entetes=entetes)
+
+    async def traiter(self, writer, methode, chemin, corps, origine=None):
+        """Route une requête : GET /sante ou POST /export/<exporteur>/<format>."""
+        cors = self.entetes_cors(origine)
+        if origine is not None and not cors and methode in ('OPTIONS', 'POST'):
+            raise ErreurRequete(HTTPStatus.FORBIDDEN, f"origine non autorisée : {origine}")
+        if methode == 'OPTIONS':
+            await self.envoyer(writer, HTTPStatus.NO_CONTENT, entetes=cors)
+            return
+        if chemin == '/sante' and methode == 'GET':
+            corps = json.dumps({'exporteurs': FORMATS}).encode('utf-8')
+            await self.envoyer(writer, HTTPStatus.OK, corps, entetes=cors)
+            return
+
+        parties = chemin.strip('/').split('/')
+        if len(parties) != 3 or parties[0] != 'export':
+            raise ErreurRequete(HTTPStatus.NOT_FOUND, f"route inconnue : {chemin}")
+        if methode != 'POST':
+            raise ErreurRequete(HTTPStatus.METHOD_NOT_ALLOWED, "utilisez POST")
+        _, exporteur, fmt = parties
+        if fmt not in FORMATS.get(exporteur, ()):
+            raise ErreurRequete(HTTPStatus.NOT_FOUND, f"export {exporteur}/{fmt} non disponible")
+
+        module = self.modules.get(exporteur)
+        if module is None:
+            try:
+                module = self.modules[exporteur] = importlib.import_module(EXPORTEURS[exporteur])
+            except ImportError as e:
+                raise ErreurRequete(HTTPStatus.SERVICE_UNAVAILABLE, f"exporteur {exporteur} indisponible : {e}")
+        boucle = asyncio.get_running_loop()
+        data, empreinte, nom = await boucle.run_in_executor(self.fils, analyser_fiche, corps, exporteur, module)
+        cle = (exporteur, fmt, empreinte)
+        entetes = (f'Content-Disposition: attachment; filename="{nom}.{fmt}"', *cors)
+
+        contenu = self.reponses.lire(cle)
+        if contenu is not None:
+            await self.envoyer(writer, HTTPStatus.OK, contenu, TYPES_CONTENU[fmt], entetes)
+            return
+
+        if fmt == 'html':
+            contenu = await self.envoyer_flux(writer, self.flux_html(module, data), TYPES_CONTENU[fmt], entetes)
+        elif exporteur == 'webstyle':
+            contenu = await self.convertir_pdf(module, data)
+            await self.envoyer(writer, HTTPStatus.OK, contenu, TYPES_CONTENU[fmt], entetes)
+        else:
+            try:
+                contenu = await boucle.run_in_executor(self.executor, rendre_binaire, exporteur, fmt, data)
+            except Exception as e:
+                raise ErreurRequete(HTTPStatus.INTERNAL_SERVER_ERROR, f"{e.__class__.__name__} : {e}")
+            await self.envoyer(writer, HTTPStatus.OK, contenu, TYPES_CONTENU[fmt], entetes)
+        self.reponses.ecrire(cle, contenu)
+
+    async def connexion(self, reader, writer):
+        """Traite les requêtes successives d'une connexion (keep-alive)."""
+        try:
+            while True:
+                entetes = {}
+                try:
+                    requete = await self.lire_requete(reader)
+                    if requete is None:
+                        break
+                    methode, chemin, entetes, corps = requete
+                    await self.traiter(writer, methode, chemin, corps, entetes.get('origin'))
+                except ErreurRequete as e:
+                    await self.erreur(writer, e.statut, str(e), self.entetes_cors(entetes.get('origin')))
+                    if e.statut in (HTTPStatus.BAD_REQUEST, HTTPStatus.REQUEST_ENTITY_TOO_LARGE):
+                        break
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    raise
+                except Exception as e:
+                    print(f"Erreur lors du traitement de la requête : {e}")
+                    await self.erreur(writer, HTTPStatus.INTERNAL_SERVER_ERROR, f"{e.__class__.__name__} : {e}",
+                                      self.entetes_cors(entetes.get('origin')))
+                    break
+                if entetes.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def servir(self, hote, port):
+        boucle = asyncio.get_running_loop()
+        # Démarrer les processus de travail (imports chauds) avant d'ouvrir le port,
+        # pour qu'ils n'héritent pas de la socket d'écoute
+        await asyncio.gather(*(boucle.run_in_executor(self.executor, int) for _ in range(self.workers)))
+
+        serveur = await asyncio.start_server(self.connexion, hote, port, limit=TAILLE_MAX_REQUETE)
+        tache = asyncio.current_task()
+        boucle.add_signal_handler(signal.SIGTERM, tache.cancel)
+        print(f"✓ Serveur d'export prêt sur http://{hote}:{port}")
+        async with serveur:
+            try:
+                await serveur.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur HTTP local d'export des fiches de lecture.")
+    parser.add_argument('--hote', default='127.0.0.1', help="adresse d'écoute (défaut : 127.0.0.1)")
+    parser.add_argument('-p', '--port', type=int, default=8765, help="port d'écoute (défaut : 8765)")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="processus pour les exports PDF/DOCX (défaut : nombre de cœurs)")
+    parser.add_argument('--cache', default=None, metavar='DOSSIER',
+                        help="cache persistant de fragments HTML")
+    parser.add_argument('--wkhtmltopdf', default=None, metavar='CHEMIN',
+                        help="binaire wkhtmltopdf (défaut : variable WKHTMLTOPDF, puis le PATH)")
+    parser.add_argument('--pdf-concurrence', type=int, default=None,
+                        help="conversions PDF simultanées (défaut : nombre de cœurs)")
+    parser.add_argument('--origine', action='append', default=None, metavar='URL',
+                        help="origine autorisée à utiliser le serveur, répétable "
+                             f"(défaut : {', '.join(ORIGINES_DEFAUT)})")
+    args = parser.parse_args()
+
+    serveur = ServeurExport(args.workers, args.cache,
+                            {'binaire': args.wkhtmltopdf, 'concurrence': args.pdf_concurrence},
+                            args.origine or ORIGINES_DEFAUT)
+    try:
+        asyncio.run(serveur.servir(args.hote, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        serveur.executor.shutdown(cancel_futures=True)
+        serveur.fils.shutdown(cancel_futures=True)
+        print("Serveur arrêté.")
+
+if __name__ == "__main__":
+    main()
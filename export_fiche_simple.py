@@ -1,14 +1,132 @@
 import json
 import os
-from fpdf import FPDF
-from docx import Document
-from docx.shared import Pt
-from datetime import datetime
 import sys
+from fiche_cache import nom_sortie
+from fiche_manifeste import abandonner_temporaire, chemin_temporaire
+from fiche_modele import NON_RENSEIGNE, AUCUNE_CITATION, IMAGE_NON_PRISE_EN_CHARGE, Citation, Image, Paragraphe, document
+from fiche_profil import mesurer
 
-def creer_pdf(data, output_path):
-    """Crée un fichier PDF à partir des données."""
+# Version de la mise en page PDF/DOCX, à incrémenter quand elle change
+# (elle entre dans le nom des fichiers de sortie)
+EXPORT_VERSION = 5
+
+# Moteurs PDF : 'flux' (fiche_pdf_flux, pages écrites au fil de l'eau) ou 'fpdf'
+MOTEURS_PDF = ('flux', 'fpdf')
+
+# Police TrueType du moteur PDF 'flux', cherchée dans les ressources locales
+# (<assets>/polices/DejaVuSans-Regular.ttf et -Bold.ttf) ; à défaut, Helvetica
+POLICE_PDF = 'DejaVuSans'
+
+# Moteurs DOCX : 'flux' (fiche_docx_flux, sans dépendance) ou 'python-docx'
+MOTEURS_DOCX = ('flux', 'python-docx')
+
+# Texte des blocs vides dans les exports PDF/DOCX (voir fiche_modele.Vide)
+TEXTES_VIDES = {
+    'champ': f"[{NON_RENSEIGNE}]",
+    'citation': f"[{AUCUNE_CITATION}]",
+    'citations': f"[{AUCUNE_CITATION}]",
+}
+
+def magasin_voisin(output_path):
+    """Retourne le magasin d'images partagé du dossier de sortie ('images' à côté du fichier)."""
+    from fiche_images import MagasinImages
+    return MagasinImages(os.path.join(os.path.dirname(os.path.abspath(output_path)), 'images'))
+
+def ecrire_fiche_pdf(pdf, doc, images, profil=None, signet=None):
+    """Met en page une fiche dans un PDF ouvert (fiche_pdf_flux.EcrivainPDF), à partir d'une nouvelle page.
+
+    Partagée par le PDF d'une fiche et par l'anthologie (export_fiche_anthologie).
+    Avec un signet (titre), la fiche reçoit un signet et chacune de ses sections
+    un signet rangé dessous. Retourne la destination du début de la fiche et
+    son numéro de page.
+    """
+    from fiche_pdf_flux import MARGE, PAGE
+
+    pdf.ajouter_page()
+    debut = pdf.destination(), pdf.page
+    if signet is not None:
+        pdf.signet(signet, 0, debut[0])
+
+    # En-tête
+    pdf.choisir_police('B', 16)
+    pdf.cellule(0, 10, 'Fiche de Lecture', 1, 'C')
+    if doc.titre:
+        pdf.choisir_police('B', 14)
+        pdf.cellule(0, 10, doc.titre, 1, 'C')
+    pdf.saut(10)
+
+    # Contenu
+    for section in doc.sections.values():
+        if signet is not None:
+            pdf.signet(section.titre, 1, hauteur=10)
+        pdf.choisir_police('B', 12)
+        pdf.cellule(0, 10, f"{section.titre} :", 1)
+        pdf.choisir_police('', 12)
+
+        with mesurer(profil, section.cle, 'pdf.flux'):
+            for bloc in section.blocs:
+                if isinstance(bloc, Citation):
+                    pdf.multi_cellule(0, 8, f"- {bloc.texte} (p.{bloc.page or '?'})")
+                elif isinstance(bloc, Paragraphe):
+                    pdf.multi_cellule(0, 8, bloc.texte)
+                elif isinstance(bloc, Image):
+                    try:
+                        pdf.image(images.chemin(bloc, 'impression'), PAGE[0] - MARGE - MARGE)
+                    except ValueError:
+                        pdf.multi_cellule(0, 8, IMAGE_NON_PRISE_EN_CHARGE.format(mime=bloc.mime))
+                elif bloc.nature == 'citation':
+                    pdf.multi_cellule(0, 8, f"- {TEXTES_VIDES['citation']}")
+                else:
+                    pdf.multi_cellule(0, 8, TEXTES_VIDES[bloc.nature])
+        pdf.saut(5)
+    return debut
+
+def polices_pdf():
+    """Retourne les polices du moteur PDF 'flux' : POLICE_PDF si elle est installée, Helvetica sinon (None)."""
+    from fiche_assets import polices_locales
+    from fiche_pdf_flux import polices_truetype
+
+    return polices_truetype(polices_locales(POLICE_PDF))
+
+def creer_pdf_flux(doc, output_path, images, profil=None):
+    """Écrit le PDF avec fiche_pdf_flux : chaque page est écrite dès qu'elle est pleine.
+
+    Avec la police POLICE_PDF installée, tout caractère Unicode qu'elle contient
+    est rendu ; sinon les caractères hors WinAnsi deviennent '?'.
+    """
+    from fiche_pdf_flux import EcrivainPDF
+
+    with EcrivainPDF(output_path, doc.titre, polices_pdf()) as pdf:
+        ecrire_fiche_pdf(pdf, doc, images or magasin_voisin(output_path), profil)
+        with mesurer(profil, 'pdf.fermer'):
+            pdf.fermer()
+
+def creer_pdf(data, output_path, images=None, profil=None, moteur='flux'):
+    """Crée un fichier PDF à partir des données (fiche JSON ou document déjà construit).
+
+    Le moteur 'flux' (fiche_pdf_flux) écrit chaque page dès qu'elle est pleine :
+    la mémoire ne dépend que de la page en cours. 'fpdf' garde tout le document
+    en mémoire jusqu'à l'enregistrement, pour une mise en page identique.
+    Les images collées sont insérées depuis leur variante d'impression du magasin
+    (par défaut, le dossier 'images' voisin du fichier de sortie). Avec un profil
+    (fiche_profil.Profil), la mise en page de chaque section et l'écriture du
+    fichier sont chronométrées.
+    """
+    if moteur == 'flux':
+        try:
+            with mesurer(profil, 'modele'):
+                doc = document(data)
+            creer_pdf_flux(doc, output_path, images, profil)
+            return True
+        except Exception as e:
+            print(f"Erreur lors de la création du PDF : {e}")
+            return False
+
+    # Import à la demande : seul le backend du format demandé est chargé
+    from fpdf import FPDF
     try:
+        with mesurer(profil, 'modele'):
+            doc = document(data)
         pdf = FPDF()
         pdf.add_page()
         pdf.set_auto_page_break(auto=True, margin=15)
@@ -18,9 +136,9 @@ def creer_pdf(data, output_path):
         pdf.cell(0, 10, 'Fiche de Lecture', 0, 1, 'C')
         
         # Sous-titre avec le titre de l'œuvre
-        if data.get('titre'):
+        if doc.titre:
             pdf.set_font('Arial', 'B', 14)
-            pdf.cell(0, 10, data['titre'], 0, 1, 'C')
+            pdf.cell(0, 10, doc.titre, 0, 1, 'C')
         
         pdf.ln(10)
         
@@ -28,77 +146,100 @@ def creer_pdf(data, output_path):
         pdf.set_font('Arial', '', 12)
         
         # Contenu
-        for cle, valeur in data.items():
+        for section in doc.sections.values():
             pdf.set_font('Arial', 'B', 12)
-            pdf.cell(0, 10, f"{cle.capitalize()} :", ln=True)
+            pdf.cell(0, 10, f"{section.titre} :", ln=True)
             pdf.set_font('Arial', '', 12)
             
-            if cle == 'citations':
-                if valeur and any(cit.get('text') for cit in valeur):
-                    for citation in valeur:
-                        if citation.get('text'):
-                            pdf.multi_cell(0, 8, f"- {citation['text']} (p.{citation.get('page', '?')})")
-                        else:
-                            pdf.multi_cell(0, 8, "- [Aucune citation renseignée]")
-                else:
-                    pdf.multi_cell(0, 8, "[Aucune citation renseignée]")
-            elif isinstance(valeur, str):
-                if valeur.strip():
-                    pdf.multi_cell(0, 8, valeur)
-                else:
-                    pdf.multi_cell(0, 8, "[Non renseigné]")
-            else:
-                pdf.multi_cell(0, 8, str(valeur) if valeur else "[Non renseigné]")
+            with mesurer(profil, section.cle, 'pdf.multi_cell'):
+                for bloc in section.blocs:
+                    if isinstance(bloc, Citation):
+                        pdf.multi_cell(0, 8, f"- {bloc.texte} (p.{bloc.page or '?'})")
+                    elif isinstance(bloc, Paragraphe):
+                        pdf.multi_cell(0, 8, bloc.texte)
+                    elif isinstance(bloc, Image):
+                        images = images or magasin_voisin(output_path)
+                        pdf.image(images.chemin(bloc, 'impression'), w=pdf.w - pdf.l_margin - pdf.r_margin)
+                    elif bloc.nature == 'citation':
+                        pdf.multi_cell(0, 8, f"- {TEXTES_VIDES['citation']}")
+                    else:
+                        pdf.multi_cell(0, 8, TEXTES_VIDES[bloc.nature])
                 
             pdf.ln(5)
         
         # Enregistrement
-        pdf.output(output_path)
+        with mesurer(profil, 'pdf.output'):
+            pdf.output(output_path)
         return True
     except Exception as e:
         print(f"Erreur lors de la création du PDF : {e}")
         return False
 
-def creer_docx(data, output_path):
-    """Crée un fichier DOCX à partir des données."""
+def creer_docx(data, output_path, images=None, profil=None, moteur='flux'):
+    """Crée un fichier DOCX à partir des données (fiche JSON ou document déjà construit).
+
+    Le moteur 'flux' écrit le WordprocessingML directement dans l'archive
+    (fiche_docx_flux), sans python-docx ; 'python-docx' passe par son modèle
+    objet, bien plus lent sur les grandes fiches, pour une mise en page
+    équivalente. Les images collées sont insérées et le profil renseigné comme
+    pour creer_pdf.
+    """
+    if moteur == 'flux':
+        from fiche_docx_flux import ecrire_docx
+        try:
+            with mesurer(profil, 'modele'):
+                fiche = document(data)
+            ecrire_docx(fiche, output_path, TEXTES_VIDES, images or magasin_voisin(output_path), profil)
+            return True
+        except Exception as e:
+            print(f"Erreur lors de la création du DOCX : {e}")
+            return False
+
+    from docx import Document
     try:
+        with mesurer(profil, 'modele'):
+            fiche = document(data)
         doc = Document()
         
         # Titre
         doc.add_heading('Fiche de Lecture', 0)
         
         # Sous-titre avec le titre de l'œuvre
-        if data.get('titre'):
-            doc.add_heading(data['titre'], level=1)
+        if fiche.titre:
+            doc.add_heading(fiche.titre, level=1)
         
         doc.add_paragraph()
         
         # Contenu
-        for cle, valeur in data.items():
-            doc.add_heading(cle.capitalize(), level=2)
+        for section in fiche.sections.values():
+            doc.add_heading(section.titre, level=2)
             
-            if cle == 'citations':
-                if valeur and any(cit.get('text') for cit in valeur):
-                    for citation in valeur:
+            with mesurer(profil, section.cle, 'docx.add_paragraph'):
+                for bloc in section.blocs:
+                    if isinstance(bloc, Citation):
                         p = doc.add_paragraph()
                         p.add_run('• ').bold = True
-                        if citation.get('text'):
-                            p.add_run(f"{citation['text']} ")
-                            p.add_run(f"(p.{citation.get('page', '?')})").italic = True
-                        else:
-                            p.add_run("[Aucune citation renseignée]")
-                else:
-                    doc.add_paragraph("[Aucune citation renseignée]")
-            elif isinstance(valeur, str):
-                if valeur.strip():
-                    doc.add_paragraph(valeur)
-                else:
-                    doc.add_paragraph("[Non renseigné]")
-            else:
-                doc.add_paragraph(str(valeur) if valeur else "[Non renseigné]")
+                        p.add_run(f"{bloc.texte} ")
+                        p.add_run(f"(p.{bloc.page or '?'})").italic = True
+                    elif isinstance(bloc, Paragraphe):
+                        doc.add_paragraph(bloc.texte)
+                    elif isinstance(bloc, Image):
+                        images = images or magasin_voisin(output_path)
+                        marges = doc.sections[-1]
+                        doc.add_picture(
+                            images.chemin(bloc, 'impression'),
+                            width=marges.page_width - marges.left_margin - marges.right_margin
+                        )
+                    elif bloc.nature == 'citation':
+                        p = doc.add_paragraph()
+                        p.add_run('• ').bold = True
+                        p.add_run(TEXTES_VIDES['citation'])
+                    else:
+                        doc.add_paragraph(TEXTES_VIDES[bloc.nature])
         
         # Enregistrement
-        doc.save(output_path)
+        with mesurer(profil, 'docx.save'):
+            doc.save(output_path)
         return True
     except Exception as e:
         print(f"Erreur lors de la création du DOCX : {e}")
@@ -129,18 +270,32 @@ def main():
     export_dir = os.path.join(os.path.dirname(os.path.abspath(json_file)), 'exports')
     os.makedirs(export_dir, exist_ok=True)
     
-    # Générer un nom de base pour les fichiers de sortie
-    base_name = f"fiche_lecture_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    # Nom de base dérivé du contenu : une fiche inchangée garde le même nom
+    base_name = nom_sortie('fiche_lecture', data, EXPORT_VERSION)
     
-    # Exporter en PDF
+    # Exporter en PDF (sauf si cette fiche a déjà été exportée à l'identique)
     pdf_path = os.path.join(export_dir, f"{base_name}.pdf")
-    if creer_pdf(data, pdf_path):
-        print(f"✓ Fichier PDF créé : {pdf_path}")
+    if os.path.exists(pdf_path):
+        print(f"✓ Fichier PDF inchangé : {pdf_path}")
+    else:
+        try:
+            if creer_pdf(data, chemin_temporaire(pdf_path)):
+                os.replace(chemin_temporaire(pdf_path), pdf_path)
+                print(f"✓ Fichier PDF créé : {pdf_path}")
+        finally:
+            abandonner_temporaire(pdf_path)
     
     # Exporter en DOCX
     docx_path = os.path.join(export_dir, f"{base_name}.docx")
-    if creer_docx(data, docx_path):
-        print(f"✓ Fichier DOCX créé : {docx_path}")
+    if os.path.exists(docx_path):
+        print(f"✓ Fichier DOCX inchangé : {docx_path}")
+    else:
+        try:
+            if creer_docx(data, chemin_temporaire(docx_path)):
+                os.replace(chemin_temporaire(docx_path), docx_path)
+                print(f"✓ Fichier DOCX créé : {docx_path}")
+        finally:
+            abandonner_temporaire(docx_path)
     
     print("\nExportation terminée ! Les fichiers ont été enregistrés dans le dossier 'exports'.")
 
@@ -1,20 +1,14 @@
 import json
 import os
 import sys
-from datetime import datetime
-import webbrowser
+from fiche_cache import nom_sortie, ouvrir_cache
+from fiche_manifeste import abandonner_temporaire, chemin_temporaire
+from fiche_rendu import Theme, iter_html, rendre_html
 
-def generate_html(data):
-    """Génère le contenu HTML avec le style du site web."""
-    # Récupérer le titre ou utiliser une valeur par défaut
-    titre = data.get('titre', 'Sans titre')
-    date_str = datetime.now().strftime('%d/%m/%Y à %H:%M')
-    
-    # Style CSS
-    css_style = """<style>
-        @import url('https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;500;700&display=swap');
+# Style CSS
+CSS_STYLE = """<style>
         body {
-            font-family: 'Roboto', Arial, sans-serif;
+            font-family: 'Roboto', system-ui, -apple-system, 'Segoe UI', Arial, sans-serif;
             line-height: 1.6;
             color: #333;
             max-width: 900px;
@@ -50,81 +44,73 @@ def generate_html(data):
         }
         .empty { color: #999; font-style: italic; }
     </style>"""
-    
-    # Construction du HTML
-    html_parts = [
-        "<!DOCTYPE html>",
-        "<html>",
-        "<head>",
-        "    <meta charset='UTF-8'>",
-        f"    <title>Fiche de Lecture - {titre}</title>",
-        f"    {css_style}",
-        "</head>",
-        "<body>",
-        "    <div class='header'>",
-        "        <h1>📖 Fiche de Lecture</h1>",
-        f"        <h2>{titre}</h2>",
-        f"        <p>Générée le {date_str}</p>",
-        "    </div>"
-    ]
-    
-    # Ajout des sections
-    sections_order = [
-        'titre', 'auteur', 'resume', 'plan', 'temporalites',
-        'pointsVue', 'personnages', 'registres', 'rythme', 'figures',
-        'procedes', 'lexique', 'citations', 'axes', 'tensions',
-        'lectures', 'intuitions', 'images', 'fonction', 'references',
-        'biographie', 'place', 'courants', 'contexte', 'reception',
-        'oeuvres', 'thematiques', 'convergence', 'glossaire', 'notes', 'schemas'
-    ]
-    
-    for section in sections_order:
-        if section in data:
-            value = data[section]
-            html_parts.append(f"    <div class='section'>")
-            html_parts.append(f"        <h2>{section.capitalize().replace('_', ' ')}</h2>")
-            
-            if section == 'citations':
-                if value and any(cit.get('text') for cit in value):
-                    for citation in value:
-                        if citation.get('text'):
-                            page = f"<span style='background: #e74c3c; color: white; padding: 2px 8px; border-radius: 10px; font-size: 12px; margin-left: 10px;'>p. {citation.get('page', '?')}</span>"
-                            html_parts.append(f"        <div style='background: #f8f9fa; border-left: 4px solid #3498db; padding: 10px 15px; margin: 10px 0;'>")
-                            html_parts.append(f"            {citation['text']} {page if citation.get('page') else ''}")
-                            html_parts.append("        </div>")
-                        else:
-                            html_parts.append("        <p class='empty'>Aucune citation renseignée</p>")
-                else:
-                    html_parts.append("        <p class='empty'>Aucune citation renseignée</p>")
-            
-            elif isinstance(value, str):
-                if value.strip():
-                    # Échapper les caractères HTML et remplacer les retours à la ligne par des <br>
-                    escaped = value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                    html_parts.append(f"        <p>{escaped.replace(chr(10), '<br>')}</p>")
-                else:
-                    html_parts.append("        <p class='empty'>Non renseigné</p>")
-            
-            elif value is not None:
-                html_parts.append(f"        <p>{str(value)}</p>")
-            
-            html_parts.append("    </div>")
-    
-    # Pied de page
-    html_parts.extend([
-        "    <div style='text-align: center; margin-top: 40px; color: #7f8c8d; font-size: 12px;'>",
-        "        <p>Fiche générée automatiquement - © 2025</p>",
-        "    </div>",
-        "</body>",
-        "</html>"
-    ])
-    
-    return "\n".join(html_parts)
+
+# Rôle de chaque couleur du thème dans une palette personnalisée (fiche_themes)
+COULEURS_PALETTE = {
+    '#2c3e50': 'primary',
+    '#e74c3c': 'secondary',
+    '#3498db': 'accent',
+    '#f9f9f9': 'background',
+    '#333': 'text',
+    '#7f8c8d': 'textLight',
+    '#eee': 'border',
+}
+
+THEME = Theme(
+    nom='simple_web',
+    en_tete="""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset='UTF-8'>
+    <title>Fiche de Lecture - {titre}</title>
+    {polices}
+    {css}
+</head>
+<body>
+    <div class='header'>
+        <h1>📖 Fiche de Lecture</h1>
+        <h2>{titre}</h2>
+        <p>Générée le {date_str}</p>
+    </div>
+""",
+    css=CSS_STYLE,
+    police='Roboto',
+    section_debut="""    <div class='section'>
+        <h2>{titre_section}</h2>
+""",
+    section_fin="    </div>\n",
+    paragraphe="        <p>{texte}</p>\n",
+    vide="        <p class='empty'>Non renseigné</p>\n",
+    citation="""        <div style='background: #f8f9fa; border-left: 4px solid #3498db; padding: 10px 15px; margin: 10px 0;'>
+            {texte} {page}
+        </div>
+""",
+    citation_page="<span style='background: #e74c3c; color: white; padding: 2px 8px; border-radius: 10px; font-size: 12px; margin-left: 10px;'>p. {page}</span>",
+    citation_vide="        <p class='empty'>Aucune citation renseignée</p>\n",
+    citations_vides="        <p class='empty'>Aucune citation renseignée</p>\n",
+    pied="""    <div style='text-align: center; margin-top: 40px; color: #7f8c8d; font-size: 12px;'>
+        <p>Fiche générée automatiquement - © 2025</p>
+    </div>
+</body>
+</html>""",
+    couleurs=COULEURS_PALETTE
+)
+
+def generate_html(data, cache=None, images=None, profil=None, css_externe=False):
+    """Génère le contenu HTML avec le style du site web."""
+    return rendre_html(data, THEME, cache, images, profil, css_externe)
+
+def generate_html_stream(data, cache=None, images=None, profil=None, css_externe=False):
+    """Génère le HTML simple morceau par morceau, pour l'écrire au fil de l'eau."""
+    return iter_html(data, THEME, cache, images, profil, css_externe)
 
 def save_file(content, filepath):
-    """Enregistre le contenu dans un fichier."""
+    """Enregistre le contenu (chaîne ou morceaux successifs) dans un fichier."""
     with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(content)
+        if isinstance(content, str):
+            f.write(content)
+        else:
+            f.writelines(content)
 
 def main():
     # Vérifier les arguments
@@ -151,15 +137,27 @@ def main():
     export_dir = os.path.join(os.path.dirname(os.path.abspath(json_file)), 'exports')
     os.makedirs(export_dir, exist_ok=True)
     
-    # Générer un nom de base pour les fichiers de sortie
-    base_name = f"fiche_lecture_web_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    # Nom de base dérivé du contenu : une fiche inchangée garde le même nom
+    base_name = nom_sortie('fiche_lecture_web', data, THEME.empreinte)
     
-    # Générer et sauvegarder le HTML
-    html_content = generate_html(data)
+    # Générer le HTML en flux, sauf si cette fiche a déjà été exportée à l'identique
     html_path = os.path.join(export_dir, f"{base_name}.html")
-    save_file(html_content, html_path)
+    if os.path.exists(html_path):
+        print("✓ Fiche inchangée : export existant réutilisé.")
+    else:
+        # Les sections inchangées sont reprises du cache ; écriture dans un fichier
+        # temporaire pour ne jamais laisser d'export partiel sous le nom final
+        from fiche_images import MagasinImages
+        cache = ouvrir_cache(os.path.join(export_dir, '.cache'))
+        images = MagasinImages(os.path.join(export_dir, 'images'))
+        try:
+            save_file(generate_html_stream(data, cache, images), chemin_temporaire(html_path))
+            os.replace(chemin_temporaire(html_path), html_path)
+        finally:
+            abandonner_temporaire(html_path)
     
-    # Ouvrir le fichier HTML généré dans le navigateur
+    # Ouvrir le fichier HTML généré dans le navigateur (module chargé seulement ici)
+    import webbrowser
     webbrowser.open('file://' + os.path.abspath(html_path))
     
     print(f"✓ Fichier HTML créé : {html_path}")
@@ -1,29 +1,19 @@
 import json
 import os
 import sys
-from datetime import datetime
-import webbrowser
+from fiche_cache import nom_sortie, ouvrir_cache
+from fiche_manifeste import abandonner_temporaire, chemin_temporaire
+from fiche_rendu import Theme, iter_html, rendre_html
+from fiche_wkhtmltopdf import VARIABLE_BINAIRE, trouver_binaire
 
-# Vérifier si wkhtmltopdf est disponible
-try:
-    import pdfkit
-    WKHTMLTOPDF_AVAILABLE = True
-except ImportError:
-    WKHTMLTOPDF_AVAILABLE = False
+# Vérifier si wkhtmltopdf est disponible (PATH, variable WKHTMLTOPDF ou emplacement Windows)
+WKHTMLTOPDF_AVAILABLE = trouver_binaire() is not None
 
-def generate_html(data):
-    """Génère le contenu HTML avec le style du site web."""
-    # Récupérer le titre ou utiliser une valeur par défaut
-    titre = data.get('titre', 'Sans titre')
-    date_str = datetime.now().strftime('%d/%m/%Y à %H:%M')
-    
-    # Style CSS pour reproduire la mise en page du site
-    css_style = """
+# Style CSS pour reproduire la mise en page du site
+CSS_STYLE = """
     <style>
-        @import url('https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;500;700&display=swap');
-        
         body {
-            font-family: 'Roboto', Arial, sans-serif;
+            font-family: 'Roboto', system-ui, -apple-system, 'Segoe UI', Arial, sans-serif;
             line-height: 1.6;
             color: #333;
             max-width: 900px;
@@ -102,15 +92,28 @@ def generate_html(data):
         }
     </style>
     """
-    
-    # Construction du HTML
-    html_content = f"""
+
+# Rôle de chaque couleur du thème dans une palette personnalisée (fiche_themes)
+COULEURS_PALETTE = {
+    '#2c3e50': 'primary',
+    '#e74c3c': 'secondary',
+    '#3498db': 'accent',
+    '#f9f9f9': 'background',
+    '#333': 'text',
+    '#7f8c8d': 'textLight',
+    '#eee': 'border',
+}
+
+THEME = Theme(
+    nom='webstyle',
+    en_tete="""
     <!DOCTYPE html>
     <html>
     <head>
         <meta charset="UTF-8">
         <title>Fiche de Lecture - {titre}</title>
-        {css_style}
+        {polices}
+        {css}
     </head>
     <body>
         <div class="header">
@@ -118,82 +121,51 @@ def generate_html(data):
             <h2>{titre}</h2>
             <p>Générée le {date_str}</p>
         </div>
-    """.format(css_style=css_style, titre=titre, date_str=date_str)
-    
-    # Ajout des sections
-    sections_order = [
-        'titre', 'auteur', 'resume', 'plan', 'temporalites',
-        'pointsVue', 'personnages', 'registres', 'rythme', 'figures',
-        'procedes', 'lexique', 'citations', 'axes', 'tensions',
-        'lectures', 'intuitions', 'images', 'fonction', 'references',
-        'biographie', 'place', 'courants', 'contexte', 'reception',
-        'oeuvres', 'thematiques', 'convergence', 'glossaire', 'notes', 'schemas'
-    ]
-    
-    for section in sections_order:
-        if section in data:
-            value = data[section]
-            html_content += f'<div class="section">\n'
-            # Titre de la section
-            html_content += f'<h2>{section.capitalize().replace("_", " ")}</h2>\n'
-            # Contenu de la section
-            if section == 'citations':
-                if value and any(cit.get('text') for cit in value):
-                    for citation in value:
-                        if citation.get('text'):
-                            html_content += f'<div class="citation">'
-                            html_content += f'{citation["text"]}'
-                            if citation.get('page'):
-                                html_content += f'<span class="page">p. {citation["page"]}</span>'
-                            html_content += '</div>\n'
-                        elif not any(cit.get('text') for cit in value):
-                            html_content += '<p class="empty-field">Aucune citation renseignée</p>\n'
-            elif isinstance(value, str):
-                if value.strip():
-                    # Remplace les retours à la ligne par des balises <br> pour le HTML
-                    html_content += f'<p>{value.replace("\n", "<br>")}</p>\n'
-                else:
-                    html_content += '<p class="empty-field">Non renseigné</p>\n'
-            elif value is not None:
-                html_content += f'<p>{str(value)}</p>\n'
-            html_content += '</div>\n'
-    # Pied de page
-    html_content += """
+    """,
+    css=CSS_STYLE,
+    police='Roboto',
+    section_debut='<div class="section">\n<h2>{titre_section}</h2>\n',
+    section_fin='</div>\n',
+    paragraphe='<p>{texte}</p>\n',
+    vide='<p class="empty-field">Non renseigné</p>\n',
+    citation='<div class="citation">{texte}{page}</div>\n',
+    citation_page='<span class="page">p. {page}</span>',
+    citations_vides='<p class="empty-field">Aucune citation renseignée</p>\n',
+    pied="""
         <div class="footer">
             <p>Fiche générée automatiquement - © 2025</p>
         </div>
     </body>
     </html>
-    """
-    
-    return html_content
+    """,
+    # Le style web conserve le texte tel quel (pas d'échappement HTML)
+    echapper_texte=False,
+    couleurs=COULEURS_PALETTE
+)
+
+def generate_html(data, cache=None, images=None, profil=None, css_externe=False):
+    """Génère le contenu HTML avec le style du site web."""
+    return rendre_html(data, THEME, cache, images, profil, css_externe)
+
+def generate_html_stream(data, cache=None, images=None, profil=None, css_externe=False):
+    """Génère le HTML style web morceau par morceau, pour l'écrire au fil de l'eau."""
+    return iter_html(data, THEME, cache, images, profil, css_externe)
 
 def save_html(html_content, output_path):
-    """Enregistre le contenu HTML dans un fichier."""
+    """Enregistre le contenu HTML (chaîne ou morceaux successifs) dans un fichier."""
     with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+        if isinstance(html_content, str):
+            f.write(html_content)
+        else:
+            f.writelines(html_content)
 
-def convert_to_pdf(html_path, pdf_path):
-    """Convertit le fichier HTML en PDF en utilisant wkhtmltopdf."""
+def convert_to_pdf(html_path, pdf_path, **options):
+    """Convertit le fichier HTML en PDF en utilisant wkhtmltopdf (voir fiche_wkhtmltopdf)."""
+    from fiche_wkhtmltopdf import ErreurConversion, convertir
     try:
-        # Configuration de pdfkit
-        config = pdfkit.configuration(wkhtmltopdf='C:\\Program Files\\wkhtmltopdf\\bin\\wkhtmltopdf.exe')
-        
-        # Options pour le PDF
-        options = {
-            'page-size': 'A4',
-            'margin-top': '15mm',
-            'margin-right': '15mm',
-            'margin-bottom': '15mm',
-            'margin-left': '15mm',
-            'encoding': 'UTF-8',
-            'no-outline': None
-        }
-        
-        # Conversion en PDF
-        pdfkit.from_file(html_path, pdf_path, configuration=config, options=options)
+        convertir(html_path, pdf_path, **options)
         return True
-    except Exception as e:
+    except ErreurConversion as e:
         print(f"Erreur lors de la conversion en PDF : {e}")
         return False
 
@@ -222,26 +194,42 @@ def main():
     export_dir = os.path.join(os.path.dirname(os.path.abspath(json_file)), 'exports')
     os.makedirs(export_dir, exist_ok=True)
     
-    # Générer un nom de base pour les fichiers de sortie
-    base_name = f"fiche_lecture_web_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    # Nom de base dérivé du contenu : une fiche inchangée garde le même nom
+    base_name = nom_sortie('fiche_lecture_web', data, THEME.empreinte)
     
-    # Générer le HTML
-    html_content = generate_html(data)
+    # Générer le HTML en flux, sauf si cette fiche a déjà été exportée à l'identique
     html_path = os.path.join(export_dir, f"{base_name}.html")
-    save_html(html_content, html_path)
+    if os.path.exists(html_path):
+        print("✓ Fiche inchangée : export existant réutilisé.")
+    else:
+        # Les sections inchangées sont reprises du cache ; écriture dans un fichier
+        # temporaire pour ne jamais laisser d'export partiel sous le nom final
+        from fiche_images import MagasinImages
+        cache = ouvrir_cache(os.path.join(export_dir, '.cache'))
+        images = MagasinImages(os.path.join(export_dir, 'images'))
+        try:
+            save_html(generate_html_stream(data, cache, images), chemin_temporaire(html_path))
+            os.replace(chemin_temporaire(html_path), html_path)
+        finally:
+            abandonner_temporaire(html_path)
     
     # Si wkhtmltopdf est disponible, générer le PDF
     pdf_path = os.path.join(export_dir, f"{base_name}.pdf")
     
-    if WKHTMLTOPDF_AVAILABLE:
-        if convert_to_pdf(html_path, pdf_path):
+    if os.path.exists(pdf_path):
+        print(f"✓ Fichier PDF inchangé : {pdf_path}")
+    elif WKHTMLTOPDF_AVAILABLE:
+        # Le HTML lie les images du magasin voisin
+        if convert_to_pdf(html_path, pdf_path, fichiers_locaux=True):
             print(f"✓ Fichier PDF créé : {pdf_path}")
         else:
-            print("⚠ Impossible de générer le PDF. Vérifiez que wkhtmltopdf est installé et dans le PATH.")
+            print("⚠ Impossible de générer le PDF.")
     else:
-        print("⚠ Le module pdfkit n'est pas installé. Installation recommandée pour l'export PDF.")
+        print("⚠ wkhtmltopdf est introuvable. Installez-le et ajoutez-le au PATH, "
+              f"ou indiquez son chemin dans la variable {VARIABLE_BINAIRE}, pour l'export PDF.")
     
-    # Ouvrir le fichier HTML généré dans le navigateur par défaut
+    # Ouvrir le fichier HTML généré dans le navigateur par défaut (module chargé seulement ici)
+    import webbrowser
     webbrowser.open('file://' + os.path.abspath(html_path))
     
     print(f"✓ Fichier HTML créé : {html_path}")
@@ -0,0 +1,147 @@
+import functools
+import importlib.util
+import io
+import os
+
+from fiche_modele import Citation, Paragraphe
+
+# Dossier des ressources locales (polices) : variable FICHE_ASSETS ou 'assets' à côté des scripts
+DOSSIER_ASSETS = os.environ.get('FICHE_ASSETS') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'assets'
+)
+
+# fontTools n'est importé qu'au découpage des polices ; sans lui, les polices sont intégrées entières
+FONTTOOLS_AVAILABLE = importlib.util.find_spec('fontTools') is not None
+
+# Graisses CSS et suffixes des fichiers de police statiques (ex. Poppins-SemiBold.ttf)
+GRAISSES = {300: 'Light', 400: 'Regular', 500: 'Medium', 600: 'SemiBold', 700: 'Bold'}
+
+# Caractères toujours conservés : ceux des modèles et titres de section, en plus du texte de la fiche
+CARACTERES_COMMUNS = frozenset(
+    [chr(c) for c in range(0x20, 0x7f)] + [chr(c) for c in range(0xa0, 0x100)] + list("’‘“”«»…–—•œŒ€")
+)
+
+# Symboles Unicode remplaçant les icônes Font Awesome : aucun téléchargement à l'ouverture
+SYMBOLES = {
+    'address-card': '📇',
+    'bolt': '⚡',
+    'book': '📕',
+    'book-medical': '📚',
+    'book-open': '📖',
+    'book-reader': '🔤',
+    'calendar-alt': '📅',
+    'clock': '🕒',
+    'cogs': '⚙',
+    'comments': '💬',
+    'file-alt': '📄',
+    'history': '🏛',
+    'image': '🖼',
+    'lightbulb': '💡',
+    'link': '🔗',
+    'list-ol': '🔢',
+    'list-ul': '☰',
+    'magic': '✨',
+    'map-marker-alt': '📍',
+    'project-diagram': '🗺',
+    'quote-right': '❝',
+    'random': '🔀',
+    'shapes': '🔷',
+    'spell-check': '🔡',
+    'stream': '🌊',
+    'sticky-note': '🗒',
+    'tachometer-alt': '⏱',
+    'tags': '🏷',
+    'theater-masks': '🎭',
+    'user-edit': '✍',
+    'user-friends': '🤝',
+    'users': '👥',
+}
+
+def symbole(icone):
+    """Retourne le symbole Unicode d'une icône Font Awesome (nom sans préfixe 'fa-')."""
+    return SYMBOLES.get(icone, SYMBOLES['file-alt'])
+
+@functools.lru_cache(maxsize=None)
+def polices_locales(famille, dossier=None):
+    """Retourne les fichiers de police locaux d'une famille : ((graisse, chemin), ...).
+
+    Cherche <famille>-<Suffixe>.ttf (ou .otf) dans <dossier>/polices pour chaque
+    graisse de GRAISSES. Retourne un tuple vide si aucun fichier n'est présent.
+    """
+    dossier = os.path.join(dossier or DOSSIER_ASSETS, 'polices')
+    fichiers = []
+    for graisse, suffixe in GRAISSES.items():
+        for extension in ('.ttf', '.otf'):
+            chemin = os.path.join(dossier, f"{famille}-{suffixe}{extension}")
+            if os.path.isfile(chemin):
+                fichiers.append((graisse, chemin))
+                break
+    return tuple(fichiers)
+
+def signature_polices(fichiers):
+    """Identifie des fichiers de police (nom et taille) pour l'empreinte d'un thème."""
+    return [(graisse, os.path.basename(chemin), os.path.getsize(chemin)) for graisse, chemin in fichiers]
+
+def caracteres_document(doc):
+    """Retourne l'ensemble des caractères affichés par un document, hors CARACTERES_COMMUNS.
+
+    Les textes ASCII, de loin les plus fréquents, sont écartés sans être parcourus
+    (str.isascii() ne lit pas la chaîne).
+    """
+    caracteres = set()
+    textes = [doc.titre, doc.auteur]
+    for section in doc.sections.values():
+        for bloc in section.blocs:
+            if isinstance(bloc, Paragraphe):
+                textes.append(bloc.texte)
+            elif isinstance(bloc, Citation):
+                textes.append(bloc.texte)
+                textes.append(bloc.page)
+    for texte in textes:
+        if isinstance(texte, str) and not texte.isascii():
+            caracteres.update(texte)
+    return frozenset(caracteres - CARACTERES_COMMUNS)
+
+@functools.lru_cache(maxsize=64)
+def police_reduite(chemin, caracteres):
+    """Retourne le contenu (TrueType ou OpenType) d'une police réduite aux glyphes des caractères donnés.
+
+    Sans fontTools, la police est retournée entière.
+    """
+    if not FONTTOOLS_AVAILABLE:
+        with open(chemin, 'rb') as f:
+            return f.read()
+
+    import logging
+    from fontTools import subset
+
+    # Tables non découpables (FFTM...) : simplement retirées, inutile de le signaler
+    logging.getLogger('fontTools.subset').setLevel(logging.ERROR)
+    options = subset.Options()
+    options.layout_features = ['kern', 'liga']
+    options.name_IDs = []
+    options.notdef_outline = True
+    police = subset.load_font(chemin, options)
+    sous_ensemble = subset.Subsetter(options)
+    sous_ensemble.populate(unicodes=[ord(c) for c in CARACTERES_COMMUNS | caracteres])
+    sous_ensemble.subset(police)
+    tampon = io.BytesIO()
+    police.save(tampon)
+    return tampon.getvalue()
+
+# Type MIME et format CSS d'un fichier de police, selon son extension
+FORMATS_POLICES = {'.ttf': ('font/ttf', 'truetype'), '.otf': ('font/otf', 'opentype')}
+
+def faces_polices(famille, fichiers, caracteres=frozenset()):
+    """Retourne les règles @font-face d'une famille, polices intégrées en data: URL."""
+    import base64
+
+    regles = []
+    for graisse, chemin in fichiers:
+        mime, format_css = FORMATS_POLICES[os.path.splitext(chemin)[1].lower()]
+        donnees = base64.b64encode(police_reduite(chemin, caracteres)).decode('ascii')
+        regles.append(
+            f"@font-face {{ font-family: '{famille}'; font-style: normal; font-weight: {graisse}; "
+            f"src: url(data:{mime};base64,{donnees}) format('{format_css}'); }}"
+        )
+    return "\n".join(regles)
@@ -0,0 +1,130 @@
+import functools
+import hashlib
+import json
+import os
+import time
+
+# Taille maximale par défaut du cache sur disque (octets)
+TAILLE_MAX_DEFAUT = 256 * 1024 * 1024
+
+# En dessous de cette taille (caractères), rendre une section coûte moins cher
+# qu'une lecture dans le cache : elle est simplement recalculée.
+TAILLE_MIN_FRAGMENT = 4096
+
+# Au-delà, le fragment n'est pas mis en cache pour ne pas le garder en mémoire
+TAILLE_MAX_FRAGMENT = 4 * 1024 * 1024
+
+def _hacher(h, valeur):
+    """Ajoute une valeur JSON à une empreinte, par tranches pour les grands textes."""
+    if isinstance(valeur, str):
+        h.update(b's')
+        for debut in range(0, len(valeur), 1 << 20):
+            h.update(valeur[debut:debut + (1 << 20)].encode('utf-8', 'surrogatepass'))
+    else:
+        h.update(b'j')
+        h.update(json.dumps(valeur, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+    h.update(b'\0')
+
+def empreinte(*parties):
+    """Retourne l'empreinte SHA-256 (hexadécimale) d'une suite de valeurs JSON."""
+    h = hashlib.sha256()
+    for partie in parties:
+        _hacher(h, partie)
+    return h.hexdigest()
+
+def empreinte_fiche(data, version):
+    """Retourne l'empreinte d'une fiche complète pour un exporteur donné."""
+    h = hashlib.sha256()
+    _hacher(h, version)
+    for cle in sorted(data):
+        _hacher(h, cle)
+        _hacher(h, data[cle])
+    return h.hexdigest()
+
+def taille_cachable(value):
+    """Indique si une valeur de section mérite d'être mise en cache."""
+    if isinstance(value, str):
+        return TAILLE_MIN_FRAGMENT <= len(value) <= TAILLE_MAX_FRAGMENT
+    if isinstance(value, list):
+        return len(value) * 64 >= TAILLE_MIN_FRAGMENT
+    return False
+
+class CacheExport:
+    """Cache persistant de fragments HTML indexés par empreinte de contenu.
+
+    Les fragments sont stockés dans une base SQLite unique, partageable entre
+    processus. Lorsque la taille totale dépasse taille_max, les fragments les
+    moins récemment utilisés sont supprimés.
+    """
+
+    def __init__(self, dossier, taille_max=TAILLE_MAX_DEFAUT):
+        # sqlite3 n'est importé que si un cache est réellement ouvert
+        import sqlite3
+        os.makedirs(dossier, exist_ok=True)
+        self.taille_max = taille_max
+        self.connexion = sqlite3.connect(os.path.join(dossier, 'fragments.sqlite'), timeout=30)
+        self.connexion.execute('PRAGMA journal_mode=WAL')
+        self.connexion.execute('PRAGMA synchronous=NORMAL')
+        self.connexion.execute(
+            'CREATE TABLE IF NOT EXISTS fragments ('
+            ' cle TEXT PRIMARY KEY, contenu TEXT NOT NULL,'
+            ' taille INTEGER NOT NULL, acces REAL NOT NULL)'
+        )
+        self.connexion.execute('CREATE INDEX IF NOT EXISTS fragments_acces ON fragments (acces)')
+        self.connexion.commit()
+        self.taille = self._taille_totale()
+
+    def _taille_totale(self):
+        return self.connexion.execute('SELECT COALESCE(SUM(taille), 0) FROM fragments').fetchone()[0]
+
+    def lire(self, cle):
+        """Retourne le fragment associé à une clé, ou None s'il est absent."""
+        ligne = self.connexion.execute('SELECT contenu FROM fragments WHERE cle = ?', (cle,)).fetchone()
+        if ligne is None:
+            return None
+        with self.connexion:
+            self.connexion.execute('UPDATE fragments SET acces = ? WHERE cle = ?', (time.time(), cle))
+        return ligne[0]
+
+    def ecrire(self, cle, contenu):
+        """Enregistre un fragment puis évince les plus anciens si la taille maximale est dépassée."""
+        taille = len(contenu.encode('utf-8'))
+        with self.connexion:
+            # Un fragment remplacé libère sa taille : sinon le total compterait les deux
+            ancienne = self.connexion.execute('SELECT taille FROM fragments WHERE cle = ?', (cle,)).fetchone()
+            self.connexion.execute(
+                'INSERT OR REPLACE INTO fragments (cle, contenu, taille, acces) VALUES (?, ?, ?, ?)',
+                (cle, contenu, taille, time.time())
+            )
+        self.taille += taille - (ancienne[0] if ancienne else 0)
+        if self.taille > self.taille_max:
+            self.evincer()
+
+    def evincer(self):
+        """Supprime les fragments les moins récemment utilisés jusqu'à repasser sous la taille maximale."""
+        with self.connexion:
+            self.taille = self._taille_totale()
+            lignes = self.connexion.execute('SELECT cle, taille FROM fragments ORDER BY acces')
+            a_supprimer = []
+            for cle, taille in lignes:
+                if self.taille <= self.taille_max:
+                    break
+                a_supprimer.append((cle,))
+                self.taille -= taille
+            self.connexion.executemany('DELETE FROM fragments WHERE cle = ?', a_supprimer)
+
+    def fermer(self):
+        self.connexion.close()
+
+@functools.lru_cache(maxsize=None)
+def ouvrir_cache(dossier, taille_max=TAILLE_MAX_DEFAUT):
+    """Retourne le cache du dossier donné, ouvert une seule fois par processus."""
+    return CacheExport(dossier, taille_max)
+
+def nom_sortie(prefixe, data, version):
+    """Retourne un nom de fichier de sortie dérivé du contenu de la fiche.
+
+    Une fiche inchangée garde le même nom : si la sortie existe déjà, le rendu
+    peut être entièrement évité.
+    """
+    return f"{prefixe}_{empreinte_fiche(data, version)[:16]}"
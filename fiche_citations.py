@@ -0,0 +1,68 @@
+import re
+
+_CHIFFRES = re.compile(r'\d+')
+
+def normaliser(brute):
+    """Retourne (texte, page) d'une citation brute, ou None si elle est inexploitable.
+
+    Accepte un objet {'text', 'page'} (page numérique ou texte) ou une simple chaîne.
+    """
+    if isinstance(brute, str):
+        return brute.strip(), ''
+    if not isinstance(brute, dict):
+        return None
+    texte = brute.get('text')
+    page = brute.get('page')
+    texte = '' if texte is None else str(texte).strip()
+    page = '' if page is None else str(page).strip()
+    return texte, page
+
+def cle_page(page):
+    """Clé de tri naturel d'une page : '2' < '10' < '10-12' < 'iv' ; sans page en dernier."""
+    if not page:
+        return (2, 0, '')
+    nombre = _CHIFFRES.match(page)
+    if nombre:
+        return (0, int(nombre.group()), page)
+    return (1, 0, page.lower())
+
+class Citations:
+    """Citations d'une fiche validées, dédoublonnées et indexées par page en un seul passage.
+
+    entrees conserve l'ordre de saisie : (texte, page), texte vide pour une
+    citation non renseignée. par_page associe chaque page aux indices de ses
+    citations renseignées.
+    """
+
+    __slots__ = ('entrees', 'par_page', 'doublons', 'invalides')
+
+    def __init__(self, brutes):
+        self.entrees = []
+        self.par_page = {}
+        self.doublons = 0
+        self.invalides = 0
+        vues = set()
+
+        for brute in brutes or ():
+            citation = normaliser(brute)
+            if citation is None:
+                self.invalides += 1
+                continue
+            texte, page = citation
+            if texte:
+                if citation in vues:
+                    self.doublons += 1
+                    continue
+                vues.add(citation)
+                self.par_page.setdefault(page, []).append(len(self.entrees))
+            self.entrees.append(citation)
+
+    @property
+    def renseignees(self):
+        """Indique si au moins une citation contient du texte."""
+        return bool(self.par_page)
+
+    def concordance(self):
+        """Produit (page, [textes]) dans l'ordre naturel des pages."""
+        for page in sorted(self.par_page, key=cle_page):
+            yield page, [self.entrees[i][0] for i in self.par_page[page]]
@@ -0,0 +1,218 @@
+import os
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from fiche_images import dimensions
+from fiche_modele import Citation, Image, Paragraphe
+from fiche_profil import mesurer
+
+# Page Letter et marges du modèle par défaut de python-docx (twips), pour une mise en page identique
+PAGE = (12240, 15840)
+MARGES = (1440, 1800, 1440, 1800)
+
+# Largeur utile de la page en EMU (1 twip = 635 EMU), largeur des images insérées
+LARGEUR_UTILE = (PAGE[0] - MARGES[1] - MARGES[3]) * 635
+
+# Taille au-delà de laquelle le tampon XML est envoyé dans l'archive
+TAILLE_TAMPON = 1 << 16
+
+_W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+_R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_RELS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+# Caractères interdits en XML 1.0, retirés du texte
+_INTERDITS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+# Tabulations et retours à la ligne deviennent <w:tab/> et <w:br/>, comme avec python-docx
+_SEPARATEURS = re.compile(r'(\t|\r\n|\r|\n)')
+
+TYPES_CONTENU = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Default Extension="png" ContentType="image/png"/>
+<Default Extension="jpg" ContentType="image/jpeg"/>
+<Default Extension="gif" ContentType="image/gif"/>
+<Default Extension="webp" ContentType="image/webp"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>
+</Types>"""
+
+RELATIONS_PAQUET = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="{_RELS}">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+# Styles du modèle par défaut de python-docx utilisés par la fiche (polices de thème remplacées par leur nom)
+_POLICE_TITRES = '<w:rFonts w:ascii="Cambria" w:hAnsi="Cambria" w:eastAsia="Cambria" w:cs="Times New Roman"/>'
+STYLES = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:styles xmlns:w="{_W}">
+<w:docDefaults>
+<w:rPrDefault><w:rPr><w:rFonts w:ascii="Calibri" w:hAnsi="Calibri" w:eastAsia="Calibri" w:cs="Times New Roman"/><w:sz w:val="22"/><w:szCs w:val="22"/><w:lang w:val="fr-FR"/></w:rPr></w:rPrDefault>
+<w:pPrDefault><w:pPr><w:spacing w:after="200" w:line="276" w:lineRule="auto"/></w:pPr></w:pPrDefault>
+</w:docDefaults>
+<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>
+<w:style w:type="paragraph" w:styleId="Title"><w:name w:val="Title"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>
+<w:pPr><w:pBdr><w:bottom w:val="single" w:sz="8" w:space="4" w:color="4F81BD"/></w:pBdr><w:spacing w:after="300" w:line="240" w:lineRule="auto"/><w:contextualSpacing/></w:pPr>
+<w:rPr>{_POLICE_TITRES}<w:color w:val="17365D"/><w:spacing w:val="5"/><w:kern w:val="28"/><w:sz w:val="52"/><w:szCs w:val="52"/></w:rPr></w:style>
+<w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>
+<w:pPr><w:keepNext/><w:keepLines/><w:spacing w:before="480" w:after="0"/><w:outlineLvl w:val="0"/></w:pPr>
+<w:rPr>{_POLICE_TITRES}<w:b/><w:bCs/><w:color w:val="365F91"/><w:sz w:val="28"/><w:szCs w:val="28"/></w:rPr></w:style>
+<w:style w:type="paragraph" w:styleId="Heading2"><w:name w:val="heading 2"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>
+<w:pPr><w:keepNext/><w:keepLines/><w:spacing w:before="200" w:after="0"/><w:outlineLvl w:val="1"/></w:pPr>
+<w:rPr>{_POLICE_TITRES}<w:b/><w:bCs/><w:color w:val="4F81BD"/><w:sz w:val="26"/><w:szCs w:val="26"/></w:rPr></w:style>
+</w:styles>"""
+
+DEBUT_DOCUMENT = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    f'<w:document xmlns:w="{_W}" xmlns:r="{_R}"'
+    ' xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"'
+    ' xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+    ' xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"><w:body>'
+)
+
+FIN_DOCUMENT = (
+    f'<w:sectPr><w:pgSz w:w="{PAGE[0]}" w:h="{PAGE[1]}"/>'
+    f'<w:pgMar w:top="{MARGES[0]}" w:right="{MARGES[1]}" w:bottom="{MARGES[2]}" w:left="{MARGES[3]}"'
+    ' w:header="720" w:footer="720" w:gutter="0"/></w:sectPr></w:body></w:document>'
+)
+
+def _texte(texte):
+    """Contenu d'un run : texte échappé, tabulations et retours à la ligne convertis."""
+    texte = _INTERDITS.sub('', texte)
+    morceaux = []
+    for morceau in _SEPARATEURS.split(texte):
+        if morceau == '\t':
+            morceaux.append('<w:tab/>')
+        elif morceau in ('\n', '\r', '\r\n'):
+            morceaux.append('<w:br/>')
+        elif morceau:
+            morceaux.append(f'<w:t xml:space="preserve">{escape(morceau)}</w:t>')
+    return ''.join(morceaux)
+
+def _run(texte, proprietes=''):
+    if proprietes:
+        return f'<w:r><w:rPr>{proprietes}</w:rPr>{_texte(texte)}</w:r>'
+    return f'<w:r>{_texte(texte)}</w:r>'
+
+def paragraphe(texte='', style=None):
+    """Retourne le XML d'un paragraphe d'un seul run, avec un style éventuel."""
+    proprietes = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+    return f'<w:p>{proprietes}{_run(texte) if texte else ""}</w:p>'
+
+def puce(texte, page=None):
+    """Retourne le XML d'une citation : puce en gras, texte, page en italique."""
+    runs = _run('• ', '<w:b/>') + _run(texte if page is None else f"{texte} ")
+    if page is not None:
+        runs += _run(f"(p.{page})", '<w:i/>')
+    return f'<w:p>{runs}</w:p>'
+
+def dessin(rid, numero, largeur, hauteur):
+    """Retourne le XML d'un paragraphe contenant une image en ligne (dimensions en EMU)."""
+    return (
+        f'<w:p><w:r><w:drawing><wp:inline distT="0" distB="0" distL="0" distR="0">'
+        f'<wp:extent cx="{largeur}" cy="{hauteur}"/><wp:docPr id="{numero}" name="Image {numero}"/>'
+        f'<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+        f'<pic:pic><pic:nvPicPr><pic:cNvPr id="{numero}" name="image{numero}"/><pic:cNvPicPr/></pic:nvPicPr>'
+        f'<pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+        f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{largeur}" cy="{hauteur}"/></a:xfrm>'
+        f'<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr></pic:pic>'
+        f'</a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>'
+    )
+
+class _Tampon:
+    """Regroupe les petits morceaux XML avant de les envoyer (compressés) dans l'entrée de l'archive."""
+
+    def __init__(self, sortie):
+        self.sortie = sortie
+        self.morceaux = []
+        self.taille = 0
+
+    def ecrire(self, morceau):
+        self.morceaux.append(morceau)
+        self.taille += len(morceau)
+        if self.taille >= TAILLE_TAMPON:
+            self.vider()
+
+    def vider(self):
+        if self.morceaux:
+            self.sortie.write(''.join(self.morceaux).encode('utf-8'))
+            self.morceaux = []
+            self.taille = 0
+
+def ecrire_docx(doc, chemin, textes_vides, images=None, profil=None):
+    """Écrit un document (fiche_modele.Document) en DOCX, sans python-docx.
+
+    Le WordprocessingML est produit section par section et compressé au fil de
+    l'eau dans l'entrée word/document.xml de l'archive : seul un tampon de
+    TAILLE_TAMPON caractères est gardé en mémoire. Titres (styles Title,
+    Heading1, Heading2), puces en gras et pages en italique reprennent la mise
+    en page de python-docx. Les images, prises dans le magasin `images`
+    (variante d'impression), sont ajoutées ensuite, une fois chacune ; une
+    image dont le format n'est pas reconnu est remplacée par un paragraphe
+    d'avertissement. textes_vides donne le texte de chaque nature de bloc vide.
+    """
+    medias = {}
+    illisibles = set()
+    dessins = 0
+    with zipfile.ZipFile(chemin, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', TYPES_CONTENU)
+        archive.writestr('_rels/.rels', RELATIONS_PAQUET)
+        archive.writestr('word/styles.xml', STYLES)
+
+        with archive.open('word/document.xml', 'w', force_zip64=True) as sortie:
+            tampon = _Tampon(sortie)
+            tampon.ecrire(DEBUT_DOCUMENT)
+            tampon.ecrire(paragraphe('Fiche de Lecture', 'Title'))
+            if doc.titre:
+                tampon.ecrire(paragraphe(doc.titre, 'Heading1'))
+            tampon.ecrire(paragraphe())
+
+            for section in doc.sections.values():
+                tampon.ecrire(paragraphe(section.titre, 'Heading2'))
+                with mesurer(profil, section.cle, 'docx.flux'):
+                    for bloc in section.blocs:
+                        if isinstance(bloc, Citation):
+                            tampon.ecrire(puce(bloc.texte, bloc.page or '?'))
+                        elif isinstance(bloc, Paragraphe):
+                            tampon.ecrire(paragraphe(bloc.texte))
+                        elif isinstance(bloc, Image):
+                            fichier = images.chemin(bloc, 'impression')
+                            if fichier not in medias and fichier not in illisibles:
+                                with open(fichier, 'rb') as f:
+                                    try:
+                                        largeur, hauteur = dimensions(f.read())
+                                    except ValueError:
+                                        illisibles.add(fichier)
+                                    else:
+                                        medias[fichier] = (f"rIdImage{len(medias) + 1}", largeur, hauteur)
+                            if fichier in illisibles:
+                                tampon.ecrire(paragraphe(IMAGE_NON_PRISE_EN_CHARGE.format(mime=bloc.mime)))
+                                continue
+                            rid, largeur, hauteur = medias[fichier]
+                            dessins += 1
+                            tampon.ecrire(dessin(rid, dessins, LARGEUR_UTILE, LARGEUR_UTILE * hauteur // largeur))
+                        elif bloc.nature == 'citation':
+                            tampon.ecrire(puce(textes_vides['citation']))
+                        else:
+                            tampon.ecrire(paragraphe(textes_vides[bloc.nature]))
+
+            tampon.ecrire(FIN_DOCUMENT)
+            tampon.vider()
+
+        with mesurer(profil, 'docx.medias', images=len(medias)):
+            relations = []
+            for fichier, (rid, _, _) in medias.items():
+                cible = f"media/{rid}{os.path.splitext(fichier)[1]}"
+                archive.write(fichier, f"word/{cible}", zipfile.ZIP_STORED)
+                relations.append(
+                    f'<Relationship Id="{rid}" Type="{_R}/image" Target="{cible}"/>'
+                )
+            archive.writestr(
+                'word/_rels/document.xml.rels',
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<Relationships xmlns="{_RELS}">'
+                f'<Relationship Id="rIdStyles" Type="{_R}/styles" Target="styles.xml"/>'
+                f'{"".join(relations)}</Relationships>'
+            )
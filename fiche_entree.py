@@ -0,0 +1,132 @@
+import json
+
+# Taille minimale d'une lecture (caractères) ; elle double avec une valeur plus grande que le tampon
+TAILLE_LECTURE = 1 << 20
+
+# Extensions des fichiers à une fiche JSON par ligne
+EXTENSIONS_NDJSON = ('.ndjson', '.jsonl')
+
+_ESPACES = ' \t\r\n'
+_decodeur = json.JSONDecoder()
+
+class LecteurJSON:
+    """Lecture incrémentale de valeurs JSON dans un fichier texte.
+
+    Le fichier est lu par blocs ; chaque valeur est décodée par le décodeur C
+    de json (raw_decode) dès qu'elle est complète dans le tampon, qui ne garde
+    que la partie non encore décodée. Une valeur plus grande que le tampon le
+    fait doubler : le coût reste linéaire en la taille de la valeur.
+
+    Avec ndjson=True, une valeur ne dépasse pas sa ligne : une erreur de
+    décodage alors que la ligne est entière dans le tampon est signalée tout de
+    suite, avec son numéro, au lieu de lire la suite du fichier pour réessayer.
+    """
+
+    def __init__(self, fichier, taille=TAILLE_LECTURE, ndjson=False):
+        self.fichier = fichier
+        self.taille = taille
+        self.ndjson = ndjson
+        self.tampon = ''
+        self.pos = 0
+        self.fin = False
+        # Lignes entièrement consommées et retirées du tampon
+        self.lignes = 0
+
+    def _lire(self):
+        """Ajoute un bloc au tampon ; retourne False en fin de fichier."""
+        if self.fin:
+            return False
+        if self.pos:
+            self.lignes += self.tampon.count('\n', 0, self.pos)
+            self.tampon = self.tampon[self.pos:]
+            self.pos = 0
+        bloc = self.fichier.read(max(self.taille, len(self.tampon)))
+        if not bloc:
+            self.fin = True
+            return False
+        self.tampon += bloc
+        return True
+
+    def prochain(self):
+        """Saute les espaces et retourne le prochain caractère sans le consommer ('' en fin de fichier)."""
+        while True:
+            tampon = self.tampon
+            while self.pos < len(tampon) and tampon[self.pos] in _ESPACES:
+                self.pos += 1
+            if self.pos < len(tampon):
+                return tampon[self.pos]
+            if not self._lire():
+                return ''
+
+    def consommer(self):
+        """Consomme et retourne le prochain caractère non blanc."""
+        caractere = self.prochain()
+        self.pos += 1
+        return caractere
+
+    def valeur(self):
+        """Décode et retourne la prochaine valeur JSON complète."""
+        self.prochain()  # raw_decode n'accepte pas de blanc initial
+        while True:
+            try:
+                valeur, fin = _decodeur.raw_decode(self.tampon, self.pos)
+            except json.JSONDecodeError as e:
+                if self.ndjson and self.tampon.find('\n', self.pos) >= 0:
+                    ligne = self.lignes + self.tampon.count('\n', 0, self.pos) + 1
+                    raise ValueError(f"ligne {ligne} : JSON invalide ({e.msg})") from None
+                if self._lire():
+                    continue
+                raise
+            # Un nombre en bout de tampon peut se poursuivre dans le bloc suivant
+            if fin == len(self.tampon) and isinstance(valeur, (int, float)) and self._lire():
+                continue
+            self.pos = fin
+            return valeur
+
+def iter_valeurs(fichier, ndjson=False):
+    """Produit les fiches d'un fichier, une à une, au fil de la lecture.
+
+    Accepte une fiche seule, des fiches séparées par des blancs (NDJSON) et des
+    tableaux JSON de fiches, dont les éléments sont produits un à un sans que
+    le tableau soit jamais chargé en entier. Avec ndjson=True, une ligne
+    invalide est signalée sans lire plus loin (voir LecteurJSON).
+    """
+    lecteur = LecteurJSON(fichier, ndjson=ndjson)
+    while True:
+        caractere = lecteur.prochain()
+        if not caractere:
+            return
+        if caractere != '[':
+            yield lecteur.valeur()
+            continue
+
+        lecteur.consommer()
+        if lecteur.prochain() == ']':
+            lecteur.consommer()
+            continue
+        while True:
+            yield lecteur.valeur()
+            separateur = lecteur.consommer()
+            if separateur == ']':
+                break
+            if separateur != ',':
+                raise ValueError(f"',' ou ']' attendu dans le tableau de fiches, '{separateur}' trouvé")
+
+def iter_fiches(chemin):
+    """Produit les fiches (dictionnaires) d'un fichier JSON, NDJSON ou tableau JSON, une à une."""
+    ndjson = chemin.lower().endswith(EXTENSIONS_NDJSON)
+    with open(chemin, 'r', encoding='utf-8-sig') as f:
+        for numero, fiche in enumerate(iter_valeurs(f, ndjson), 1):
+            if not isinstance(fiche, dict):
+                raise ValueError(f"{chemin} : la fiche n°{numero} n'est pas un objet JSON")
+            yield fiche
+
+def est_multi_fiches(chemin):
+    """Indique si un fichier contient plusieurs fiches : NDJSON, ou tableau JSON de fiches.
+
+    Seuls l'extension et le premier caractère non blanc sont examinés.
+    """
+    if chemin.lower().endswith(EXTENSIONS_NDJSON):
+        return True
+    with open(chemin, 'r', encoding='utf-8-sig') as f:
+        return LecteurJSON(f, 4096).prochain() == '['
@@ -0,0 +1,193 @@
+import re
+from collections import deque
+
+from fiche_cache import empreinte
+from fiche_modele import Citation, Marque, Paragraphe
+
+# Sections dont les entrées « terme : définition » forment le glossaire de la fiche
+SECTIONS_GLOSSAIRE = ('lexique', 'glossaire')
+
+# Sections où les termes ne sont pas liés
+SECTIONS_NON_LIEES = SECTIONS_GLOSSAIRE + ('titre', 'auteur')
+
+# Longueur maximale d'un terme (caractères) ; au-delà, la ligne est une phrase, pas une entrée
+LONGUEUR_MAX_TERME = 80
+
+# Entrée d'un glossaire : puce facultative, terme, séparateur (« : », « = » ou tiret
+# entouré d'espaces), définition
+_ENTREE = re.compile(
+    r'^[ \t]*(?:[-•*·–—][ \t]+)?([^:=\n]+?)[ \t]*(?::|=|[ \t][-–—][ \t])[ \t]*(\S[^\n]*)$', re.M
+)
+
+# Mots d'un texte (symboles de l'automate) et ponctuation, qui interrompt un terme de plusieurs mots
+_JETONS = re.compile(r"(\w+)|[^\w\s'’-]")
+_MOTS = re.compile(r'\w+')
+
+def extraire_entrees(texte):
+    """Produit (début, fin, terme, définition) pour chaque entrée d'un texte de glossaire.
+
+    Une entrée occupe une ligne : « terme : définition », « terme = définition »
+    ou « terme – définition », précédée ou non d'une puce ; début et fin
+    délimitent le terme dans le texte.
+    """
+    for entree in _ENTREE.finditer(texte):
+        terme = entree.group(1)
+        if len(terme) <= LONGUEUR_MAX_TERME and _MOTS.search(terme):
+            yield entree.start(1), entree.end(1), terme, entree.group(2).strip()
+
+def cle_terme(terme):
+    """Retourne la suite de mots normalisés (minuscules) d'un terme."""
+    return tuple(mot.lower() for mot in _MOTS.findall(terme))
+
+class Glossaire:
+    """Automate d'Aho–Corasick des termes d'un glossaire, dont l'alphabet est fait de mots.
+
+    Un texte est découpé en mots par une seule expression régulière, puis
+    parcouru une fois par l'automate : le coût est linéaire en la taille du
+    texte plus le nombre d'occurrences, quel que soit le nombre de termes. Les
+    occurrences commencent et finissent donc sur des limites de mots ; un terme
+    de plusieurs mots ne franchit pas une ponctuation. La casse est ignorée.
+    """
+
+    def __init__(self):
+        self.definitions = []
+        self._transitions = [{}]
+        # Par état : terme reconnu (numéro, nombre de mots) ou None, et état
+        # suffixe le plus long qui reconnaît un terme (0 : aucun)
+        self._sorties = [None]
+        self._suffixes = [0]
+        self._echecs = [0]
+        self.longueur_max = 0
+
+    def __bool__(self):
+        return bool(self.definitions)
+
+    def ajouter(self, terme, definition):
+        """Ajoute un terme ; retourne son numéro, ou None s'il figure déjà dans le glossaire."""
+        cle = cle_terme(terme)
+        etat = 0
+        for mot in cle:
+            suivant = self._transitions[etat].get(mot)
+            if suivant is None:
+                suivant = self._transitions[etat][mot] = len(self._transitions)
+                self._transitions.append({})
+                self._sorties.append(None)
+            etat = suivant
+        if not cle or self._sorties[etat] is not None:
+            return None
+        numero = len(self.definitions)
+        self._sorties[etat] = (numero, len(cle))
+        self.definitions.append(definition)
+        self.longueur_max = max(self.longueur_max, len(cle))
+        return numero
+
+    def compiler(self):
+        """Calcule les liens d'échec et de suffixe (parcours en largeur du trie)."""
+        self._echecs = [0] * len(self._transitions)
+        self._suffixes = [0] * len(self._transitions)
+        file = deque(self._transitions[0].values())
+        while file:
+            etat = file.popleft()
+            for mot, suivant in self._transitions[etat].items():
+                echec = self._echecs[etat]
+                while echec and mot not in self._transitions[echec]:
+                    echec = self._echecs[echec]
+                echec = self._transitions[echec].get(mot, 0)
+                if echec == suivant:
+                    echec = 0
+                self._echecs[suivant] = echec
+                self._suffixes[suivant] = echec if self._sorties[echec] is not None else self._suffixes[echec]
+                file.append(suivant)
+        return self
+
+    def occurrences(self, texte):
+        """Retourne les occurrences (début, fin, numéro) des termes dans un texte, croissantes.
+
+        Parmi des occurrences qui se chevauchent, la plus à gauche l'emporte,
+        puis la plus longue.
+        """
+        transitions, echecs, sorties, suffixes = self._transitions, self._echecs, self._sorties, self._suffixes
+        etat = 0
+        rang = 0
+        # Débuts des derniers mots lus, de quoi remonter au premier mot du plus long terme
+        debuts = deque(maxlen=self.longueur_max)
+        candidats = []
+        for jeton in _JETONS.finditer(texte):
+            mot = jeton.group(1)
+            if mot is None:
+                etat = 0
+                continue
+            mot = mot.lower()
+            while etat and mot not in transitions[etat]:
+                etat = echecs[etat]
+            etat = transitions[etat].get(mot, 0)
+            debuts.append(jeton.start())
+            sortie = etat if sorties[etat] is not None else suffixes[etat]
+            while sortie:
+                numero, longueur = sorties[sortie]
+                candidats.append((rang - longueur + 1, -longueur, debuts[-longueur], jeton.end(), numero))
+                sortie = suffixes[sortie]
+            rang += 1
+
+        retenues = []
+        fin_rang = -1
+        for premier, moins_longueur, debut, fin, numero in sorted(candidats):
+            if premier > fin_rang:
+                retenues.append((debut, fin, numero))
+                fin_rang = premier - moins_longueur - 1
+        return retenues
+
+    def marques(self, texte):
+        """Retourne les liens (fiche_modele.Marque) des occurrences des termes d'un texte, ou None."""
+        return tuple(
+            Marque(debut, fin, f"terme-{numero + 1}", self.definitions[numero])
+            for debut, fin, numero in self.occurrences(texte)
+        ) or None
+
+def lier_glossaire(sections):
+    """Lie les termes du lexique et du glossaire d'une fiche à leur définition ; retourne les sections.
+
+    Chaque entrée des sections SECTIONS_GLOSSAIRE reçoit une ancre ; chaque
+    occurrence d'un terme dans les paragraphes et citations des autres
+    sections, un lien vers elle. Un terme défini deux fois garde sa première
+    définition. Les sections modifiées portent l'empreinte du glossaire
+    (variante), qui entre dans leur clé de cache.
+    """
+    glossaire = Glossaire()
+    entrees = []
+    ancres = {}
+    for cle in SECTIONS_GLOSSAIRE:
+        section = sections.get(cle)
+        if section is None:
+            continue
+        for i, bloc in enumerate(section.blocs):
+            if isinstance(bloc, Paragraphe):
+                for debut, fin, terme, definition in extraire_entrees(bloc.texte):
+                    numero = glossaire.ajouter(terme, definition)
+                    if numero is not None:
+                        entrees.append((terme, definition))
+                        ancres.setdefault((cle, i), []).append(Marque(debut, fin, f"terme-{numero + 1}", None))
+    if not glossaire:
+        return sections
+
+    glossaire.compiler()
+    variante = empreinte(entrees)
+    resultat = {}
+    for cle, section in sections.items():
+        if cle in SECTIONS_GLOSSAIRE:
+            blocs = [
+                bloc._replace(marques=tuple(ancres[cle, i])) if (cle, i) in ancres else bloc
+                for i, bloc in enumerate(section.blocs)
+            ]
+        elif cle not in SECTIONS_NON_LIEES:
+            blocs = [
+                bloc._replace(marques=glossaire.marques(bloc.texte))
+                if isinstance(bloc, (Paragraphe, Citation)) and bloc.texte else bloc
+                for bloc in section.blocs
+            ]
+        else:
+            blocs = section.blocs
+        if any(getattr(bloc, 'marques', None) for bloc in blocs):
+            section = section._replace(blocs=blocs, variante=variante)
+        resultat[cle] = section
+    return resultat
@@ -0,0 +1,438 @@
+import argparse
+import json
+import os
+import sys
+
+from fiche_manifeste import chemin_temporaire
+
+# Version du format de l'historique compressé
+VERSION_HISTORIQUE = 1
+
+# Un enregistrement sur INTERVALLE_DEFAUT est une image complète (clé) ; les autres
+# sont des deltas par champ par rapport au précédent
+INTERVALLE_DEFAUT = 32
+
+# Clés d'un HistoryState (useHistoryManager.ts) : un `before`/`after` qui en contient
+# est un instantané de l'application plutôt qu'une valeur de champ
+CLES_ETAT = ('sheet', 'customZones', 'tabs', 'zoneCustomizations', 'theme', 'customThemes')
+
+# Charge utile d'une action, stockée en delta ; le reste de l'action est conservé tel quel
+CHARGES = ('before', 'after')
+
+# Comparaison des textes par tranches (caractères), puis dichotomie dans la tranche qui diffère
+TRANCHE = 4096
+
+def _prefixe_commun(a, b, limite):
+    """Longueur du plus long préfixe commun de a et b, au plus limite."""
+    pos = 0
+    while pos + TRANCHE <= limite and a[pos:pos + TRANCHE] == b[pos:pos + TRANCHE]:
+        pos += TRANCHE
+    bas, haut = pos, min(pos + TRANCHE, limite)
+    while bas < haut:
+        milieu = (bas + haut + 1) // 2
+        if a[pos:milieu] == b[pos:milieu]:
+            bas = milieu
+        else:
+            haut = milieu - 1
+    return bas
+
+def _suffixe_commun(a, b, limite):
+    """Longueur du plus long suffixe commun de a et b, au plus limite."""
+    fin_a, fin_b = len(a), len(b)
+    n = 0
+    while n + TRANCHE <= limite and a[fin_a - n - TRANCHE:fin_a - n] == b[fin_b - n - TRANCHE:fin_b - n]:
+        n += TRANCHE
+    bas, haut = n, min(n + TRANCHE, limite)
+    while bas < haut:
+        milieu = (bas + haut + 1) // 2
+        if a[fin_a - milieu:fin_a - n] == b[fin_b - milieu:fin_b - n]:
+            bas = milieu
+        else:
+            haut = milieu - 1
+    return bas
+
+def _memes_types(a, b):
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return all(_memes_types(valeur, b[cle]) for cle, valeur in a.items())
+    if isinstance(a, list):
+        return all(map(_memes_types, a, b))
+    return True
+
+def _egal(a, b):
+    """Égalité stricte de deux valeurs JSON : comme ==, mais True, 1 et 1.0 restent distincts à toute profondeur."""
+    return a == b and _memes_types(a, b)
+
+def delta(ancien, nouveau):
+    """Retourne le delta qui transforme ancien en nouveau (valeurs JSON), ou None s'ils sont égaux.
+
+    Formes du delta (listes JSON, premier élément : nature) :
+    ['=', valeur] remplacement ; ['s', préfixe, suffixe, milieu] texte dont
+    seul le milieu change ; ['d', {clé: delta}, [clés retirées]] objet modifié
+    champ par champ ; ['L', [[indice, delta], ...]] liste de même longueur
+    modifiée élément par élément ; ['l', préfixe, suffixe, [éléments]] liste
+    dont seul le milieu change.
+    """
+    if _egal(ancien, nouveau):
+        return None
+    if isinstance(ancien, str) and isinstance(nouveau, str):
+        limite = min(len(ancien), len(nouveau))
+        prefixe = _prefixe_commun(ancien, nouveau, limite)
+        suffixe = _suffixe_commun(ancien, nouveau, limite - prefixe)
+        milieu = nouveau[prefixe:len(nouveau) - suffixe]
+        if len(milieu) + 16 < len(nouveau):
+            return ['s', prefixe, suffixe, milieu]
+    elif isinstance(ancien, dict) and isinstance(nouveau, dict):
+        champs = {}
+        for cle, valeur in nouveau.items():
+            if cle not in ancien:
+                champs[cle] = ['=', valeur]
+            else:
+                d = delta(ancien[cle], valeur)
+                if d is not None:
+                    champs[cle] = d
+        retirees = [cle for cle in ancien if cle not in nouveau]
+        return ['d', champs, retirees]
+    elif isinstance(ancien, list) and isinstance(nouveau, list):
+        if len(ancien) == len(nouveau):
+            return ['L', [[i, d] for i, (a, n) in enumerate(zip(ancien, nouveau))
+                          if (d := delta(a, n)) is not None]]
+        limite = min(len(ancien), len(nouveau))
+        prefixe = 0
+        while prefixe < limite and _egal(ancien[prefixe], nouveau[prefixe]):
+            prefixe += 1
+        suffixe = 0
+        while suffixe < limite - prefixe and _egal(ancien[-1 - suffixe], nouveau[-1 - suffixe]):
+            suffixe += 1
+        return ['l', prefixe, suffixe, nouveau[prefixe:len(nouveau) - suffixe]]
+    return ['=', nouveau]
+
+def appliquer(ancien, d):
+    """Applique un delta (voir delta) et retourne la nouvelle valeur.
+
+    ancien n'est jamais modifié : les parties inchangées sont partagées avec
+    le résultat, copiées seulement le long des chemins modifiés.
+    """
+    if d is None:
+        return ancien
+    nature = d[0]
+    if nature == '=':
+        return d[1]
+    if nature == 's':
+        _, prefixe, suffixe, milieu = d
+        return ancien[:prefixe] + milieu + ancien[len(ancien) - suffixe:]
+    if nature == 'd':
+        _, champs, retirees = d
+        nouveau = {cle: valeur for cle, valeur in ancien.items() if cle not in retirees}
+        for cle, dc in champs.items():
+            nouveau[cle] = appliquer(nouveau.get(cle), dc)
+        return nouveau
+    if nature == 'L':
+        nouveau = list(ancien)
+        for i, de in d[1]:
+            nouveau[i] = appliquer(nouveau[i], de)
+        return nouveau
+    if nature == 'l':
+        _, prefixe, suffixe, milieu = d
+        return ancien[:prefixe] + milieu + ancien[len(ancien) - suffixe:]
+    raise ValueError(f"delta inconnu : {nature!r}")
+
+def _zone(etat, cible):
+    for zone in etat.get('customZones') or ():
+        if isinstance(zone, dict) and zone.get('id') == cible:
+            return zone
+    return None
+
+def rejouer(etat, action):
+    """Retourne l'état (HistoryState) après une action, rejouée comme le « refaire » de useHistoryManager.
+
+    Un `after` qui contient des clés de HistoryState remplace ces clés. L'état
+    d'origine n'est pas modifié.
+    """
+    apres = action.get('after')
+    cible = action.get('target') or {}
+    nature = action.get('type')
+    etat = dict(etat)
+    if isinstance(apres, dict) and any(cle in apres for cle in CLES_ETAT):
+        etat.update((cle, apres[cle]) for cle in CLES_ETAT if cle in apres)
+        return etat
+
+    if cible.get('type') == 'sheet':
+        if nature == 'content' and isinstance(apres, dict) and 'value' in apres and cible.get('id'):
+            etat['sheet'] = dict(etat.get('sheet') or {}, **{cible['id']: apres['value']})
+    elif cible.get('type') == 'app':
+        if nature == 'theme' and isinstance(apres, dict):
+            etat['theme'] = apres.get('theme')
+    elif cible.get('type') == 'zone':
+        identifiant = cible.get('id')
+        zones = [dict(zone) if isinstance(zone, dict) and zone.get('id') == identifiant else zone
+                 for zone in etat.get('customZones') or ()]
+        etat['customZones'] = zones
+        zone = _zone(etat, identifiant)
+        if nature == 'create' and apres is not None:
+            zones.append(apres)
+        elif zone is not None and nature in ('delete', 'restore'):
+            zone['isDeleted'] = nature == 'delete'
+            zone['isVisible'] = nature == 'restore'
+        elif zone is not None and isinstance(apres, dict):
+            champ = {'move': 'position', 'resize': 'size', 'content': 'content', 'rename': 'title'}.get(nature)
+            if champ is not None:
+                zone[champ] = apres.get(champ)
+        if nature in ('color', 'customization') and isinstance(apres, dict) and identifiant:
+            personnalisations = dict(etat.get('zoneCustomizations') or {})
+            if nature == 'color':
+                personnalisations[identifiant] = dict(personnalisations.get(identifiant) or {},
+                                                     backgroundColor=apres.get('backgroundColor'))
+            else:
+                personnalisations[identifiant] = apres.get('customization')
+            etat['zoneCustomizations'] = personnalisations
+    return etat
+
+def etat_initial(actions, base=None):
+    """Retourne l'état avant la première action.
+
+    Sans fiche de base, il est reconstitué à partir de l'historique : le
+    `before` de la première action s'il s'agit d'un instantané, sinon la
+    valeur initiale (`before` de la première modification) de chaque champ
+    de la fiche.
+    """
+    if actions:
+        avant = actions[0].get('before')
+        if isinstance(avant, dict) and any(cle in avant for cle in CLES_ETAT):
+            etat = {cle: avant[cle] for cle in CLES_ETAT if cle in avant}
+            if base is not None:
+                etat['sheet'] = base
+            return etat
+    if base is not None:
+        return {'sheet': base}
+    fiche = {}
+    for action in actions:
+        cible = action.get('target') or {}
+        avant = action.get('before')
+        if (cible.get('type') == 'sheet' and action.get('type') == 'content' and cible.get('id')
+                and isinstance(avant, dict) and 'value' in avant):
+            fiche.setdefault(cible['id'], avant['value'])
+    return {'sheet': fiche}
+
+def _instantane(valeur):
+    return isinstance(valeur, dict) and any(cle in valeur for cle in CLES_ETAT)
+
+def reference(etat, action, instantane=False):
+    """Retourne la valeur attendue du `before` d'une action d'après l'état qui la précède.
+
+    C'est la référence de son delta : d'ordinaire, `before` est exactement
+    cette valeur et son delta est vide.
+    """
+    if instantane:
+        return {cle: etat[cle] for cle in CLES_ETAT if cle in etat}
+    cible = action.get('target') or {}
+    identifiant = cible.get('id')
+    if cible.get('type') == 'sheet':
+        return {'value': (etat.get('sheet') or {}).get(identifiant)}
+    if cible.get('type') == 'app':
+        return {'theme': etat.get('theme')}
+    if cible.get('type') == 'zone':
+        personnalisation = (etat.get('zoneCustomizations') or {}).get(identifiant)
+        if action.get('type') == 'color':
+            return {'backgroundColor': (personnalisation or {}).get('backgroundColor')}
+        if action.get('type') == 'customization':
+            return {'customization': personnalisation}
+        return _zone(etat, identifiant)
+    return None
+
+class Historique:
+    """Historique d'annulation compressé : images clés périodiques et deltas par champ.
+
+    L'enregistrement n°i porte les charges `before`/`after` de l'action n°i :
+    `before` en delta (voir delta) de sa référence, la valeur que l'état
+    précédent laisse attendre (reference), `after` en delta de `before`. Un
+    enregistrement sur intervalle est une image clé : il porte en plus l'état
+    qui précède l'action, complet pour l'enregistrement 0 (état de base),
+    en delta de l'état de base pour les suivants. L'état après l'action n°i
+    s'obtient en rejouant (rejouer) les actions depuis l'image clé
+    précédente : au plus intervalle actions, quelle que soit la longueur de
+    l'historique. Les métadonnées des actions (type, cible, description...)
+    sont conservées telles quelles.
+    """
+
+    def __init__(self, actions, enregistrements, intervalle, index_courant, initial=None):
+        self.actions = actions
+        self.enregistrements = enregistrements
+        self.intervalle = intervalle
+        self.index_courant = index_courant
+        # État initial d'un historique vide (sinon porté par l'enregistrement 0)
+        self.initial = initial
+        # Dernière action décodée : (index, charges, état après l'action)
+        self._cache = (None, None, None)
+
+    @classmethod
+    def depuis_dump(cls, dump, base=None, intervalle=INTERVALLE_DEFAUT):
+        """Compresse un dump de ficheHistoryStack ({history, currentIndex})."""
+        if not isinstance(dump, dict) or not isinstance(dump.get('history'), list):
+            raise ValueError("dump d'historique attendu : objet JSON avec une liste 'history'")
+        historique = dump['history']
+        etat = etat_initial(historique, base)
+        enregistrements = []
+        for i, action in enumerate(historique):
+            enregistrement = {}
+            if i == 0:
+                enregistrement['etat'] = etat
+            elif i % intervalle == 0:
+                enregistrement['e'] = delta(enregistrements[0]['etat'], etat)
+            avant = action.get('before')
+            if _instantane(avant):
+                enregistrement['i'] = 1
+            if 'before' in action:
+                enregistrement['b'] = delta(reference(etat, action, 'i' in enregistrement), avant)
+            if 'after' in action:
+                enregistrement['a'] = delta(avant, action['after'])
+            enregistrements.append(enregistrement)
+            etat = rejouer(etat, action)
+
+        actions = [{cle: valeur for cle, valeur in action.items() if cle not in CHARGES} for action in historique]
+        return cls(actions, enregistrements, intervalle, dump.get('currentIndex', len(historique) - 1),
+                   None if historique else etat)
+
+    @classmethod
+    def charger(cls, chemin):
+        with open(chemin, 'r', encoding='utf-8') as f:
+            contenu = json.load(f)
+        if contenu.get('version') != VERSION_HISTORIQUE:
+            raise ValueError(f"historique de version {contenu.get('version')} ({VERSION_HISTORIQUE} attendue)")
+        return cls(contenu['actions'], contenu['enregistrements'], contenu['intervalle'],
+                   contenu['currentIndex'], contenu.get('initial'))
+
+    def ecrire(self, chemin):
+        """Écrit l'historique compressé d'un bloc (fichier temporaire renommé)."""
+        contenu = {'version': VERSION_HISTORIQUE, 'intervalle': self.intervalle,
+                   'currentIndex': self.index_courant, 'actions': self.actions,
+                   'enregistrements': self.enregistrements}
+        if self.initial is not None:
+            contenu['initial'] = self.initial
+        with open(chemin_temporaire(chemin), 'w', encoding='utf-8') as f:
+            json.dump(contenu, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(chemin_temporaire(chemin), chemin)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def _decoder(self, index):
+        """Retourne (charges, état après l'action) de l'action n°index."""
+        if not 0 <= index < len(self):
+            raise IndexError(f"index d'historique hors limites : {index} (de -1 à {len(self) - 1})")
+        # Accès séquentiel (parcours de l'historique) : repartir de l'action précédente
+        cle = index - index % self.intervalle
+        dernier, charges, etat = self._cache
+        if dernier is None or not cle <= dernier <= index:
+            dernier, etat = cle - 1, self.etat(-1)
+            if cle:
+                etat = appliquer(etat, self.enregistrements[cle]['e'])
+        for i in range(dernier + 1, index + 1):
+            enregistrement = self.enregistrements[i]
+            metadonnees = self.actions[i]
+            charges = {}
+            avant = None
+            if 'b' in enregistrement:
+                avant = charges['before'] = appliquer(
+                    reference(etat, metadonnees, 'i' in enregistrement), enregistrement['b'])
+            if 'a' in enregistrement:
+                charges['after'] = appliquer(avant, enregistrement['a'])
+            etat = rejouer(etat, dict(metadonnees, **charges))
+        self._cache = (index, charges, etat)
+        return charges, etat
+
+    def etat(self, index):
+        """Retourne l'état (HistoryState) après l'action n°index ; -1 pour l'état initial."""
+        if index == -1:
+            return self.initial if not self.enregistrements else self.enregistrements[0]['etat']
+        return self._decoder(index)[1]
+
+    def fiche(self, index):
+        """Retourne la fiche (sheet) après l'action n°index ; -1 pour la fiche initiale."""
+        return self.etat(index).get('sheet') or {}
+
+    def action(self, index):
+        """Retourne l'action n°index complète, charges `before`/`after` comprises."""
+        action = dict(self.actions[index])
+        action.update(self._decoder(index)[0])
+        return action
+
+    def dump(self):
+        """Reconstitue le dump d'origine ({history, currentIndex})."""
+        return {'history': [self.action(i) for i in range(len(self))], 'currentIndex': self.index_courant}
+
+    def verifier(self, dump):
+        """Vérifie que dump() restitue exactement un dump (types compris : true n'y devient pas 1).
+
+        Lève ValueError à la première action qui diffère.
+        """
+        historique = dump['history']
+        if len(historique) != len(self):
+            raise ValueError(f"{len(self)} action(s) restituée(s) pour {len(historique)}")
+        for index, attendue in enumerate(historique):
+            if not _egal(self.action(index), attendue):
+                raise ValueError(f"l'action {index} n'est pas restituée à l'identique")
+        if 'currentIndex' in dump and not _egal(self.index_courant, dump['currentIndex']):
+            raise ValueError("currentIndex n'est pas restitué à l'identique")
+
+def _lire_json(chemin):
+    with open(chemin, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _ecrire_json(valeur, chemin):
+    if chemin is None:
+        json.dump(valeur, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    with open(chemin_temporaire(chemin), 'w', encoding='utf-8') as f:
+        json.dump(valeur, f, ensure_ascii=False, indent=2)
+    os.replace(chemin_temporaire(chemin), chemin)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compression et relecture de l'historique d'annulation d'une fiche")
+    commandes = parser.add_subparsers(dest='commande', required=True)
+
+    compresser = commandes.add_parser('compresser', help="Compresse un dump de ficheHistoryStack")
+    compresser.add_argument('dump', help="dump JSON {history, currentIndex}")
+    compresser.add_argument('-o', '--sortie', default=None,
+                            help="historique compressé (défaut : <dump>.historique.json)")
+    compresser.add_argument('--base', default=None, metavar='FICHE',
+                            help="fiche JSON avant la première action (défaut : reconstituée)")
+    compresser.add_argument('--intervalle', type=int, default=INTERVALLE_DEFAUT,
+                            help="une image complète tous les N enregistrements (défaut : %(default)s)")
+
+    fiche = commandes.add_parser('fiche', help="Reconstruit la fiche à un index de l'historique")
+    fiche.add_argument('historique')
+    fiche.add_argument('index', type=int, nargs='?', default=None,
+                       help="index de l'action (-1 : fiche initiale ; défaut : currentIndex)")
+    fiche.add_argument('-o', '--sortie', default=None, help="fiche JSON écrite (défaut : sortie standard)")
+
+    restaurer = commandes.add_parser('restaurer', help="Reconstitue le dump d'origine")
+    restaurer.add_argument('historique')
+    restaurer.add_argument('-o', '--sortie', default=None, help="dump JSON écrit (défaut : sortie standard)")
+    args = parser.parse_args()
+
+    try:
+        if args.commande == 'compresser':
+            base = _lire_json(args.base) if args.base else None
+            dump = _lire_json(args.dump)
+            historique = Historique.depuis_dump(dump, base, max(1, args.intervalle))
+            historique.verifier(dump)
+            sortie = args.sortie or f"{os.path.splitext(args.dump)[0]}.historique.json"
+            historique.ecrire(sortie)
+            avant, apres = os.path.getsize(args.dump), os.path.getsize(sortie)
+            print(f"✓ {len(historique)} action(s) : {avant / 1024:.1f} Ko -> {apres / 1024:.1f} Ko "
+                  f"({avant / max(apres, 1):.1f}x) : {sortie}")
+        elif args.commande == 'fiche':
+            historique = Historique.charger(args.historique)
+            index = historique.index_courant if args.index is None else args.index
+            _ecrire_json(historique.fiche(index), args.sortie)
+        else:
+            _ecrire_json(Historique.charger(args.historique).dump(), args.sortie)
+    except (OSError, ValueError, IndexError) as e:
+        print(f"Erreur : {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import base64
+import binascii
+import hashlib
+import importlib.util
+import io
+import os
+import re
+import struct
+
+# Pillow n'est importé qu'à la création des variantes ; sans lui, l'original sert partout
+PIL_AVAILABLE = importlib.util.find_spec('PIL') is not None
+
+# Image en data: URL, telle que produite par canvas.toDataURL ou un copier-coller
+_DATA_URL = re.compile(r'data:(image/(?:png|jpeg|jpg|gif|webp));base64,([A-Za-z0-9+/]+={0,2})')
+
+EXTENSIONS = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/jpg': 'jpg', 'image/gif': 'gif', 'image/webp': 'webp'}
+
+# Plus grand côté (pixels) de chaque variante : écran pour le HTML, impression pour PDF/DOCX
+VARIANTES = {'ecran': 1600, 'impression': 3000}
+
+# Qualité JPEG de chaque variante
+QUALITES = {'ecran': 82, 'impression': 92}
+
+def decouper(texte):
+    """Découpe un texte en morceaux : chaînes et images (mime, empreinte, octets).
+
+    Chaque image est décodée une seule fois et identifiée par le SHA-256 de son
+    contenu. Une data: URL illisible est laissée dans le texte.
+    """
+    if 'data:image/' not in texte:
+        yield texte
+        return
+
+    debut = 0
+    for correspondance in _DATA_URL.finditer(texte):
+        try:
+            donnees = base64.b64decode(correspondance.group(2), validate=True)
+        except (binascii.Error, ValueError):
+            continue
+        if correspondance.start() > debut:
+            yield texte[debut:correspondance.start()]
+        mime = correspondance.group(1).replace('image/jpg', 'image/jpeg')
+        yield mime, hashlib.sha256(donnees).hexdigest(), donnees
+        debut = correspondance.end()
+    if debut < len(texte):
+        yield texte[debut:]
+
+def sans_images(texte):
+    """Retourne le texte sans ses images collées (data: URL remplacées par une espace)."""
+    if 'data:image/' not in texte:
+        return texte
+    return _DATA_URL.sub(' ', texte)
+
+def infos_jpeg(donnees):
+    """Retourne (largeur, hauteur, composantes) d'une image JPEG, lues dans son marqueur SOF."""
+    pos = 2
+    while pos + 9 < len(donnees):
+        if donnees[pos] != 0xFF:
+            pos += 1
+            continue
+        marqueur = donnees[pos + 1]
+        if marqueur in (0xD8, 0x01) or 0xD0 <= marqueur <= 0xD7 or marqueur == 0xFF:
+            pos += 1 if marqueur == 0xFF else 2
+            continue
+        longueur = struct.unpack('>H', donnees[pos + 2:pos + 4])[0]
+        # Marqueurs SOFn (hors DHT, JPG et DAC) : précision, hauteur, largeur, composantes
+        if 0xC0 <= marqueur <= 0xCF and marqueur not in (0xC4, 0xC8, 0xCC):
+            hauteur, largeur, composantes = struct.unpack('>HHB', donnees[pos + 5:pos + 10])
+            return largeur, hauteur, composantes
+        pos += 2 + longueur
+    raise ValueError("JPEG sans marqueur SOF")
+
+def dimensions_webp(donnees):
+    """Retourne (largeur, hauteur) d'une image WebP, lues dans son premier bloc (VP8, VP8L ou VP8X)."""
+    bloc = donnees[12:16]
+    if bloc == b'VP8 ' and donnees[23:26] == b'\x9d\x01\x2a':
+        largeur, hauteur = struct.unpack('<HH', donnees[26:30])
+        return largeur & 0x3FFF, hauteur & 0x3FFF
+    if bloc == b'VP8L' and donnees[20:21] == b'\x2f':
+        bits = struct.unpack('<I', donnees[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if bloc == b'VP8X' and len(donnees) >= 30:
+        return (
+            int.from_bytes(donnees[24:27], 'little') + 1,
+            int.from_bytes(donnees[27:30], 'little') + 1,
+        )
+    raise ValueError("en-tête WebP illisible")
+
+def dimensions(donnees):
+    """Retourne (largeur, hauteur) en pixels d'une image PNG, GIF, JPEG ou WebP, lue dans son en-tête.
+
+    Pillow n'est pas nécessaire ; lève ValueError pour un format non reconnu.
+    """
+    if donnees[:8] == b'\x89PNG\r\n\x1a\n':
+        return struct.unpack('>II', donnees[16:24])
+    if donnees[:6] in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', donnees[6:10])
+    if donnees[:2] == b'\xff\xd8':
+        return infos_jpeg(donnees)[:2]
+    if donnees[:4] == b'RIFF' and donnees[8:12] == b'WEBP':
+        return dimensions_webp(donnees)
+    raise ValueError("format d'image non reconnu (PNG, GIF, JPEG ou WebP attendu)")
+
+def data_url(image):
+    """Réencode une image du modèle en data: URL (export autonome, sans magasin)."""
+    return f"data:{image.mime};base64,{base64.b64encode(image.donnees).decode('ascii')}"
+
+class MagasinImages:
+    """Magasin d'images adressé par contenu, partagé par les exports d'un dossier.
+
+    Chaque image est écrite une seule fois sous <empreinte>.<ext>, quel que soit
+    le nombre de fiches ou de formats qui la contiennent ; ses variantes par
+    usage (VARIANTES) sont calculées à la première demande et conservées sous
+    <empreinte>-<usage>.<ext>. Les écritures passent par un fichier temporaire
+    renommé : plusieurs processus peuvent partager le magasin.
+    """
+
+    def __init__(self, dossier):
+        self.dossier = dossier
+        # Préfixe des URL relatives, pour un HTML écrit dans le dossier parent
+        self.prefixe_url = os.path.basename(os.path.normpath(dossier))
+        self._chemins = {}
+
+    def _ecrire(self, chemin, contenu):
+        os.makedirs(self.dossier, exist_ok=True)
+        temporaire = f"{chemin}.{os.getpid()}.tmp"
+        with open(temporaire, 'wb') as f:
+            f.write(contenu)
+        os.replace(temporaire, chemin)
+
+    def original(self, image):
+        """Retourne le chemin de l'image d'origine, écrite si elle n'est pas encore en magasin."""
+        chemin = os.path.join(self.dossier, f"{image.empreinte}.{EXTENSIONS[image.mime]}")
+        if not os.path.exists(chemin):
+            self._ecrire(chemin, image.donnees)
+        return chemin
+
+    def chemin(self, image, usage):
+        """Retourne le chemin de la variante d'une image pour un usage ('ecran' ou 'impression')."""
+        cle = (image.empreinte, usage)
+        chemin = self._chemins.get(cle)
+        if chemin is None:
+            chemin = self._chemins[cle] = self._variante(image, usage)
+        return chemin
+
+    def url(self, image, usage='ecran'):
+        """Retourne l'URL relative de la variante, pour un HTML écrit à côté du magasin."""
+        return f"{self.prefixe_url}/{os.path.basename(self.chemin(image, usage))}"
+
+    def _variante(self, image, usage):
+        extension = EXTENSIONS[image.mime]
+        chemin = os.path.join(self.dossier, f"{image.empreinte}-{usage}.{extension}")
+        if os.path.exists(chemin):
+            return chemin
+        if not PIL_AVAILABLE or image.mime == 'image/gif':
+            return self.original(image)
+
+        from PIL import Image
+
+        cote_max = VARIANTES[usage]
+        try:
+            with Image.open(io.BytesIO(image.donnees)) as img:
+                if max(img.size) <= cote_max:
+                    return self.original(image)
+                format_image = img.format
+                img.thumbnail((cote_max, cote_max))
+                tampon = io.BytesIO()
+                if format_image == 'JPEG':
+                    img.save(tampon, format_image, quality=QUALITES[usage], optimize=True)
+                else:
+                    img.save(tampon, format_image, optimize=True)
+        except (OSError, ValueError):
+            # Image que Pillow ne sait pas lire : l'original sert, chaque moteur décide de son sort
+            return self.original(image)
+        self._ecrire(chemin, tampon.getvalue())
+        return chemin
@@ -0,0 +1,620 @@
+import argparse
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import unicodedata
+from array import array
+from bisect import bisect_right
+
+from fiche_cache import empreinte_fiche
+from fiche_citations import Citations
+from fiche_entree import est_multi_fiches, iter_fiches
+from fiche_images import sans_images
+from fiche_manifeste import chemin_temporaire, empreinte_fichier
+from fiche_modele import SECTIONS_IMAGES, SECTIONS_ORDER
+
+# Version de l'index ; un index d'une autre version doit être reconstruit
+VERSION_INDEX = 1
+
+# Champs indexés : une clé de SECTIONS_ORDER chacun, plus la page des citations
+CHAMP_PAGE = 'page'
+CHAMPS = SECTIONS_ORDER + [CHAMP_PAGE]
+NUMEROS_CHAMPS = {champ: numero for numero, champ in enumerate(CHAMPS)}
+# Noms de champs acceptés dans une requête, sans distinction de casse
+_CHAMPS_REQUETE = {champ.lower(): numero for champ, numero in NUMEROS_CHAMPS.items()}
+
+# Catalogue de l'index : segments et fichier des fiches supprimées
+NOM_CATALOGUE = 'index.json'
+
+# Fiches d'un segment avant son écriture sur disque : borne la mémoire de l'indexation
+FICHES_PAR_SEGMENT = 20000
+
+# Au-delà de ce nombre de segments, ils sont fusionnés en un seul
+SEGMENTS_MAX = 8
+
+# Termes plus longs ignorés (restes de base64, URL...)
+LONGUEUR_MAX_TERME = 40
+
+# Segment : en-tête, table des fiches, table des termes, clés, listes de fiches
+MAGIE = b'FIX1'
+ENTETE = struct.Struct('<4sIIIIIII')
+# Terme : début et longueur de la clé, numéro de champ, début (mots de 32 bits) et longueur de sa liste
+ENTREE = struct.Struct('<IHHII')
+# Une liste de plus d'une fiche sur DENSITE_BITMAP du segment est écrite en bitmap
+# (un bit par fiche) : les mots fréquents se croisent par opérations sur des entiers
+DENSITE_BITMAP = 64
+# Drapeau du numéro de champ d'une entrée écrite en bitmap
+BITMAP = 0x8000
+# Repère d'ordre des octets : les tableaux sont écrits dans l'ordre natif
+BOUTISME = 0x01020304
+
+_MOTS = re.compile(r'\w+')
+_DIACRITIQUES = re.compile('[\u0300-\u036f]')
+
+def normaliser(texte):
+    """Retourne le texte en minuscules, sans accents ni ligatures."""
+    texte = texte.lower()
+    if texte.isascii():
+        return texte
+    texte = _DIACRITIQUES.sub('', unicodedata.normalize('NFD', texte))
+    return texte.replace('œ', 'oe').replace('æ', 'ae')
+
+def termes(texte):
+    """Retourne l'ensemble des termes normalisés d'un texte."""
+    return {mot for mot in _MOTS.findall(normaliser(texte)) if len(mot) <= LONGUEUR_MAX_TERME}
+
+def champs_fiche(data):
+    """Produit (numéro de champ, texte) pour chaque champ indexé d'une fiche."""
+    for cle, valeur in data.items():
+        numero = NUMEROS_CHAMPS.get(cle)
+        if numero is None or valeur is None or cle == CHAMP_PAGE:
+            continue
+        if cle == 'citations':
+            for texte, page in Citations(valeur).entrees:
+                if texte:
+                    yield numero, texte
+                if page:
+                    yield NUMEROS_CHAMPS[CHAMP_PAGE], str(page)
+        elif isinstance(valeur, str):
+            yield numero, sans_images(valeur) if cle in SECTIONS_IMAGES else valeur
+        else:
+            yield numero, str(valeur)
+
+def _aligner(taille):
+    return (taille + 3) & ~3
+
+def bitmap(numeros, taille):
+    """Retourne le bitmap (octets, bit de poids faible en premier) de numéros compris entre 0 et taille."""
+    octets = bytearray((taille + 7) // 8)
+    for numero in numeros:
+        octets[numero >> 3] |= 1 << (numero & 7)
+    return octets
+
+# Rangs des bits à 1 de chaque octet
+_BITS_OCTET = [tuple(rang for rang in range(8) if octet >> rang & 1) for octet in range(256)]
+
+def numeros_bits(bits, base=0, limite=None):
+    """Retourne, croissants, les numéros base + rang des bits à 1 d'un entier (au plus limite)."""
+    numeros = []
+    for i, octet in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, 'little')):
+        if octet:
+            numeros.extend(base + 8 * i + rang for rang in _BITS_OCTET[octet])
+            if limite is not None and len(numeros) >= limite:
+                return numeros[:limite]
+    return numeros
+
+def ecrire_segment(chemin, base, fiches, entrees):
+    """Écrit un segment ; fiches : [(source, empreinte)], entrees : (terme, champ, numéros) triées.
+
+    Les numéros de fiches de chaque liste sont croissants ; ils sont écrits
+    relatifs à base, en tableau d'entiers de 32 bits ou en bitmap selon leur
+    densité. Le segment est écrit dans un fichier temporaire renommé : un
+    lecteur ne voit jamais de segment partiel.
+    """
+    index_fiches = array('I', [0])
+    blob_fiches = bytearray()
+    for source, empreinte in fiches:
+        blob_fiches += f"{source}\t{empreinte}".encode('utf-8', 'surrogatepass')
+        index_fiches.append(len(blob_fiches))
+
+    table = bytearray()
+    cles = bytearray()
+    listes = bytearray()
+    seuil = len(fiches) // DENSITE_BITMAP
+    for terme, champ, numeros in entrees:
+        cle = terme.encode('utf-8')
+        locaux = [numero - base for numero in numeros]
+        if len(locaux) > seuil:
+            champ |= BITMAP
+            liste = bitmap(locaux, len(fiches))
+            liste += bytes(_aligner(len(liste)) - len(liste))
+        else:
+            liste = array('I', locaux).tobytes()
+        table += ENTREE.pack(len(cles), len(cle), champ, len(listes) // 4, len(locaux))
+        cles += cle
+        listes += liste
+
+    entete = ENTETE.pack(MAGIE, BOUTISME, base, len(fiches), len(table) // ENTREE.size,
+                         len(blob_fiches), len(cles), len(listes) // 4)
+    temporaire = chemin_temporaire(chemin)
+    with open(temporaire, 'wb') as f:
+        f.write(entete)
+        index_fiches.tofile(f)
+        f.write(blob_fiches.ljust(_aligner(len(blob_fiches)), b'\0'))
+        f.write(table)
+        f.write(cles.ljust(_aligner(len(cles)), b'\0'))
+        f.write(listes)
+    os.replace(temporaire, chemin)
+
+class Segment:
+    """Segment immuable de l'index, projeté en mémoire (mmap).
+
+    Les termes sont triés par (terme, champ) dans une table à entrées de
+    taille fixe : une recherche est une dichotomie dans le fichier projeté,
+    sans rien charger. Les listes de fiches, tableaux d'entiers de 32 bits ou
+    bitmaps, sont lues directement dans la projection et converties en
+    entiers-bitmaps (un bit par fiche du segment) que la requête croise.
+    """
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        with open(chemin, 'rb') as f:
+            self.projection = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magie, boutisme, self.base, self.nombre, self.nombre_termes,
+         taille_fiches, taille_cles, nombre_mots) = ENTETE.unpack_from(self.projection)
+        if magie != MAGIE:
+            raise ValueError(f"{chemin} n'est pas un segment d'index")
+        if boutisme != BOUTISME:
+            raise ValueError(f"{chemin} a été écrit sur une machine d'un autre boutisme : reconstruire l'index")
+        vue = memoryview(self.projection)
+        pos = ENTETE.size
+        self.index_fiches = vue[pos:pos + 4 * (self.nombre + 1)].cast('I')
+        pos += 4 * (self.nombre + 1)
+        self.debut_fiches = pos
+        pos += _aligner(taille_fiches)
+        self.debut_table = pos
+        pos += ENTREE.size * self.nombre_termes
+        self.debut_cles = pos
+        pos += _aligner(taille_cles)
+        self.debut_listes = pos
+        self.listes = vue[pos:pos + 4 * nombre_mots].cast('I')
+        self.complet = (1 << self.nombre) - 1
+
+    def fiche(self, numero):
+        """Retourne (source, empreinte) d'une fiche du segment, par son numéro global."""
+        i = numero - self.base
+        debut = self.debut_fiches + self.index_fiches[i]
+        fin = self.debut_fiches + self.index_fiches[i + 1]
+        source, empreinte = self.projection[debut:fin].decode('utf-8', 'surrogatepass').rsplit('\t', 1)
+        return source, empreinte
+
+    def fiches(self):
+        """Produit (numéro, source, empreinte) pour chaque fiche du segment."""
+        for numero in range(self.base, self.base + self.nombre):
+            yield (numero,) + self.fiche(numero)
+
+    def _entree(self, i):
+        debut_cle, longueur, champ, debut, nombre = ENTREE.unpack_from(self.projection, self.debut_table + i * ENTREE.size)
+        debut_cle += self.debut_cles
+        return self.projection[debut_cle:debut_cle + longueur], champ, debut, nombre
+
+    def _premier(self, cle):
+        """Indice de la première entrée dont le terme est >= cle (dichotomie)."""
+        bas, haut = 0, self.nombre_termes
+        while bas < haut:
+            milieu = (bas + haut) // 2
+            if self._entree(milieu)[0] < cle:
+                bas = milieu + 1
+            else:
+                haut = milieu
+        return bas
+
+    def _bits(self, debut):
+        debut = self.debut_listes + 4 * debut
+        return int.from_bytes(self.projection[debut:debut + (self.nombre + 7) // 8], 'little')
+
+    def chercher(self, terme, champ=None, prefixe=False):
+        """Retourne le bitmap (entier, bit n pour la fiche base + n) des fiches qui contiennent un terme.
+
+        Avec prefixe, tous les termes qui commencent par terme comptent ; sans
+        champ, tous les champs.
+        """
+        cle = terme.encode('utf-8')
+        bits = 0
+        # Les listes en tableau sont d'abord réunies en un seul bitmap
+        rares = bytearray((self.nombre + 7) // 8)
+        for i in range(self._premier(cle), self.nombre_termes):
+            terme_i, champ_i, debut, nombre = self._entree(i)
+            if terme_i != cle and not (prefixe and terme_i.startswith(cle)):
+                break
+            if champ is not None and champ_i & ~BITMAP != champ:
+                continue
+            if champ_i & BITMAP:
+                bits |= self._bits(debut)
+                if bits == self.complet:
+                    return bits
+            else:
+                for numero in self.listes[debut:debut + nombre]:
+                    rares[numero >> 3] |= 1 << (numero & 7)
+        return bits | int.from_bytes(rares, 'little')
+
+    def entrees(self):
+        """Produit (terme, champ, numéros globaux) pour chaque entrée, dans l'ordre de la table."""
+        for i in range(self.nombre_termes):
+            terme, champ, debut, nombre = self._entree(i)
+            if champ & BITMAP:
+                numeros = numeros_bits(self._bits(debut), self.base)
+            else:
+                numeros = [self.base + numero for numero in self.listes[debut:debut + nombre]]
+            yield terme.decode('utf-8'), champ & ~BITMAP, numeros
+
+    def fermer(self):
+        """Libère la projection ; si des listes lues y renvoient encore, le ramasse-miettes s'en charge."""
+        try:
+            self.index_fiches.release()
+            self.listes.release()
+            self.projection.close()
+        except BufferError:
+            pass
+
+def analyser(requete):
+    """Découpe une requête en clauses (terme, numéro de champ ou None, préfixe), toutes requises.
+
+    Syntaxe : mots séparés par des espaces, « champ:mot » pour restreindre un
+    mot à un champ (thematiques:mort, page:12), « mot* » pour un préfixe.
+    """
+    clauses = []
+    for morceau in requete.split():
+        champ = None
+        if ':' in morceau:
+            nom, morceau = morceau.split(':', 1)
+            champ = _CHAMPS_REQUETE.get(nom.lower())
+            if champ is None:
+                raise ValueError(f"champ inconnu : {nom} (champs : {', '.join(CHAMPS)})")
+        prefixe = morceau.endswith('*')
+        mots = _MOTS.findall(normaliser(morceau))
+        for i, mot in enumerate(mots):
+            clauses.append((mot, champ, prefixe and i == len(mots) - 1))
+    return clauses
+
+class Index:
+    """Index plein texte persistant d'un corpus de fiches, à champs séparés.
+
+    L'index est un dossier de segments immuables (voir Segment), décrit par un
+    catalogue JSON : liste des segments, prochain numéro de fiche et fichier
+    des fiches supprimées. Chaque fiche reçoit un numéro global croissant ;
+    les segments couvrent des plages contiguës de numéros.
+
+    Ajouter des fiches écrit de nouveaux segments ; retirer ou modifier une
+    fiche la marque supprimée (la fiche modifiée est réindexée sous un nouveau
+    numéro). La fusion des segments (compacter) élimine les fiches supprimées.
+    Le catalogue est réécrit en dernier, d'un bloc : un lecteur voit l'index
+    avant ou après une mise à jour, jamais entre les deux.
+    """
+
+    def __init__(self, dossier):
+        self.dossier = dossier
+        self.chemin_catalogue = os.path.join(dossier, NOM_CATALOGUE)
+        try:
+            with open(self.chemin_catalogue, 'r', encoding='utf-8') as f:
+                catalogue = json.load(f)
+        except FileNotFoundError:
+            catalogue = {'version': VERSION_INDEX, 'segments': [], 'supprimes': None, 'prochain': 0, 'generation': 0}
+        if catalogue.get('version') != VERSION_INDEX:
+            raise ValueError(f"index de version {catalogue.get('version')} ({VERSION_INDEX} attendue) : le reconstruire")
+        self.catalogue = catalogue
+        self.segments = [Segment(os.path.join(dossier, nom)) for nom in catalogue['segments']]
+        self.bases = [segment.base for segment in self.segments]
+        self.supprimes = set()
+        if catalogue['supprimes']:
+            numeros = array('I')
+            with open(os.path.join(dossier, catalogue['supprimes']), 'rb') as f:
+                numeros.frombytes(f.read())
+            self.supprimes.update(numeros)
+        self._sources = None
+        self._masques = {}
+
+    # Lecture
+
+    def __len__(self):
+        return sum(segment.nombre for segment in self.segments) - len(self.supprimes)
+
+    def _segment(self, numero):
+        return self.segments[bisect_right(self.bases, numero) - 1]
+
+    def fiche(self, numero):
+        """Retourne (source, empreinte) d'une fiche par son numéro."""
+        return self._segment(numero).fiche(numero)
+
+    def _presentes(self, segment):
+        """Bitmap des fiches non supprimées d'un segment."""
+        masque = self._masques.get(segment.base)
+        if masque is None:
+            fin = segment.base + segment.nombre
+            supprimes = [numero - segment.base for numero in self.supprimes if segment.base <= numero < fin]
+            masque = segment.complet & ~int.from_bytes(bitmap(supprimes, segment.nombre), 'little')
+            self._masques[segment.base] = masque
+        return masque
+
+    def chercher(self, requete, limite=None):
+        """Retourne (nombre, numéros) des fiches qui contiennent tous les mots de la requête.
+
+        Les numéros sont croissants, au plus limite ; chaque segment croise les
+        bitmaps des mots, le plus souvent sans énumérer une seule fiche.
+        """
+        clauses = analyser(requete)
+        nombre, numeros = 0, []
+        if not clauses:
+            return nombre, numeros
+        for segment in self.segments:
+            bits = self._presentes(segment)
+            for terme, champ, prefixe in clauses:
+                if not bits:
+                    break
+                bits &= segment.chercher(terme, champ, prefixe)
+            nombre += bits.bit_count()
+            reste = None if limite is None else limite - len(numeros)
+            if bits and reste != 0:
+                numeros += numeros_bits(bits, segment.base, reste)
+        return nombre, numeros
+
+    def sources(self):
+        """Retourne le dictionnaire source -> (numéro, empreinte) des fiches indexées."""
+        if self._sources is None:
+            self._sources = {}
+            for segment in self.segments:
+                for numero, source, empreinte in segment.fiches():
+                    if numero not in self.supprimes:
+                        self._sources[source] = (numero, empreinte)
+        return self._sources
+
+    # Écriture
+
+    def _nom(self, prefixe, extension):
+        self.catalogue['generation'] += 1
+        return f"{prefixe}-{self.catalogue['generation']:06d}.{extension}"
+
+    def _valider(self, nouveaux, anciens):
+        """Écrit les supprimées puis le catalogue ; supprime ensuite les fichiers qui n'en font plus partie."""
+        remplace = self.catalogue['supprimes']
+        if self.supprimes:
+            nom = self._nom('supprimes', 'bin')
+            chemin = os.path.join(self.dossier, nom)
+            with open(chemin_temporaire(chemin), 'wb') as f:
+                array('I', sorted(self.supprimes)).tofile(f)
+            os.replace(chemin_temporaire(chemin), chemin)
+            self.catalogue['supprimes'] = nom
+        else:
+            self.catalogue['supprimes'] = None
+        self.catalogue['segments'] = [os.path.basename(segment.chemin) for segment in nouveaux]
+        temporaire = chemin_temporaire(self.chemin_catalogue)
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(self.catalogue, f, ensure_ascii=False)
+        os.replace(temporaire, self.chemin_catalogue)
+
+        obsoletes = [segment.chemin for segment in anciens]
+        if remplace and remplace != self.catalogue['supprimes']:
+            obsoletes.append(os.path.join(self.dossier, remplace))
+        for segment in anciens:
+            segment.fermer()
+        for chemin in obsoletes:
+            try:
+                os.remove(chemin)
+            except FileNotFoundError:
+                pass
+        self.segments = nouveaux
+        self.bases = [segment.base for segment in nouveaux]
+        self._masques = {}
+
+    def _ecrire(self, fiches, postings):
+        base = self.catalogue['prochain']
+        chemin = os.path.join(self.dossier, self._nom('segment', 'fix'))
+        entrees = ((terme, champ, postings[terme, champ]) for terme, champ in sorted(postings))
+        ecrire_segment(chemin, base, fiches, entrees)
+        self.catalogue['prochain'] = base + len(fiches)
+        return Segment(chemin)
+
+    def mettre_a_jour(self, fiches, fichiers_lus=(), segments_max=SEGMENTS_MAX, echecs=None):
+        """Indexe les fiches nouvelles ou modifiées ; retourne (ajoutées, inchangées, retirées).
+
+        fiches est un itérable de (source, empreinte, lire) : lire() retourne la
+        fiche JSON, appelée seulement si l'empreinte diffère de celle indexée.
+        Une fiche illisible (JSON invalide, autre chose qu'un objet) est ajoutée
+        à echecs (source, erreur) et sautée ; sa version déjà indexée est gardée.
+        Les fiches indexées d'un fichier lu en entier (fichiers_lus) mais
+        absentes du parcours, fiches retirées d'une archive, sont retirées.
+        """
+        os.makedirs(self.dossier, exist_ok=True)
+        sources = self.sources()
+        vues = set()
+        ajoutees = inchangees = 0
+        nouveaux = []
+        lot, postings = [], {}
+        for source, empreinte, lire in fiches:
+            vues.add(source)
+            connue = sources.get(source)
+            if connue is not None and connue[1] == empreinte:
+                inchangees += 1
+                continue
+            try:
+                data = lire()
+                if not isinstance(data, dict):
+                    raise ValueError(f"objet JSON attendu, {type(data).__name__} trouvé")
+                champs = list(champs_fiche(data))
+            except (OSError, ValueError) as e:
+                if echecs is not None:
+                    echecs.append((source, f"{e.__class__.__name__} : {e}"))
+                continue
+            if connue is not None:
+                self.supprimes.add(connue[0])
+            numero = self.catalogue['prochain'] + len(lot)
+            for champ, texte in champs:
+                for terme in termes(texte):
+                    liste = postings.get((terme, champ))
+                    if liste is None:
+                        liste = postings[terme, champ] = array('I')
+                    if not liste or liste[-1] != numero:
+                        liste.append(numero)
+            lot.append((source, empreinte))
+            sources[source] = (numero, empreinte)
+            ajoutees += 1
+            if len(lot) >= FICHES_PAR_SEGMENT:
+                nouveaux.append(self._ecrire(lot, postings))
+                lot, postings = [], {}
+        if lot:
+            nouveaux.append(self._ecrire(lot, postings))
+
+        lus = set(fichiers_lus)
+        disparues = [source for source in sources
+                     if source not in vues and source.rsplit('#', 1)[0] in lus]
+        retirees = self._retirer(disparues)
+        self._valider(self.segments + nouveaux, [])
+        if len(self.segments) > segments_max:
+            self.compacter()
+        return ajoutees, inchangees, retirees
+
+    def _retirer(self, sources):
+        connues = self.sources()
+        retirees = 0
+        for source in sources:
+            connue = connues.pop(source, None)
+            if connue is not None:
+                self.supprimes.add(connue[0])
+                retirees += 1
+        return retirees
+
+    def retirer(self, chemins):
+        """Retire de l'index les fiches de fichiers (et archives) ; retourne leur nombre."""
+        chemins = {os.path.abspath(chemin) for chemin in chemins}
+        retirees = self._retirer([source for source in self.sources() if source.rsplit('#', 1)[0] in chemins])
+        self._valider(self.segments, [])
+        return retirees
+
+    def purger(self):
+        """Retire les fiches dont le fichier source n'existe plus ; retourne leur nombre."""
+        fichiers = {source.rsplit('#', 1)[0] for source in self.sources()}
+        absents = {fichier for fichier in fichiers if not os.path.exists(fichier)}
+        return self.retirer(absents) if absents else 0
+
+    def compacter(self):
+        """Fusionne tous les segments en un seul, sans les fiches supprimées, renumérotées.
+
+        Les tables de termes, déjà triées, sont fusionnées (heapq.merge) : la
+        mémoire ne dépend que du nombre de fiches, pas de la taille des listes.
+        """
+        if len(self.segments) <= 1 and not self.supprimes:
+            return
+        os.makedirs(self.dossier, exist_ok=True)
+        # Ancien numéro -> nouveau, ou MORT pour une fiche supprimée
+        mort = 0xFFFFFFFF
+        carte = array('I', [mort]) * self.catalogue['prochain']
+        fiches = []
+        for segment in self.segments:
+            for numero, source, empreinte in segment.fiches():
+                if numero not in self.supprimes:
+                    carte[numero] = len(fiches)
+                    fiches.append((source, empreinte))
+
+        def fusion():
+            groupes = heapq.merge(*(segment.entrees() for segment in self.segments), key=lambda e: e[:2])
+            courant, numeros = None, array('I')
+            for terme, champ, liste in groupes:
+                if (terme, champ) != courant:
+                    if numeros:
+                        yield courant + (numeros,)
+                    courant, numeros = (terme, champ), array('I')
+                numeros.extend(n for n in map(carte.__getitem__, liste) if n != mort)
+            if numeros:
+                yield courant + (numeros,)
+
+        chemin = os.path.join(self.dossier, self._nom('segment', 'fix'))
+        ecrire_segment(chemin, 0, fiches, fusion())
+        self.catalogue['prochain'] = len(fiches)
+        self.supprimes = set()
+        self._sources = None
+        self._valider([Segment(chemin)], self.segments)
+
+def iter_sources(fichiers, echecs, lus):
+    """Produit (source, empreinte, lire) pour chaque fiche des fichiers, archives NDJSON comprises.
+
+    L'empreinte d'une fiche seule est celle de son fichier : une fiche
+    inchangée n'est pas relue. Un fichier lu jusqu'au bout est ajouté à lus ;
+    un fichier illisible est ajouté à echecs (fichier, erreur).
+    """
+    for json_file in fichiers:
+        json_file = os.path.abspath(json_file)
+        try:
+            if est_multi_fiches(json_file):
+                for numero, data in enumerate(iter_fiches(json_file), 1):
+                    yield f"{json_file}#{numero}", empreinte_fiche(data, VERSION_INDEX), lambda data=data: data
+            else:
+                def lire(json_file=json_file):
+                    with open(json_file, 'r', encoding='utf-8') as f:
+                        return json.load(f)
+                yield json_file, empreinte_fichier(json_file), lire
+            lus.add(json_file)
+        except (OSError, ValueError) as e:
+            echecs.append((json_file, f"{e.__class__.__name__} : {e}"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Index plein texte d'un corpus de fiches de lecture")
+    parser.add_argument('-i', '--index', default='index_fiches', help="Dossier de l'index (défaut : index_fiches)")
+    commandes = parser.add_subparsers(dest='commande', required=True)
+
+    indexer = commandes.add_parser('indexer', help="Ajoute ou met à jour des fiches")
+    indexer.add_argument('chemins', nargs='+', help="Fichiers, archives NDJSON, dossiers ou motifs glob")
+    indexer.add_argument('-r', '--recursive', action='store_true', help="Parcourir les sous-dossiers")
+    indexer.add_argument('--purger', action='store_true', help="Retirer aussi les fiches dont le fichier a disparu")
+
+    retirer = commandes.add_parser('retirer', help="Retire de l'index les fiches de fichiers")
+    retirer.add_argument('chemins', nargs='+')
+
+    commandes.add_parser('compacter', help="Fusionne les segments et élimine les fiches supprimées")
+
+    chercher = commandes.add_parser('chercher', help="Cherche les fiches qui contiennent tous les mots")
+    chercher.add_argument('requete', nargs='+', help="Mots, champ:mot, préfixe*")
+    chercher.add_argument('-n', '--limite', type=int, default=20, help="Nombre de résultats affichés (défaut : 20)")
+    args = parser.parse_args()
+
+    if args.commande == 'chercher':
+        debut = time.perf_counter()
+        try:
+            index = Index(args.index)
+            nombre, numeros = index.chercher(' '.join(args.requete), args.limite)
+            resultats = [index.fiche(numero)[0] for numero in numeros]
+        except ValueError as e:
+            print(f"Erreur : {e}")
+            sys.exit(1)
+        duree = (time.perf_counter() - debut) * 1000
+        for source in resultats:
+            print(source)
+        print(f"{nombre} fiche(s) sur {len(index)} ({duree:.1f} ms)")
+        return
+
+    index = Index(args.index)
+    debut = time.perf_counter()
+    if args.commande == 'indexer':
+        from export_fiche_batch import lister_fiches
+
+        fichiers = lister_fiches(args.chemins, args.recursive)
+        echecs, lus = [], set()
+        ajoutees, inchangees, retirees = index.mettre_a_jour(iter_sources(fichiers, echecs, lus), lus, echecs=echecs)
+        if args.purger:
+            retirees += index.purger()
+        for source, erreur in echecs:
+            print(f"✗ {source} : {erreur}")
+        print(f"✓ {ajoutees} fiche(s) indexée(s), {inchangees} inchangée(s), {retirees} retirée(s)")
+    elif args.commande == 'retirer':
+        print(f"✓ {index.retirer(args.chemins)} fiche(s) retirée(s)")
+    else:
+        index.compacter()
+        print(f"✓ Index compacté : {len(index)} fiche(s), {len(index.segments)} segment(s)")
+    print(f"  {len(index)} fiche(s) indexée(s) en {time.perf_counter() - debut:.1f} s")
+
+if __name__ == "__main__":
+    main()
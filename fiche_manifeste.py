@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+# Version du format du manifeste ; un manifeste d'une autre version est ignoré
+VERSION_MANIFESTE = 1
+
+# Nom du manifeste, dans le dossier de sortie qu'il décrit
+NOM_MANIFESTE = '.manifeste.json'
+
+# Taille des blocs lus pour l'empreinte d'un fichier source
+TAILLE_BLOC = 1 << 20
+
+def chemin_temporaire(chemin):
+    """Retourne un nom temporaire propre au processus, renommé ensuite en chemin (os.replace).
+
+    Deux processus qui écrivent la même sortie ne partagent jamais de fichier
+    temporaire ; le dernier renommage l'emporte, et la sortie n'est jamais
+    partielle.
+    """
+    return f"{chemin}.{os.getpid()}.tmp"
+
+def abandonner_temporaire(chemin):
+    """Supprime le fichier temporaire d'une sortie s'il existe encore (écriture ratée ou interrompue).
+
+    À appeler après os.replace, dans un finally : un export raté ne laisse
+    ainsi aucun *.tmp derrière lui.
+    """
+    try:
+        os.remove(chemin_temporaire(chemin))
+    except FileNotFoundError:
+        pass
+
+def empreinte_fichier(chemin):
+    """Retourne l'empreinte SHA-256 (hexadécimale) du contenu d'un fichier, lu par blocs."""
+    h = hashlib.sha256()
+    with open(chemin, 'rb') as f:
+        for bloc in iter(lambda: f.read(TAILLE_BLOC), b''):
+            h.update(bloc)
+    return h.hexdigest()
+
+class Manifeste:
+    """Index des exports d'un dossier : source -> empreinte et fichiers produits.
+
+    Pour chaque exporteur, une entrée par fiche source (fichier, ou fiche n°N
+    d'une archive) associe l'empreinte de son contenu et de la version de
+    l'exporteur aux sorties produites, relatives au dossier. Une fiche dont
+    l'empreinte n'a pas changé et dont les sorties existent n'est pas
+    reconstruite ; les sorties qu'une nouvelle version remplace, et celles des
+    fiches disparues, sont supprimées.
+
+    Seul le processus principal d'un lot lit et écrit le manifeste ; il est
+    réécrit d'un bloc, via un fichier temporaire renommé.
+    """
+
+    def __init__(self, dossier):
+        self.dossier = dossier
+        self.chemin = os.path.join(dossier, NOM_MANIFESTE)
+        self.entrees = self._charger()
+
+    def _charger(self):
+        try:
+            with open(self.chemin, 'r', encoding='utf-8') as f:
+                contenu = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(contenu, dict) or contenu.get('version') != VERSION_MANIFESTE:
+            return {}
+        return contenu.get('exporteurs', {})
+
+    def a_jour(self, exporteur, source, empreinte):
+        """Retourne les sorties (chemins) d'une source inchangée dont les exports existent, None sinon."""
+        entree = self.entrees.get(exporteur, {}).get(source)
+        if entree is None or entree['empreinte'] != empreinte:
+            return None
+        sorties = [os.path.join(self.dossier, nom) for nom in entree['sorties']]
+        if not all(os.path.exists(chemin) for chemin in sorties):
+            return None
+        return sorties
+
+    def _supprimer(self, noms):
+        supprimes = 0
+        for nom in noms:
+            try:
+                os.remove(os.path.join(self.dossier, nom))
+                supprimes += 1
+            except FileNotFoundError:
+                pass
+        return supprimes
+
+    def enregistrer(self, exporteur, source, fichier, empreinte, sorties):
+        """Enregistre les sorties d'une source et supprime celles qu'elles remplacent ; retourne leur nombre."""
+        noms = [os.path.relpath(chemin, self.dossier) for chemin in sorties]
+        ancienne = self.entrees.setdefault(exporteur, {}).get(source)
+        self.entrees[exporteur][source] = {'fichier': fichier, 'empreinte': empreinte, 'sorties': noms}
+        if ancienne is None:
+            return 0
+        return self._supprimer(set(ancienne['sorties']) - set(noms))
+
+    def nettoyer(self, exporteur, fichiers, vues):
+        """Supprime les entrées orphelines et leurs sorties ; retourne le nombre de fichiers supprimés.
+
+        Est orpheline une entrée dont le fichier source n'existe plus, ou dont le
+        fichier a été parcouru (fichiers) sans que la source soit vue (vues) :
+        fiche retirée d'une archive, archive devenue fiche seule... Les entrées
+        des fichiers hors du lot, encore présents, sont conservées.
+        """
+        entrees = self.entrees.get(exporteur, {})
+        orphelines = [
+            source for source, entree in entrees.items()
+            if source not in vues and (entree['fichier'] in fichiers or not os.path.exists(entree['fichier']))
+        ]
+        supprimes = 0
+        for source in orphelines:
+            supprimes += self._supprimer(entrees.pop(source)['sorties'])
+        return supprimes
+
+    def ecrire(self):
+        """Écrit le manifeste d'un bloc (fichier temporaire renommé)."""
+        os.makedirs(self.dossier, exist_ok=True)
+        temporaire = chemin_temporaire(self.chemin)
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump({'version': VERSION_MANIFESTE, 'exporteurs': self.entrees}, f,
+                      ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporaire, self.chemin)
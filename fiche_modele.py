@@ -0,0 +1,122 @@
+from collections import namedtuple
+
+from fiche_citations import Citations
+
+# Ordre d'affichage des sections, commun à tous les exporteurs HTML
+SECTIONS_ORDER = [
+    'titre', 'auteur', 'resume', 'plan', 'temporalites',
+    'pointsVue', 'personnages', 'registres', 'rythme', 'figures',
+    'procedes', 'lexique', 'citations', 'axes', 'tensions',
+    'lectures', 'intuitions', 'images', 'fonction', 'references',
+    'biographie', 'place', 'courants', 'contexte', 'reception',
+    'oeuvres', 'thematiques', 'convergence', 'glossaire', 'notes', 'schemas'
+]
+
+# Sections pouvant contenir des images collées en data: URL (décodées par fiche_images)
+SECTIONS_IMAGES = ('images', 'schemas')
+
+# Annexe facultative, ajoutée après les sections de la fiche
+CONCORDANCE = 'concordance'
+
+# Textes affichés pour les champs vides
+NON_RENSEIGNE = "Non renseigné"
+AUCUNE_CITATION = "Aucune citation renseignée"
+
+# Texte mis à la place d'une image qu'un moteur d'export ne sait pas inclure
+IMAGE_NON_PRISE_EN_CHARGE = "[Image non prise en charge ({mime})]"
+
+def titre_section(section):
+    """Retourne le titre affiché d'une section à partir de sa clé."""
+    return section.capitalize().replace('_', ' ')
+
+# Passage marqué d'un texte, entre les indices debut et fin : lien vers l'ancre
+# d'un terme du glossaire (definition : texte de la définition), ou terme défini
+# lui-même (definition None), qui porte l'ancre
+Marque = namedtuple('Marque', 'debut fin ancre definition')
+
+# Blocs de contenu d'une section ; marques : passages marqués, croissants, ou None
+Paragraphe = namedtuple('Paragraphe', 'texte marques', defaults=(None,))
+Citation = namedtuple('Citation', 'texte page marques', defaults=(None,))
+# Image extraite d'une data: URL, identifiée par le SHA-256 de son contenu
+Image = namedtuple('Image', 'mime empreinte donnees')
+# nature : 'champ' (champ vide), 'citation' (citation sans texte dans une liste
+# renseignée) ou 'citations' (aucune citation renseignée)
+Vide = namedtuple('Vide', 'nature')
+
+# valeur : valeur brute du JSON, conservée pour les clés de cache ; variante :
+# empreinte de ce qui, hors valeur, change le rendu (glossaire appliqué), ou None
+Section = namedtuple('Section', 'cle titre valeur blocs variante', defaults=(None,))
+
+# sections : dictionnaire clé -> Section, dans l'ordre du JSON
+Document = namedtuple('Document', 'titre auteur sections')
+
+def construire_blocs(cle, valeur):
+    """Analyse la valeur d'une section et retourne sa liste de blocs."""
+    if cle == 'citations':
+        citations = valeur if isinstance(valeur, Citations) else Citations(valeur)
+        if not citations.renseignees:
+            return [Vide('citations')]
+        return [
+            Citation(texte, page) if texte else Vide('citation')
+            for texte, page in citations.entrees
+        ]
+
+    if isinstance(valeur, str):
+        # isspace() évite la copie complète qu'imposerait strip() sur un grand texte
+        if not valeur or valeur.isspace():
+            return [Vide('champ')]
+        if cle in SECTIONS_IMAGES:
+            # Images collées : décodées une fois ici, puis rendues par chemin dans chaque format ;
+            # fiche_images (base64, hashlib) n'est importé que pour ces sections
+            from fiche_images import decouper
+            blocs = [
+                Image(*morceau) if isinstance(morceau, tuple) else Paragraphe(morceau)
+                for morceau in decouper(valeur)
+                if isinstance(morceau, tuple) or not morceau.isspace()
+            ]
+            return blocs or [Vide('champ')]
+        return [Paragraphe(valeur)]
+
+    # Comme les exports PDF/DOCX d'origine : toute valeur fausse (None, 0, False, [], {}) est non renseignée
+    if not valeur:
+        return [Vide('champ')]
+    return [Paragraphe(str(valeur))]
+
+def construire_concordance(citations):
+    """Construit l'annexe des citations triées par page."""
+    blocs = [
+        Citation(texte, page)
+        for page, textes in citations.concordance()
+        for texte in textes
+    ]
+    return Section(CONCORDANCE, titre_section(CONCORDANCE), None, blocs or [Vide('citations')])
+
+def construire_document(data, concordance=False, glossaire=False):
+    """Construit une seule fois le document intermédiaire d'une fiche, commun à tous les formats.
+
+    Les citations sont normalisées une seule fois (fiche_citations.Citations) ;
+    avec concordance=True, une annexe les reprend triées par page. Avec
+    glossaire=True, les termes du lexique et du glossaire sont liés à leur
+    définition dans les autres sections (fiche_glossaire).
+    """
+    sections = {}
+    citations = None
+    for cle, valeur in data.items():
+        if cle == 'citations':
+            citations = Citations(valeur)
+            sections[cle] = Section(cle, titre_section(cle), valeur, construire_blocs(cle, citations))
+        else:
+            sections[cle] = Section(cle, titre_section(cle), valeur, construire_blocs(cle, valeur))
+
+    if concordance:
+        sections[CONCORDANCE] = construire_concordance(citations or Citations(()))
+
+    if glossaire:
+        from fiche_glossaire import lier_glossaire
+        sections = lier_glossaire(sections)
+
+    return Document(titre=data.get('titre'), auteur=data.get('auteur'), sections=sections)
+
+def document(data):
+    """Retourne le document intermédiaire, qu'on reçoive une fiche JSON ou un document déjà construit."""
+    return data if isinstance(data, Document) else construire_document(data)
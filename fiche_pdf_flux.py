@@ -0,0 +1,871 @@
+import hashlib
+import importlib.util
+import struct
+import math
+import zlib
+from bisect import bisect_right
+from itertools import accumulate, repeat
+
+from fiche_images import infos_jpeg
+
+# Pillow n'est importé que pour les images que le PDF ne sait pas intégrer telles quelles
+PIL_AVAILABLE = importlib.util.find_spec('PIL') is not None
+
+# Unités et mise en page de FPDF (mm ; A4 défini en points, marges par défaut) : même rendu qu'avec fpdf
+K = 72 / 25.4
+PAGE_PT = (595.28, 841.89)
+PAGE = (PAGE_PT[0] / K, PAGE_PT[1] / K)
+MARGE = 28.35 / K
+MARGE_BAS = 15.0
+MARGE_CELLULE = MARGE / 10
+
+# Taille au-delà de laquelle le cache de largeurs de mots d'une police est vidé
+TAILLE_CACHE_MOTS = 100_000
+
+# Chasses Helvetica (AFM Adobe, millièmes de cadratin) pour chaque octet de l'encodage WinAnsi (cp1252)
+LARGEURS_HELVETICA = (278,) * 32 + (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278, 556, 556, 556,
+    556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556, 1015, 667, 667, 722, 722, 667,
+    611, 778, 722, 278, 500, 667, 556, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667,
+    667, 611, 278, 278, 278, 469, 556, 333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500,
+    222, 833, 556, 556, 556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+    350, 556, 350, 222, 556, 333, 1000, 556, 556, 333, 1000, 667, 333, 1000, 350, 611, 350, 350,
+    222, 222, 333, 333, 350, 556, 1000, 333, 1000, 500, 333, 944, 350, 500, 667, 278, 333, 556, 556,
+    556, 556, 260, 556, 333, 737, 370, 556, 584, 333, 737, 333, 400, 584, 333, 333, 333, 556, 537,
+    278, 333, 333, 365, 556, 834, 834, 834, 611, 667, 667, 667, 667, 667, 667, 1000, 722, 667, 667,
+    667, 667, 278, 278, 278, 278, 722, 722, 778, 778, 778, 778, 778, 584, 778, 722, 722, 722, 722,
+    667, 667, 611, 556, 556, 556, 556, 556, 556, 889, 500, 556, 556, 556, 556, 278, 278, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 584, 611, 556, 556, 556, 556, 500, 556, 500
+)
+LARGEURS_HELVETICA_GRAS = (278,) * 32 + (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278, 556, 556, 556,
+    556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611, 975, 722, 722, 722, 722, 667,
+    611, 778, 722, 278, 556, 722, 611, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667,
+    667, 611, 333, 278, 333, 584, 556, 333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556,
+    278, 889, 611, 611, 611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+    350, 556, 350, 278, 556, 500, 1000, 556, 556, 333, 1000, 667, 333, 1000, 350, 611, 350, 350,
+    278, 278, 500, 500, 350, 556, 1000, 333, 1000, 556, 333, 944, 350, 500, 667, 278, 333, 556, 556,
+    556, 556, 280, 556, 333, 737, 370, 556, 584, 333, 737, 333, 400, 584, 333, 333, 333, 611, 556,
+    278, 333, 333, 365, 556, 834, 834, 834, 611, 722, 722, 722, 722, 722, 722, 1000, 722, 667, 667,
+    667, 667, 278, 278, 278, 278, 722, 722, 778, 778, 778, 778, 778, 584, 778, 722, 722, 722, 722,
+    667, 667, 611, 556, 556, 556, 556, 556, 556, 889, 556, 556, 556, 556, 556, 278, 278, 278, 278,
+    611, 611, 611, 611, 611, 611, 611, 584, 611, 611, 611, 611, 611, 556, 611, 556
+)
+
+def _echapper(octets):
+    """Échappe une chaîne PDF littérale : antislash, parenthèses et retour chariot."""
+    return octets.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)').replace(b'\r', b'\\r')
+
+def _texte_info(texte):
+    """Chaîne de texte PDF (Info, signets) : UTF-16BE avec BOM, en hexadécimal."""
+    return '<FEFF' + texte.encode('utf-16-be').hex().upper() + '>'
+
+class PoliceStandard:
+    """Police Type 1 standard (non intégrée) encodée en WinAnsi, partagée par toutes les pages.
+
+    Les caractères hors cp1252 sont remplacés par '?'. La largeur des mots est
+    mise en cache : un texte courant n'emploie que quelques milliers de mots.
+    """
+
+    # Le mot d'espacement (Tw) ne s'applique qu'aux encodages à un octet
+    espacement_mots = True
+
+    def __init__(self, nom_base, largeurs):
+        self.nom_base = nom_base
+        self.largeurs = largeurs
+        self._mots = {}
+
+    def coder(self, texte):
+        return texte.encode('cp1252', 'replace')
+
+    def largeur(self, texte):
+        """Largeur d'un texte en millièmes de la taille de police."""
+        largeur = self._mots.get(texte)
+        if largeur is None:
+            if len(self._mots) >= TAILLE_CACHE_MOTS:
+                self._mots.clear()
+            largeur = self._mots[texte] = sum(map(self.largeurs.__getitem__, self.coder(texte)))
+        return largeur
+
+    def operande(self, texte):
+        """Opérande de Tj pour un texte."""
+        return b'(' + _echapper(self.coder(texte)) + b')'
+
+    def ecrire(self, ecrivain, numero):
+        """Écrit les objets de la police ; numero est celui du dictionnaire de police."""
+        ecrivain.objet(numero, (
+            f"<< /Type /Font /Subtype /Type1 /BaseFont /{self.nom_base} /Encoding /WinAnsiEncoding >>"
+        ).encode('ascii'))
+
+class _TableGlyphes(dict):
+    """Table de str.translate dont les caractères absents de la police donnent le glyphe 0."""
+
+    def __missing__(self, code):
+        return '0000'
+
+class PoliceTrueType:
+    """Police TrueType intégrée (Type0 / CIDFontType2, encodage Identity-H), tout Unicode.
+
+    Les métriques viennent du cache de fiche_polices : la coupure des lignes
+    n'emploie qu'une table de chasses par caractère, sans mesure par FPDF. Le
+    texte est encodé par numéro de glyphe ; à la fermeture, la police est
+    intégrée réduite aux glyphes employés (numéros conservés) avec une
+    table ToUnicode pour la copie et la recherche de texte.
+    """
+
+    # Tw ne s'applique pas à un encodage sur deux octets : la justification passe par TJ
+    espacement_mots = False
+
+    def __init__(self, chemin):
+        from fiche_polices import metriques
+
+        self.chemin = chemin
+        self.metriques = metriques(chemin)
+        self.chasses = self.metriques.chasses
+        self.cmap = self.metriques.cmap
+        self.defaut = self.metriques.defaut
+        # Table de str.translate : caractère vers numéro de glyphe en hexadécimal (glyphe 0 si absent)
+        self._hex = _TableGlyphes({code: f"{glyphe:04X}" for code, glyphe in self.cmap.items()})
+        self.caracteres = set()
+        self._mots = {}
+
+    def largeur(self, texte):
+        """Largeur d'un texte en millièmes de la taille de police."""
+        largeur = self._mots.get(texte)
+        if largeur is None:
+            if len(self._mots) >= TAILLE_CACHE_MOTS:
+                self._mots.clear()
+            largeur = self._mots[texte] = sum(map(self.chasses.get, texte, repeat(self.defaut)))
+        return largeur
+
+    def operande(self, texte):
+        """Opérande de Tj : numéros de glyphes en hexadécimal ; les caractères employés sont notés."""
+        self.caracteres.update(texte)
+        return b'<' + texte.translate(self._hex).encode('ascii') + b'>'
+
+    def operande_justifiee(self, texte, ajustement):
+        """Opérande de TJ : mots séparés par l'espace suivie d'un décalage (millièmes, négatif = plus large)."""
+        espace = f"{ajustement:.3f} ".encode('ascii') + self.operande(' ')
+        return b'[' + b' '.join(
+            self.operande(mot) if i == 0 else espace + b' ' + self.operande(mot)
+            for i, mot in enumerate(texte.split(' '))
+        ) + b']'
+
+    def _employes(self):
+        """Retourne {glyphe: caractère} des glyphes employés (premier caractère rencontré pour chacun)."""
+        employes = {}
+        for caractere in sorted(self.caracteres):
+            employes.setdefault(self.cmap.get(ord(caractere), 0), caractere)
+        return employes
+
+    def _largeurs(self, employes):
+        """Tableau /W : largeurs des glyphes employés, par suites de numéros consécutifs."""
+        morceaux = []
+        suite = []
+        precedent = None
+        for glyphe in sorted(employes):
+            if precedent is None or glyphe != precedent + 1:
+                if suite:
+                    morceaux.append(f"{suite[0]} [{' '.join(map(str, suite[1:]))}]")
+                suite = [glyphe]
+            suite.append(self.chasses.get(employes[glyphe], self.defaut) if glyphe else self.defaut)
+            precedent = glyphe
+        if suite:
+            morceaux.append(f"{suite[0]} [{' '.join(map(str, suite[1:]))}]")
+        return ' '.join(morceaux)
+
+    def _to_unicode(self, employes):
+        """CMap ToUnicode : numéro de glyphe vers texte UTF-16BE, par blocs de 100."""
+        paires = [
+            f"<{glyphe:04X}> <{employes[glyphe].encode('utf-16-be').hex().upper()}>"
+            for glyphe in sorted(employes) if glyphe
+        ]
+        blocs = []
+        for debut in range(0, len(paires), 100):
+            bloc = paires[debut:debut + 100]
+            blocs.append(f"{len(bloc)} beginbfchar\n" + '\n'.join(bloc) + "\nendbfchar")
+        return (
+            "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+            "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+            "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+            + '\n'.join(blocs)
+            + "\nendcmap\nCMapName currentdict /CMap defineresource pop\nend\nend"
+        ).encode('ascii')
+
+    def ecrire(self, ecrivain, numero):
+        """Écrit la police réduite, son descripteur, le CIDFont, la CMap ToUnicode et le dictionnaire Type0."""
+        from fiche_polices import sous_ensemble_en_cache
+
+        m = self.metriques
+        employes = self._employes()
+        glyphes = sorted(employes)
+        police = sous_ensemble_en_cache(self.chemin, glyphes)
+        # Étiquette de sous-ensemble : six majuscules dérivées des glyphes retenus
+        condensat = hashlib.sha256(struct.pack(f'>{len(glyphes)}H', *glyphes)).digest()
+        nom = ''.join(chr(65 + octet % 26) for octet in condensat[:6]) + '+' + m.nom
+        fichier, descripteur, cid, unicode = (ecrivain.reserver() for _ in range(4))
+
+        compresse = zlib.compress(police)
+        ecrivain.objet(fichier, (
+            f"<< /Filter /FlateDecode /Length {len(compresse)} /Length1 {len(police)} >>"
+        ).encode('ascii'), compresse)
+        ecrivain.objet(descripteur, (
+            f"<< /Type /FontDescriptor /FontName /{nom} /Flags 4 /FontBBox [{' '.join(map(str, m.boite))}] "
+            f"/ItalicAngle {m.italique:g} /Ascent {m.ascendante} /Descent {m.descendante} "
+            f"/CapHeight {m.hauteur_capitales} /StemV 80 /FontFile2 {fichier} 0 R >>"
+        ).encode('ascii'))
+        ecrivain.objet(cid, (
+            f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{nom} "
+            f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+            f"/FontDescriptor {descripteur} 0 R /DW {self.defaut} /W [{self._largeurs(employes)}] "
+            f"/CIDToGIDMap /Identity >>"
+        ).encode('ascii'))
+        cmap = zlib.compress(self._to_unicode(employes))
+        ecrivain.objet(unicode, f"<< /Filter /FlateDecode /Length {len(cmap)} >>".encode('ascii'), cmap)
+        ecrivain.objet(numero, (
+            f"<< /Type /Font /Subtype /Type0 /BaseFont /{nom} /Encoding /Identity-H "
+            f"/DescendantFonts [{cid} 0 R] /ToUnicode {unicode} 0 R >>"
+        ).encode('ascii'))
+
+def polices_truetype(fichiers):
+    """Retourne {style: PoliceTrueType} depuis des fichiers ((graisse, chemin), ...) de fiche_assets.
+
+    La graisse 400 donne le style '', la 700 le style 'B'. Retourne None s'il
+    manque l'une des deux ou si un fichier n'est pas une police TrueType : les
+    polices standard sont alors employées.
+    """
+    chemins = dict(fichiers)
+    if 400 not in chemins or 700 not in chemins:
+        return None
+    try:
+        return {'': PoliceTrueType(chemins[400]), 'B': PoliceTrueType(chemins[700])}
+    except (OSError, ValueError, struct.error):
+        return None
+
+# Polices standard par style ('' ou 'B'), équivalentes à l'Arial de FPDF
+POLICES_STANDARD = {
+    '': ('Helvetica', LARGEURS_HELVETICA),
+    'B': ('Helvetica-Bold', LARGEURS_HELVETICA_GRAS),
+}
+
+def _ajouter(a, b, bas, haut):
+    """Additionne octet par octet (modulo 256) deux entiers vus comme des suites d'octets.
+
+    bas et haut masquent les 7 bits faibles et le bit fort de chaque octet :
+    aucune retenue ne passe d'un octet à l'autre.
+    """
+    return ((a & bas) + (b & bas)) ^ ((a ^ b) & haut)
+
+def _defiltrer(brut, largeur, hauteur, bpp):
+    """Annule les filtres PNG (None, Sub, Up, Average, Paeth) d'une image 8 bits non entrelacée.
+
+    Sub et Up traitent une ligne entière à la fois sur des entiers ; Average et
+    Paeth, qui dépendent du pixel voisin déjà décodé, octet par octet.
+    """
+    pas = largeur * bpp
+    if len(brut) < (pas + 1) * hauteur:
+        raise ValueError("PNG tronqué")
+    bas = int.from_bytes(b'\x7f' * pas, 'little')
+    haut = int.from_bytes(b'\x80' * pas, 'little')
+    tout = (1 << (8 * pas)) - 1
+    pixels = bytearray()
+    precedente = bytes(pas)
+    for debut in range(0, (pas + 1) * hauteur, pas + 1):
+        filtre = brut[debut]
+        ligne = brut[debut + 1:debut + 1 + pas]
+        if filtre == 1:
+            # Somme préfixe par pixel : décalages de bpp, 2 bpp, 4 bpp... octets
+            x = int.from_bytes(ligne, 'little')
+            decalage = bpp
+            while decalage < pas:
+                x = _ajouter(x, (x << (8 * decalage)) & tout, bas, haut)
+                decalage *= 2
+            ligne = x.to_bytes(pas, 'little')
+        elif filtre == 2:
+            ligne = _ajouter(
+                int.from_bytes(ligne, 'little'), int.from_bytes(precedente, 'little'), bas, haut
+            ).to_bytes(pas, 'little')
+        elif filtre == 3:
+            ligne = bytearray(ligne)
+            for i in range(bpp):
+                ligne[i] = (ligne[i] + (precedente[i] >> 1)) & 0xFF
+            for i in range(bpp, pas):
+                ligne[i] = (ligne[i] + ((ligne[i - bpp] + precedente[i]) >> 1)) & 0xFF
+        elif filtre == 4:
+            ligne = bytearray(ligne)
+            for i in range(bpp):
+                ligne[i] = (ligne[i] + precedente[i]) & 0xFF
+            for i in range(bpp, pas):
+                a, b, c = ligne[i - bpp], precedente[i], precedente[i - bpp]
+                pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - 2 * c)
+                ligne[i] = (ligne[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+        elif filtre:
+            raise ValueError(f"filtre PNG inconnu : {filtre}")
+        pixels += ligne
+        precedente = ligne
+    return pixels
+
+def _separer_alpha(idat, largeur, hauteur, couleur):
+    """Décode sans Pillow un PNG 8 bits avec alpha ; retourne (couleurs, alpha)."""
+    try:
+        brut = zlib.decompress(idat)
+    except zlib.error as e:
+        raise ValueError(f"PNG illisible : {e}")
+    if couleur == 4:
+        pixels = _defiltrer(brut, largeur, hauteur, 2)
+        return pixels[0::2], pixels[1::2]
+    pixels = _defiltrer(brut, largeur, hauteur, 4)
+    teintes = bytearray(largeur * hauteur * 3)
+    for composante in range(3):
+        teintes[composante::3] = pixels[composante::4]
+    return teintes, pixels[3::4]
+
+def _pixels_alpha(donnees, couleur):
+    """Décode avec Pillow les couleurs et l'alpha d'un PNG (bien plus rapide que _defiltrer)."""
+    import io
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(donnees)) as img:
+            return img.convert('L' if couleur == 4 else 'RGB').tobytes(), img.getchannel('A').tobytes()
+    except OSError as e:
+        raise ValueError(f"PNG illisible : {e}")
+
+def _png_alpha(donnees, largeur, hauteur, couleur, idat):
+    """Décrit un PNG 8 bits avec canal alpha : couleurs sans prédicteur, alpha en masque (SMask).
+
+    Pillow décode l'image s'il est installé ; sinon, zlib et _defiltrer.
+    """
+    espace = '/DeviceGray' if couleur == 4 else '/DeviceRGB'
+    if PIL_AVAILABLE:
+        teintes, alpha = _pixels_alpha(donnees, couleur)
+    else:
+        teintes, alpha = _separer_alpha(idat, largeur, hauteur, couleur)
+    # Alpha entièrement opaque : pas de masque
+    masque = None if alpha.count(255) == len(alpha) else zlib.compress(alpha)
+    dictionnaire = (
+        f"/Width {largeur} /Height {hauteur} /ColorSpace {espace} /BitsPerComponent 8 /Filter /FlateDecode"
+    )
+    return largeur, hauteur, dictionnaire, zlib.compress(teintes), masque
+
+def _png(donnees):
+    """Décrit un PNG intégrable sans Pillow (IDAT avec prédicteurs, ou décodé s'il a un canal alpha).
+
+    Retourne None s'il faut le convertir (entrelacé, 16 bits, ou transparence
+    tRNS quand Pillow peut l'aplatir sur blanc). Sans Pillow, une transparence
+    tRNS est ignorée : les pixels transparents gardent leur couleur.
+    """
+    pos = 8
+    entete = palette = None
+    transparence = False
+    idat = []
+    while pos + 8 <= len(donnees):
+        longueur, nature = struct.unpack('>I4s', donnees[pos:pos + 8])
+        contenu = donnees[pos + 8:pos + 8 + longueur]
+        if nature == b'IHDR':
+            entete = struct.unpack('>IIBBBBB', contenu)
+        elif nature == b'PLTE':
+            palette = contenu
+        elif nature == b'tRNS':
+            transparence = True
+        elif nature == b'IDAT':
+            idat.append(contenu)
+        elif nature == b'IEND':
+            break
+        pos += 12 + longueur
+    if entete is None:
+        raise ValueError("PNG sans en-tête IHDR")
+    largeur, hauteur, profondeur, couleur, _, _, entrelace = entete
+    # Entrelacement et 16 bits demandent une conversion
+    if entrelace or profondeur > 8 or couleur not in (0, 2, 3, 4, 6):
+        return None
+    if couleur in (4, 6):
+        return _png_alpha(donnees, largeur, hauteur, couleur, b''.join(idat))
+    if transparence and PIL_AVAILABLE:
+        return None
+    if couleur == 3:
+        if not palette:
+            raise ValueError("PNG indexé sans palette PLTE")
+        espace = f"[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]"
+        composantes = 1
+    else:
+        espace = '/DeviceGray' if couleur == 0 else '/DeviceRGB'
+        composantes = 1 if couleur == 0 else 3
+    dictionnaire = (
+        f"/Width {largeur} /Height {hauteur} /ColorSpace {espace} /BitsPerComponent {profondeur} "
+        f"/Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors {composantes} "
+        f"/BitsPerComponent {profondeur} /Columns {largeur} >>"
+    )
+    return largeur, hauteur, dictionnaire, b''.join(idat), None
+
+def _convertir(donnees):
+    """Convertit une image quelconque en RVB brut compressé (transparence aplatie sur blanc)."""
+    if not PIL_AVAILABLE:
+        raise ValueError("image à convertir (GIF, WebP, PNG 16 bits ou entrelacé...) : Pillow est requis")
+
+    import io
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(donnees)) as img:
+            img = img.convert('RGBA')
+            fond = Image.new('RGB', img.size, (255, 255, 255))
+            fond.paste(img, mask=img.getchannel('A'))
+    except OSError as e:
+        raise ValueError(f"image illisible : {e}")
+    largeur, hauteur = fond.size
+    dictionnaire = (
+        f"/Width {largeur} /Height {hauteur} /ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode"
+    )
+    return largeur, hauteur, dictionnaire, zlib.compress(fond.tobytes()), None
+
+def decrire_image(donnees):
+    """Retourne (largeur, hauteur, entrées du dictionnaire XObject, flux, masque) d'une image.
+
+    masque est le flux compressé de l'alpha (SMask en niveaux de gris), ou
+    None pour une image opaque. Lève ValueError pour une image illisible.
+    """
+    try:
+        if donnees[:2] == b'\xff\xd8':
+            largeur, hauteur, composantes = infos_jpeg(donnees)
+            espace = {1: '/DeviceGray', 3: '/DeviceRGB', 4: '/DeviceCMYK'}[composantes]
+            decode = ' /Decode [1 0 1 0 1 0 1 0]' if composantes == 4 else ''
+            dictionnaire = (
+                f"/Width {largeur} /Height {hauteur} /ColorSpace {espace} /BitsPerComponent 8"
+                f"{decode} /Filter /DCTDecode"
+            )
+            return largeur, hauteur, dictionnaire, donnees, None
+        if donnees[:8] == b'\x89PNG\r\n\x1a\n':
+            description = _png(donnees)
+            if description is not None:
+                return description
+    except (struct.error, KeyError, zlib.error) as e:
+        raise ValueError(f"image illisible : {e}")
+    return _convertir(donnees)
+
+class EcrivainPDF:
+    """Écriture incrémentale d'un PDF, page par page.
+
+    Chaque objet est écrit dans le fichier dès qu'il est produit : une page
+    terminée (flux de contenu compressé et dictionnaire de page) ne reste pas
+    en mémoire, pas plus qu'une image une fois intégrée. Les polices et le
+    dictionnaire de ressources sont partagés par toutes les pages ; les
+    polices (réduites aux glyphes employés), l'arbre des pages, le catalogue,
+    la table xref et le trailer sont écrits à la fermeture. Seuls les
+    décalages des objets, les numéros des pages et les signets sont conservés
+    jusque-là.
+
+    Les liens internes et les signets visent une destination (destination()) :
+    une page et une hauteur, valables même une fois la page écrite.
+
+    polices donne la police de chaque style ('' et 'B') : PoliceTrueType pour
+    un texte Unicode, polices standard WinAnsi (POLICES_STANDARD) par défaut.
+
+    La mise en page reprend celle de FPDF 1.7 (unités en mm, cellules, lignes
+    justifiées de multi_cellule, saut de page automatique) : le PDF est
+    identique à l'œil à celui de creer_pdf avec fpdf.
+    """
+
+    # Objets réservés, écrits à la fermeture
+    CATALOGUE, PAGES, RESSOURCES = 1, 2, 3
+
+    def __init__(self, chemin, titre=None, polices=None):
+        self.fichier = open(chemin, 'wb')
+        self.titre = titre
+        self.polices = polices or {
+            style: PoliceStandard(nom, largeurs) for style, (nom, largeurs) in POLICES_STANDARD.items()
+        }
+        self.decalages = [0, 0, 0, 0]
+        self.numeros_polices = {}
+        self.images = {}
+        self.pages = []
+        self.page_courante = None
+        self.liens = []
+        self.signets = []
+        self.operations = None
+        self.x = self.y = MARGE
+        self.police = None
+        self.style = ''
+        self.taille = 12
+        self.police_page = None
+        self.ws = 0
+        self.declencheur = PAGE[1] - MARGE_BAS
+        self.fichier.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.fermer()
+        else:
+            self.fichier.close()
+        return False
+
+    # Objets
+
+    def reserver(self):
+        """Réserve et retourne un numéro d'objet."""
+        self.decalages.append(0)
+        return len(self.decalages) - 1
+
+    def objet(self, numero, contenu, flux=None):
+        """Écrit un objet (et son flux éventuel) à la position courante du fichier."""
+        self.decalages[numero] = self.fichier.tell()
+        self.fichier.write(f"{numero} 0 obj\n".encode('ascii'))
+        self.fichier.write(contenu)
+        if flux is not None:
+            self.fichier.write(b'\nstream\n')
+            self.fichier.write(flux)
+            self.fichier.write(b'\nendstream')
+        self.fichier.write(b'\nendobj\n')
+
+    # Pages
+
+    def ajouter_page(self):
+        """Termine la page en cours et en commence une nouvelle."""
+        self.terminer_page()
+        self.operations = []
+        self.x = self.y = MARGE
+        self.police_page = None
+        if self.ws > 0 and self.police.espacement_mots:
+            self.operations.append(f"{self.ws * K:.3f} Tw".encode('ascii'))
+
+    def terminer_page(self):
+        """Compresse et écrit la page en cours ; elle ne reste pas en mémoire."""
+        if self.operations is None:
+            return
+        contenu = zlib.compress(b'\n'.join(self.operations))
+        self.operations = None
+        numero_contenu = self.reserver()
+        self.objet(numero_contenu, f"<< /Filter /FlateDecode /Length {len(contenu)} >>".encode('ascii'), contenu)
+        numero_page = self.page_courante or self.reserver()
+        annotations = f" /Annots [{' '.join(self.liens)}]" if self.liens else ''
+        self.objet(numero_page, (
+            f"<< /Type /Page /Parent {self.PAGES} 0 R /Resources {self.RESSOURCES} 0 R "
+            f"/Contents {numero_contenu} 0 R{annotations} >>"
+        ).encode('ascii'))
+        self.pages.append(numero_page)
+        self.page_courante = None
+        self.liens = []
+
+    @property
+    def page(self):
+        """Numéro (à partir de 1) de la page en cours, dans l'ordre d'écriture."""
+        return len(self.pages) + (self.operations is not None)
+
+    def placer_en_tete(self, nombre):
+        """Déplace les nombre dernières pages en tête du document (sommaire écrit après le contenu)."""
+        self.terminer_page()
+        if nombre:
+            self.pages = self.pages[-nombre:] + self.pages[:-nombre]
+
+    # Reprise
+
+    def marque(self):
+        """Retourne l'état courant du document, auquel revenir() le ramène.
+
+        Sert à retirer une partie dont l'écriture a échoué (fiche d'une
+        anthologie) sans recommencer tout le document.
+        """
+        return (
+            self.fichier.tell(), len(self.decalages), dict(self.numeros_polices), dict(self.images),
+            len(self.pages), self.page_courante, list(self.liens), len(self.signets),
+            None if self.operations is None else list(self.operations),
+            self.x, self.y, self.police, self.style, self.taille, self.police_page, self.ws,
+        )
+
+    def revenir(self, marque):
+        """Ramène le document à une marque : objets, pages, images et signets écrits depuis sont retirés.
+
+        Le fichier est tronqué à sa taille d'alors. Les glyphes employés depuis
+        restent dans les polices intégrées, sans effet sur le rendu.
+        """
+        (position, objets, numeros_polices, images, pages, self.page_courante, liens, signets,
+         operations, self.x, self.y, self.police, self.style, self.taille, self.police_page, self.ws) = marque
+        self.fichier.seek(position)
+        self.fichier.truncate()
+        del self.decalages[objets:]
+        del self.pages[pages:]
+        del self.signets[signets:]
+        self.numeros_polices = dict(numeros_polices)
+        self.images = dict(images)
+        self.liens = list(liens)
+        self.operations = None if operations is None else list(operations)
+
+    # Navigation
+
+    def destination(self, hauteur=0):
+        """Retourne la position courante comme destination de lien ou de signet.
+
+        Si les hauteur mm qui suivent ne tiennent pas sur la page, la destination
+        est le haut de la page suivante, comme le serait le texte. Le numéro
+        d'objet de la page en cours est réservé dès maintenant : une page déjà
+        écrite peut ainsi être désignée sans être relue.
+        """
+        if self.operations is None or self.y + hauteur > self.declencheur:
+            self.ajouter_page()
+        if self.page_courante is None:
+            self.page_courante = self.reserver()
+        return self.page_courante, (PAGE[1] - self.y) * K
+
+    def signet(self, titre, niveau=0, destination=None, hauteur=0):
+        """Ajoute un signet (entrée du panneau de navigation), par défaut vers la position courante.
+
+        Un signet de niveau n+1 est rangé sous le dernier signet de niveau n.
+        """
+        self.signets.append((titre, niveau, destination or self.destination(hauteur)))
+
+    def lien(self, x, y, w, h, destination):
+        """Rend cliquable le rectangle (x, y, w, h) de la page en cours, vers une destination."""
+        if self.operations is None:
+            self.ajouter_page()
+        page, hauteur = destination
+        self.liens.append((
+            f"<< /Type /Annot /Subtype /Link /Rect [{x * K:.2f} {(PAGE[1] - y - h) * K:.2f} "
+            f"{(x + w) * K:.2f} {(PAGE[1] - y) * K:.2f}] /Border [0 0 0] /Dest [{page} 0 R /XYZ 0 {hauteur:.2f} null] >>"
+        ))
+
+    def _ecrire_signets(self):
+        """Écrit l'arbre des signets et retourne le numéro de sa racine (None sans signet)."""
+        if not self.signets:
+            return None
+        racine = self.reserver()
+        numeros = [self.reserver() for _ in self.signets]
+        enfants = {None: []}
+        parents = []
+        pile = []
+        for indice, (_, niveau, _) in enumerate(self.signets):
+            while pile and self.signets[pile[-1]][1] >= niveau:
+                pile.pop()
+            parent = pile[-1] if pile else None
+            parents.append(parent)
+            enfants[parent].append(indice)
+            enfants[indice] = []
+            pile.append(indice)
+
+        for freres in enfants.values():
+            for rang, indice in enumerate(freres):
+                titre, _, (page, hauteur) = self.signets[indice]
+                parent = parents[indice]
+                champs = [
+                    f"/Title {_texte_info(titre)}",
+                    f"/Parent {racine if parent is None else numeros[parent]} 0 R",
+                    f"/Dest [{page} 0 R /XYZ 0 {hauteur:.2f} null]",
+                ]
+                if rang:
+                    champs.append(f"/Prev {numeros[freres[rang - 1]]} 0 R")
+                if rang + 1 < len(freres):
+                    champs.append(f"/Next {numeros[freres[rang + 1]]} 0 R")
+                if enfants[indice]:
+                    # Signets fermés : seuls les enfants directs apparaissent à l'ouverture
+                    champs.append(f"/First {numeros[enfants[indice][0]]} 0 R "
+                                  f"/Last {numeros[enfants[indice][-1]]} 0 R /Count -{len(enfants[indice])}")
+                self.objet(numeros[indice], f"<< {' '.join(champs)} >>".encode('ascii'))
+
+        premiers = enfants[None]
+        self.objet(racine, (
+            f"<< /Type /Outlines /First {numeros[premiers[0]]} 0 R /Last {numeros[premiers[-1]]} 0 R "
+            f"/Count {len(premiers)} >>"
+        ).encode('ascii'))
+        return racine
+
+    # Texte
+
+    def choisir_police(self, style, taille):
+        """Choisit la police du texte suivant ('' ou 'B') et sa taille en points."""
+        self.style = style
+        self.police = self.polices[style]
+        self.taille = taille
+        if style not in self.numeros_polices:
+            self.numeros_polices[style] = self.reserver()
+
+    @property
+    def taille_mm(self):
+        return self.taille / K
+
+    def largeur_texte(self, texte):
+        """Largeur d'un texte en mm dans la police courante."""
+        return self.police.largeur(texte) * self.taille_mm / 1000
+
+    def cellule(self, w, h, texte='', ln=0, align=''):
+        """Écrit une ligne de texte dans une cellule sans bordure (FPDF.cell)."""
+        if self.y + h > self.declencheur or self.operations is None:
+            x = self.x
+            self.ajouter_page()
+            self.x = x
+        if w == 0:
+            w = PAGE[0] - MARGE - self.x
+        if texte:
+            if align == 'C':
+                dx = (w - self.largeur_texte(texte)) / 2
+            elif align == 'R':
+                dx = w - MARGE_CELLULE - self.largeur_texte(texte)
+            else:
+                dx = MARGE_CELLULE
+            if self.police_page != (self.style, self.taille):
+                self.police_page = (self.style, self.taille)
+                self.operations.append(
+                    f"BT /F{self.numeros_polices[self.style]} {self.taille:.2f} Tf ET".encode('ascii')
+                )
+            position = (
+                f"BT {(self.x + dx) * K:.2f} {(PAGE[1] - (self.y + .5 * h + .3 * self.taille_mm)) * K:.2f} Td "
+            ).encode('ascii')
+            if self.ws and not self.police.espacement_mots:
+                ajustement = -(self.ws * K) * 1000 / self.taille
+                self.operations.append(position + self.police.operande_justifiee(texte, ajustement) + b' TJ ET')
+            else:
+                self.operations.append(position + self.police.operande(texte) + b' Tj ET')
+        if ln > 0:
+            self.y += h
+            if ln == 1:
+                self.x = MARGE
+        else:
+            self.x += w
+
+    def _espacement(self, ws):
+        if ws != self.ws:
+            self.ws = ws
+            if self.police.espacement_mots:
+                self.operations.append(f"{ws * K:.3f} Tw".encode('ascii'))
+
+    def multi_cellule(self, w, h, texte, align='J'):
+        """Écrit un texte sur plusieurs lignes, coupées aux espaces (FPDF.multi_cell).
+
+        Les coupures sont celles de FPDF, mais calculées sur les sommes cumulées
+        des largeurs des mots (en cache dans la police) : la fin de chaque ligne
+        est trouvée par dichotomie, sans boucle Python par caractère ni par mot.
+        Seul un mot plus large que la ligne est parcouru au caractère. Les lignes
+        pleines sont justifiées par l'espacement des mots.
+        """
+        if self.operations is None:
+            self.ajouter_page()
+        if w == 0:
+            w = PAGE[0] - MARGE - self.x
+        largeur_max = (w - 2 * MARGE_CELLULE) * 1000 / self.taille_mm
+        # Les largeurs sont entières : comparer à la partie entière est exact
+        limite = math.floor(largeur_max)
+        texte = texte.replace('\r', '')
+        if texte.endswith('\n'):
+            texte = texte[:-1]
+        police = self.police
+        espace = police.largeur(' ')
+        for ligne in texte.split('\n'):
+            mots = ligne.split(' ')
+            largeurs = list(map(police.largeur, mots))
+            # cumul[k] : largeur des k premiers mots, chacun suivi d'une espace
+            cumul = [0]
+            cumul += accumulate(largeur + espace for largeur in largeurs)
+            premier, largeur_premier = mots[0], largeurs[0]
+            i, n = 0, len(mots)
+            while True:
+                if largeur_premier > limite:
+                    # Mot plus large que la ligne : coupure au caractère qui déborde
+                    largeur = coupure = 0
+                    for caractere in premier:
+                        largeur += police.largeur(caractere)
+                        if largeur > largeur_max:
+                            break
+                        coupure += 1
+                    coupure = coupure or 1
+                    self._espacement(0)
+                    self.cellule(w, h, premier[:coupure], 2, align)
+                    premier = premier[coupure:]
+                    largeur_premier = police.largeur(premier)
+                    continue
+                # Premier mot j qui déborde : cumul[j + 1] - espace dépasse le seuil
+                decalage = largeurs[i] - largeur_premier
+                j = bisect_right(cumul, cumul[i] + decalage + limite + espace, i + 2) - 1
+                if j >= n:
+                    break
+                # Coupure à l'espace qui précède le mot j : il commence la ligne suivante
+                if align == 'J':
+                    largeur_avant = cumul[j] - cumul[i] - decalage - espace
+                    self._espacement((largeur_max - largeur_avant) / 1000 * self.taille_mm / (j - i - 1)
+                                     if j - i > 1 else 0)
+                self.cellule(w, h, ' '.join([premier, *mots[i + 1:j]]), 2, align)
+                i = j
+                premier, largeur_premier = mots[i], largeurs[i]
+            self._espacement(0)
+            self.cellule(w, h, ' '.join([premier, *mots[i + 1:]]), 2, align)
+        self.x = MARGE
+
+    def saut(self, h):
+        """Passe à la ligne suivante, h mm plus bas (FPDF.ln)."""
+        self.x = MARGE
+        self.y += h
+
+    # Images
+
+    def image(self, chemin, w):
+        """Insère une image de largeur w mm à la position courante (FPDF.image).
+
+        Chaque fichier n'est intégré qu'une fois, au premier appel, puis
+        référencé par toutes les pages qui l'affichent ; sa transparence
+        éventuelle devient un masque (SMask). Lève ValueError, sans rien
+        écrire, pour une image illisible.
+        """
+        if chemin not in self.images:
+            with open(chemin, 'rb') as f:
+                largeur, hauteur, dictionnaire, flux, masque = decrire_image(f.read())
+            if masque is not None:
+                numero_masque = self.reserver()
+                self.objet(numero_masque, (
+                    f"<< /Type /XObject /Subtype /Image /Width {largeur} /Height {hauteur} "
+                    f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(masque)} >>"
+                ).encode('ascii'), masque)
+                dictionnaire += f" /SMask {numero_masque} 0 R"
+            numero = self.reserver()
+            self.objet(numero, (
+                f"<< /Type /XObject /Subtype /Image {dictionnaire} /Length {len(flux)} >>"
+            ).encode('ascii'), flux)
+            self.images[chemin] = (len(self.images) + 1, numero, largeur, hauteur)
+        indice, _, largeur, hauteur = self.images[chemin]
+        h = w * hauteur / largeur
+        if self.operations is None or self.y + h > self.declencheur:
+            self.ajouter_page()
+        self.operations.append((
+            f"q {w * K:.2f} 0 0 {h * K:.2f} {self.x * K:.2f} {(PAGE[1] - (self.y + h)) * K:.2f} cm /I{indice} Do Q"
+        ).encode('ascii'))
+        self.y += h
+
+    # Fermeture
+
+    def fermer(self):
+        """Écrit les objets réservés, la table xref et le trailer, puis ferme le fichier."""
+        if self.fichier.closed:
+            return
+        if self.operations is None and not self.pages:
+            self.ajouter_page()
+        self.terminer_page()
+
+        # Polices écrites en dernier : une police intégrée n'est réduite qu'une fois tous les glyphes connus
+        for style, numero in self.numeros_polices.items():
+            self.polices[style].ecrire(self, numero)
+        polices = ' '.join(f"/F{numero} {numero} 0 R" for numero in self.numeros_polices.values())
+        images = ' '.join(f"/I{indice} {numero} 0 R" for indice, numero, _, _ in self.images.values())
+        self.objet(self.RESSOURCES, (
+            f"<< /ProcSet [/PDF /Text /ImageB /ImageC /ImageI] /Font << {polices} >> /XObject << {images} >> >>"
+        ).encode('ascii'))
+        enfants = ' '.join(f"{numero} 0 R" for numero in self.pages)
+        self.objet(self.PAGES, (
+            f"<< /Type /Pages /Kids [{enfants}] /Count {len(self.pages)} "
+            f"/MediaBox [0 0 {PAGE_PT[0]:.2f} {PAGE_PT[1]:.2f}] >>"
+        ).encode('ascii'))
+        signets = self._ecrire_signets()
+        navigation = f" /Outlines {signets} 0 R /PageMode /UseOutlines" if signets else ''
+        self.objet(self.CATALOGUE, f"<< /Type /Catalog /Pages {self.PAGES} 0 R{navigation} >>".encode('ascii'))
+        info = self.reserver()
+        titre = f" /Title {_texte_info(self.titre)}" if self.titre else ''
+        self.objet(info, f"<< /Producer (fiche_pdf_flux){titre} >>".encode('ascii'))
+
+        debut_xref = self.fichier.tell()
+        entrees = [f"xref\n0 {len(self.decalages)}\n0000000000 65535 f \n"]
+        entrees.extend(f"{decalage:010d} 00000 n \n" for decalage in self.decalages[1:])
+        self.fichier.write(''.join(entrees).encode('ascii'))
+        self.fichier.write((
+            f"trailer\n<< /Size {len(self.decalages)} /Root {self.CATALOGUE} 0 R /Info {info} 0 R >>\n"
+            f"startxref\n{debut_xref}\n%%EOF\n"
+        ).encode('ascii'))
+        self.fichier.close()
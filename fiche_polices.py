@@ -0,0 +1,292 @@
+import functools
+import hashlib
+import marshal
+import os
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+# Cache disque des métriques et sous-ensembles de polices : variable FICHE_CACHE_POLICES ou ~/.cache
+DOSSIER_CACHE = os.environ.get('FICHE_CACHE_POLICES') or os.path.join(
+    os.path.expanduser('~'), '.cache', 'fiche_lecture', 'polices'
+)
+
+# Version du format des métriques en cache, à incrémenter quand lire_metriques change
+VERSION_METRIQUES = 1
+
+# Tables conservées dans un sous-ensemble destiné à un CIDFontType2 (ni cmap, ni noms de glyphes)
+TABLES_SOUS_ENSEMBLE = (b'OS/2', b'cvt ', b'fpgm', b'glyf', b'head', b'hhea', b'hmtx', b'loca', b'maxp', b'prep')
+
+# Métriques d'une police TrueType, en millièmes de cadratin (sauf unites)
+Metriques = namedtuple(
+    'Metriques', 'nom unites ascendante descendante boite hauteur_capitales italique chasses cmap defaut'
+)
+
+def _tables(donnees):
+    """Retourne le répertoire des tables d'une police : {étiquette: (décalage, longueur)}."""
+    version, nombre = struct.unpack('>4sH', donnees[:6])
+    if version == b'OTTO':
+        raise ValueError("police OpenType/CFF non prise en charge (TrueType attendue)")
+    if version not in (b'\x00\x01\x00\x00', b'true'):
+        raise ValueError("fichier TrueType invalide")
+    tables = {}
+    for i in range(nombre):
+        etiquette, _, decalage, longueur = struct.unpack('>4sIII', donnees[12 + 16 * i:28 + 16 * i])
+        tables[etiquette] = (decalage, longueur)
+    return tables
+
+def _table(donnees, tables, etiquette):
+    decalage, longueur = tables[etiquette]
+    return donnees[decalage:decalage + longueur]
+
+def _lire_cmap(table):
+    """Retourne {code Unicode: glyphe} depuis la meilleure sous-table (format 12, sinon 4)."""
+    nombre = struct.unpack('>H', table[2:4])[0]
+    sous_tables = {}
+    for i in range(nombre):
+        plateforme, encodage, decalage = struct.unpack('>HHI', table[4 + 8 * i:12 + 8 * i])
+        sous_tables[(plateforme, encodage)] = decalage
+    cmap = {}
+    for cle in ((3, 10), (0, 4), (3, 1), (0, 3), (0, 1), (0, 0)):
+        decalage = sous_tables.get(cle)
+        if decalage is None:
+            continue
+        format_table = struct.unpack('>H', table[decalage:decalage + 2])[0]
+        if format_table == 12:
+            groupes = struct.unpack('>I', table[decalage + 12:decalage + 16])[0]
+            for i in range(groupes):
+                debut, fin, glyphe = struct.unpack('>III', table[decalage + 16 + 12 * i:decalage + 28 + 12 * i])
+                for code in range(debut, fin + 1):
+                    cmap[code] = glyphe + code - debut
+            return cmap
+        if format_table == 4:
+            segments = struct.unpack('>H', table[decalage + 6:decalage + 8])[0] // 2
+            fins = decalage + 14
+            debuts = fins + 2 * segments + 2
+            deltas = debuts + 2 * segments
+            plages = deltas + 2 * segments
+            for i in range(segments):
+                fin, = struct.unpack('>H', table[fins + 2 * i:fins + 2 * i + 2])
+                debut, = struct.unpack('>H', table[debuts + 2 * i:debuts + 2 * i + 2])
+                delta, = struct.unpack('>h', table[deltas + 2 * i:deltas + 2 * i + 2])
+                plage, = struct.unpack('>H', table[plages + 2 * i:plages + 2 * i + 2])
+                for code in range(debut, fin + 1):
+                    if code == 0xFFFF:
+                        break
+                    if plage == 0:
+                        glyphe = (code + delta) & 0xFFFF
+                    else:
+                        position = plages + 2 * i + plage + 2 * (code - debut)
+                        glyphe, = struct.unpack('>H', table[position:position + 2])
+                        if glyphe:
+                            glyphe = (glyphe + delta) & 0xFFFF
+                    if glyphe:
+                        cmap[code] = glyphe
+            return cmap
+    raise ValueError("police sans table cmap Unicode")
+
+def _lire_nom(table):
+    """Retourne le nom PostScript (nameID 6) d'une police."""
+    nombre, debut_chaines = struct.unpack('>2xHH', table[:6])
+    for i in range(nombre):
+        plateforme, _, _, identifiant, longueur, decalage = struct.unpack('>6H', table[6 + 12 * i:18 + 12 * i])
+        if identifiant != 6:
+            continue
+        brut = table[debut_chaines + decalage:debut_chaines + decalage + longueur]
+        nom = brut.decode('utf-16-be' if plateforme in (0, 3) else 'latin-1', 'replace')
+        return ''.join(c for c in nom if c.isalnum() or c in '-_') or 'Police'
+    return 'Police'
+
+def lire_metriques(chemin):
+    """Lit les métriques d'une police TrueType : noms, chasses par caractère, cmap.
+
+    Les chasses sont exprimées en millièmes de cadratin et indexées par
+    caractère (str), prêtes pour la coupure des lignes ; cmap associe chaque
+    code Unicode à son glyphe. Lève ValueError pour une police non TrueType.
+    """
+    with open(chemin, 'rb') as f:
+        donnees = f.read()
+    tables = _tables(donnees)
+    head = _table(donnees, tables, b'head')
+    unites, = struct.unpack('>H', head[18:20])
+    boite = struct.unpack('>4h', head[36:44])
+    hhea = _table(donnees, tables, b'hhea')
+    ascendante, descendante = struct.unpack('>hh', hhea[4:8])
+    nombre_metriques, = struct.unpack('>H', hhea[34:36])
+    nombre_glyphes, = struct.unpack('>H', _table(donnees, tables, b'maxp')[4:6])
+
+    avances = array('H', _table(donnees, tables, b'hmtx')[:4 * nombre_metriques])
+    if sys.byteorder == 'little':
+        avances.byteswap()
+    avances = avances[::2]
+    avances.extend([avances[-1]] * (nombre_glyphes - nombre_metriques))
+
+    hauteur_capitales = ascendante
+    if b'OS/2' in tables:
+        os2 = _table(donnees, tables, b'OS/2')
+        if struct.unpack('>H', os2[:2])[0] >= 2 and len(os2) >= 90:
+            hauteur_capitales, = struct.unpack('>h', os2[88:90])
+    italique = 0
+    if b'post' in tables:
+        italique = struct.unpack('>i', _table(donnees, tables, b'post')[4:8])[0] / 65536
+
+    def milliemes(valeur):
+        return round(valeur * 1000 / unites)
+
+    cmap = _lire_cmap(_table(donnees, tables, b'cmap'))
+    chasses = {chr(code): milliemes(avances[glyphe]) for code, glyphe in cmap.items()
+               if glyphe < nombre_glyphes and code < 0x110000}
+    return Metriques(
+        _lire_nom(_table(donnees, tables, b'name')) if b'name' in tables else 'Police',
+        unites, milliemes(ascendante), milliemes(descendante), [milliemes(v) for v in boite],
+        milliemes(hauteur_capitales), italique, chasses,
+        {code: glyphe for code, glyphe in cmap.items() if glyphe < nombre_glyphes},
+        milliemes(avances[0]),
+    )
+
+def _cle_fichier(chemin):
+    """Identifie une version d'un fichier de police (chemin, taille, date) sans le lire."""
+    infos = os.stat(chemin)
+    return hashlib.sha256(
+        f"{os.path.abspath(chemin)}\0{infos.st_size}\0{infos.st_mtime_ns}".encode('utf-8')
+    ).hexdigest()[:32]
+
+def _ecrire_cache(chemin, contenu):
+    """Écrit un fichier du cache par renommage atomique : plusieurs processus peuvent le partager."""
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    temporaire = f"{chemin}.{os.getpid()}.tmp"
+    with open(temporaire, 'wb') as f:
+        f.write(contenu)
+    os.replace(temporaire, chemin)
+
+@functools.lru_cache(maxsize=16)
+def metriques(chemin, dossier_cache=None):
+    """Retourne les métriques d'une police, lues une fois par processus et conservées sur disque.
+
+    Le cache disque (dossier_cache, par défaut DOSSIER_CACHE) évite de relire la
+    police d'une exécution à l'autre. Il est au format marshal : deux à trois
+    fois plus rapide à charger que l'analyse de la police, et sans exécution
+    de code comme pickle. Un cache illisible ou d'une autre version est ignoré.
+    """
+    fichier_cache = os.path.join(dossier_cache or DOSSIER_CACHE, f"{_cle_fichier(chemin)}.metriques")
+    try:
+        with open(fichier_cache, 'rb') as f:
+            version, champs = marshal.loads(f.read())
+        if version == VERSION_METRIQUES:
+            return Metriques(*champs)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    resultat = lire_metriques(chemin)
+    try:
+        _ecrire_cache(fichier_cache, marshal.dumps((VERSION_METRIQUES, tuple(resultat))))
+    except OSError:
+        pass
+    return resultat
+
+def _composants(glyphe):
+    """Retourne les glyphes référencés par un glyphe composite (vide pour un glyphe simple)."""
+    if len(glyphe) < 10 or struct.unpack('>h', glyphe[:2])[0] >= 0:
+        return []
+    composants = []
+    pos = 10
+    while True:
+        drapeaux, indice = struct.unpack('>HH', glyphe[pos:pos + 4])
+        composants.append(indice)
+        pos += 4 + (4 if drapeaux & 0x0001 else 2)
+        if drapeaux & 0x0008:
+            pos += 2
+        elif drapeaux & 0x0040:
+            pos += 4
+        elif drapeaux & 0x0080:
+            pos += 8
+        if not drapeaux & 0x0020:
+            return composants
+
+def _somme(donnees):
+    donnees += b'\0' * (-len(donnees) % 4)
+    return sum(struct.unpack(f'>{len(donnees) // 4}I', donnees)) & 0xFFFFFFFF
+
+def sous_ensemble(chemin, glyphes):
+    """Retourne une police TrueType réduite aux glyphes donnés, numéros de glyphes conservés.
+
+    Les autres glyphes restent présents mais vides : le texte encodé par numéro
+    de glyphe (Identity-H) n'a pas à être renuméroté. Les composants des
+    glyphes composites et le glyphe 0 sont toujours conservés.
+    """
+    with open(chemin, 'rb') as f:
+        donnees = f.read()
+    tables = _tables(donnees)
+    head = bytearray(_table(donnees, tables, b'head'))
+    format_long, = struct.unpack('>h', head[50:52])
+    nombre_glyphes, = struct.unpack('>H', _table(donnees, tables, b'maxp')[4:6])
+    loca = _table(donnees, tables, b'loca')
+    if format_long:
+        positions = struct.unpack(f'>{nombre_glyphes + 1}I', loca[:4 * (nombre_glyphes + 1)])
+    else:
+        positions = [2 * p for p in struct.unpack(f'>{nombre_glyphes + 1}H', loca[:2 * (nombre_glyphes + 1)])]
+    glyf = _table(donnees, tables, b'glyf')
+
+    a_garder = set()
+    a_traiter = [0] + [g for g in glyphes if 0 <= g < nombre_glyphes]
+    while a_traiter:
+        glyphe = a_traiter.pop()
+        if glyphe in a_garder:
+            continue
+        a_garder.add(glyphe)
+        a_traiter.extend(_composants(glyf[positions[glyphe]:positions[glyphe + 1]]))
+
+    nouveau_glyf = bytearray()
+    nouvelle_loca = array('I')
+    for glyphe in range(nombre_glyphes):
+        nouvelle_loca.append(len(nouveau_glyf))
+        if glyphe in a_garder:
+            nouveau_glyf += glyf[positions[glyphe]:positions[glyphe + 1]]
+            nouveau_glyf += b'\0' * (-len(nouveau_glyf) % 4)
+    nouvelle_loca.append(len(nouveau_glyf))
+    if sys.byteorder == 'little':
+        nouvelle_loca.byteswap()
+
+    # Loca au format long ; la somme de contrôle globale est recalculée à la fin
+    head[50:52] = struct.pack('>h', 1)
+    head[8:12] = b'\0\0\0\0'
+    contenus = {etiquette: _table(donnees, tables, etiquette) for etiquette in TABLES_SOUS_ENSEMBLE
+                if etiquette in tables}
+    contenus.update({b'head': bytes(head), b'glyf': bytes(nouveau_glyf), b'loca': nouvelle_loca.tobytes()})
+
+    nombre = len(contenus)
+    puissance = 1 << (nombre.bit_length() - 1)
+    entete = struct.pack('>4sHHHH', b'\x00\x01\x00\x00', nombre, puissance * 16,
+                         puissance.bit_length() - 1, nombre * 16 - puissance * 16)
+    decalage = 12 + 16 * nombre
+    repertoire = []
+    corps = []
+    for etiquette in sorted(contenus):
+        contenu = contenus[etiquette]
+        if etiquette == b'head':
+            position_head = decalage
+        repertoire.append(struct.pack('>4sIII', etiquette, _somme(contenu), decalage, len(contenu)))
+        corps.append(contenu + b'\0' * (-len(contenu) % 4))
+        decalage += len(corps[-1])
+    police = bytearray(entete + b''.join(repertoire) + b''.join(corps))
+    ajustement = (0xB1B0AFBA - _somme(bytes(police))) & 0xFFFFFFFF
+    police[position_head + 8:position_head + 12] = struct.pack('>I', ajustement)
+    return bytes(police)
+
+def sous_ensemble_en_cache(chemin, glyphes, dossier_cache=None):
+    """Retourne sous_ensemble(chemin, glyphes), conservé sur disque pour les exécutions suivantes."""
+    liste = sorted(set(glyphes))
+    cle = hashlib.sha256(array('I', liste).tobytes()).hexdigest()[:32]
+    fichier_cache = os.path.join(dossier_cache or DOSSIER_CACHE, f"{_cle_fichier(chemin)}-{cle}.ttf")
+    try:
+        with open(fichier_cache, 'rb') as f:
+            return f.read()
+    except OSError:
+        pass
+    contenu = sous_ensemble(chemin, liste)
+    try:
+        _ecrire_cache(fichier_cache, contenu)
+    except OSError:
+        pass
+    return contenu
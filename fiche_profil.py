@@ -0,0 +1,95 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Contexte vide partagé : sans profil, mesurer() ne crée aucun objet
+NEANT = contextlib.nullcontext()
+
+def _us(ns):
+    return ns / 1000
+
+class Profil:
+    """Collecte d'événements de profilage au format Chrome trace-event (JSON).
+
+    Les horodatages viennent de time.perf_counter_ns(), horloge monotone commune
+    aux processus d'une même machine : les événements des processus de travail
+    se fusionnent tels quels dans une seule trace (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self):
+        self.evenements = []
+        self.pid = os.getpid()
+        self._suivant = 0
+
+    def _ajouter(self, nom, categorie, debut, fin, args):
+        self.evenements.append({
+            'name': nom, 'cat': categorie, 'ph': 'X', 'pid': self.pid, 'tid': threading.get_ident(),
+            'ts': _us(debut), 'dur': _us(fin - debut), 'args': args,
+        })
+
+    @contextlib.contextmanager
+    def phase(self, nom, categorie='phase', **args):
+        """Mesure le bloc englobé ; le bloc peut compléter le dictionnaire d'arguments reçu."""
+        debut = time.perf_counter_ns()
+        try:
+            yield args
+        finally:
+            self._ajouter(nom, categorie, debut, time.perf_counter_ns(), args)
+
+    def flux(self, nom, categorie, morceaux, **args):
+        """Relaie un flux de morceaux de texte et mesure sa production.
+
+        L'événement couvre la durée totale du flux ; ses arguments donnent le
+        temps passé à produire les morceaux (hors écriture par le consommateur)
+        et le nombre d'octets UTF-8 émis.
+        """
+        debut = time.perf_counter_ns()
+        production = 0
+        octets = 0
+        iterateur = iter(morceaux)
+        while True:
+            t = time.perf_counter_ns()
+            try:
+                morceau = next(iterateur)
+            except StopIteration:
+                production += time.perf_counter_ns() - t
+                break
+            production += time.perf_counter_ns() - t
+            octets += len(morceau.encode('utf-8'))
+            yield morceau
+        args.update(production_ms=production / 1e6, octets=octets)
+        self._ajouter(nom, categorie, debut, time.perf_counter_ns(), args)
+
+    def intervalle(self, nom, categorie, debut, fin, **args):
+        """Enregistre un intervalle asynchrone (tâches concurrentes d'un même thread)."""
+        self._suivant += 1
+        commun = {'name': nom, 'cat': categorie, 'pid': self.pid, 'tid': threading.get_ident(),
+                  'id': f"{self.pid}-{self._suivant}"}
+        self.evenements.append(dict(commun, ph='b', ts=_us(debut), args=args))
+        self.evenements.append(dict(commun, ph='e', ts=_us(fin)))
+
+    def etendre(self, evenements):
+        """Ajoute les événements collectés par un autre processus."""
+        self.evenements.extend(evenements)
+
+    def ecrire(self, chemin):
+        """Écrit la trace JSON, lisible par chrome://tracing ou ui.perfetto.dev."""
+        with open(chemin, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.evenements, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+def mesurer(profil, nom, categorie='phase', **args):
+    """Retourne profil.phase(...) ou, sans profil, un contexte vide qui ne coûte rien."""
+    if profil is None:
+        return NEANT
+    return profil.phase(nom, categorie, **args)
+
+def profiler(fonction, *args, **kwargs):
+    """Exécute fonction(..., profil=Profil()) et retourne (résultat, événements).
+
+    Destinée aux processus de travail : les événements sont renvoyés au
+    processus principal, qui les fusionne avec Profil.etendre.
+    """
+    profil = Profil()
+    return fonction(*args, profil=profil, **kwargs), profil.evenements
@@ -0,0 +1,383 @@
+import contextlib
+import functools
+import hashlib
+import os
+import re
+from datetime import datetime
+from string import Formatter
+
+from fiche_assets import caracteres_document, faces_polices, polices_locales, signature_polices
+from fiche_cache import empreinte, taille_cachable
+from fiche_modele import CONCORDANCE, Citation, Image, Paragraphe, SECTIONS_ORDER, document, titre_section
+
+# Contexte vide des étapes chronométrées sans profil
+_SANS_PROFIL = contextlib.nullcontext()
+
+def mesurer(profil, nom, categorie='phase', **args):
+    """fiche_profil.mesurer, sans importer fiche_profil quand aucun profil n'est demandé (temps d'import)."""
+    if profil is None:
+        return _SANS_PROFIL
+    from fiche_profil import mesurer
+    return mesurer(profil, nom, categorie, **args)
+
+# Version du moteur de rendu, incluse dans les clés de cache
+VERSION_RENDU = 2
+
+# Taille des tranches de texte produites par le rendu en flux (caractères)
+TAILLE_MORCEAU = 1 << 20
+
+def regles_css(css):
+    """Retourne les règles d'un CSS de thème, sans les balises <style> qui l'entourent."""
+    css = css.strip()
+    if css.startswith('<style>'):
+        css = css[len('<style>'):]
+    if css.endswith('</style>'):
+        css = css[:-len('</style>')]
+    return css.strip('\n')
+
+# Chaînes CSS (conservées telles quelles par la minification) et commentaires
+_CHAINES_CSS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+_COMMENTAIRES_CSS = re.compile(r'/\*.*?\*/', re.S)
+_ESPACES_CSS = re.compile(r'\s+')
+_AUTOUR_CSS = re.compile(r' ?([{};,>]) ?')
+
+def minifier_css(css):
+    """Minifie un CSS : commentaires retirés, blancs réduits, ';' final des blocs omis.
+
+    Les chaînes entre guillemets sont conservées à l'identique ; seuls les
+    blancs autour de { } ; , > et après ':' sont supprimés, ce qui ne change
+    pas le sens des sélecteurs.
+    """
+    morceaux = _CHAINES_CSS.split(_COMMENTAIRES_CSS.sub('', css))
+    for i in range(0, len(morceaux), 2):
+        morceau = _ESPACES_CSS.sub(' ', morceaux[i])
+        morceau = _AUTOUR_CSS.sub(r'\1', morceau).replace(': ', ':').replace(';}', '}')
+        morceaux[i] = morceau
+    return ''.join(morceaux).strip()
+
+def echapper(texte):
+    """Échappe les caractères spéciaux HTML."""
+    return texte.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def echapper_attribut(texte):
+    """Échappe un texte pour une valeur d'attribut HTML entre guillemets."""
+    return echapper(texte).replace('"', '&quot;')
+
+class Fragment:
+    """Modèle précompilé : morceaux littéraux et noms de champs alternés."""
+
+    __slots__ = ('morceaux',)
+
+    def __init__(self, morceaux):
+        self.morceaux = morceaux
+
+    def rendre(self, **valeurs):
+        return ''.join(
+            morceau if litteral else str(valeurs[morceau])
+            for litteral, morceau in self.morceaux
+        )
+
+    def iter(self, **valeurs):
+        """Produit le fragment morceau par morceau ; un champ peut être un itérable de chaînes."""
+        for litteral, morceau in self.morceaux:
+            if litteral:
+                yield morceau
+                continue
+            valeur = valeurs[morceau]
+            if isinstance(valeur, str):
+                yield valeur
+            else:
+                yield from valeur
+
+def compiler(modele, **constantes):
+    """Compile un modèle str.format une seule fois.
+
+    Les champs fournis dans constantes sont substitués immédiatement ; s'il ne
+    reste aucun champ, le résultat est une simple chaîne.
+    """
+    morceaux = []
+    tampon = []
+    for litteral, champ, _, _ in Formatter().parse(modele):
+        tampon.append(litteral)
+        if champ is None:
+            continue
+        if champ in constantes:
+            tampon.append(str(constantes[champ]))
+        else:
+            morceaux.append((True, ''.join(tampon)))
+            morceaux.append((False, champ))
+            tampon = []
+    morceaux.append((True, ''.join(tampon)))
+
+    if len(morceaux) == 1:
+        return morceaux[0][1]
+    return Fragment(tuple((litteral, m) for litteral, m in morceaux if m or not litteral))
+
+# Paramètres d'un thème qui sont des modèles HTML ou CSS
+_MODELES = ('en_tete', 'section_debut', 'section_fin', 'paragraphe', 'vide', 'citation', 'citation_page',
+            'citations_vides', 'pied', 'css', 'citation_vide', 'image')
+
+class Theme:
+    """Fragments HTML précompilés d'un exporteur.
+
+    Les modèles utilisent la syntaxe str.format. Champs disponibles :
+    en_tete {titre} {auteur} {date_str} {polices}, section_debut {titre_section} {icone},
+    paragraphe {texte}, citation {texte} {page}, citation_page {page}, image {src},
+    pied {date_str}.
+    Le champ {css} de l'en-tête est substitué à la compilation. L'empreinte
+    identifie le thème dans les clés du cache d'export.
+
+    police nomme la famille de police du thème : si ses fichiers sont présents
+    dans le dossier d'assets local (fiche_assets), {polices} reçoit un bloc
+    <style> qui les intègre, réduites aux caractères de la fiche ; sinon il est
+    vide et le CSS se rabat sur les polices du système.
+
+    couleurs associe chaque couleur codée en dur dans les modèles (#rrggbb ou
+    #rgb, en minuscules) au rôle qu'elle joue dans une palette de thème
+    personnalisé (primary, secondary, accent...) : voir variante et
+    fiche_themes. Elle ne change pas le rendu du thème lui-même.
+    """
+
+    def __init__(self, nom, en_tete, section_debut, section_fin, paragraphe, vide,
+                 citation, citation_page, citations_vides, pied, css='',
+                 citation_vide='', format_date='%d/%m/%Y à %H:%M',
+                 echapper_texte=True, sections_ignorees=(), icone=None, police=None,
+                 image='<p><img src="{src}" alt="" style="max-width: 100%;"></p>\n', couleurs=None):
+        # Paramètres d'origine, d'où variante dérive un autre thème
+        self._parametres = {
+            cle: valeur for cle, valeur in locals().items() if cle not in ('self', 'nom', 'couleurs')
+        }
+        self.nom = nom
+        self.couleurs = couleurs or {}
+        self.css = css
+        icones = [icone(section) if icone else '' for section in SECTIONS_ORDER + [CONCORDANCE]]
+        self.police = police
+        self.fichiers_polices = polices_locales(police) if police else ()
+        self.empreinte = empreinte(
+            VERSION_RENDU, nom, en_tete, css, section_debut, section_fin, paragraphe, vide,
+            citation, citation_page, citations_vides, citation_vide, pied, format_date,
+            echapper_texte, sorted(sections_ignorees), icones, police,
+            signature_polices(self.fichiers_polices), image
+        )
+        self.en_tete = compiler(en_tete, css=css)
+        self._modele_en_tete = en_tete
+        self._modele_section = section_debut
+        self.sections = {
+            section: compiler(
+                section_debut,
+                titre_section=titre_section(section),
+                icone=icone(section) if icone else ''
+            )
+            for section in SECTIONS_ORDER + [CONCORDANCE] if section not in sections_ignorees
+        }
+        self.section_fin = section_fin
+        self.paragraphe = compiler(paragraphe)
+        self.citation = compiler(citation)
+        self.citation_page = compiler(citation_page)
+        self.image = compiler(image)
+        # Texte des blocs vides, par nature (voir fiche_modele.Vide)
+        self.vides = {'champ': vide, 'citation': citation_vide, 'citations': citations_vides}
+        self.pied = compiler(pied)
+        self.format_date = format_date
+        self.echapper_texte = echapper_texte
+
+    @functools.cached_property
+    def css_minifie(self):
+        """CSS du thème, sans balises <style>, minifié une fois par processus."""
+        return minifier_css(regles_css(self.css))
+
+    @functools.cached_property
+    def feuille(self):
+        """Nom versionné de la feuille de style partagée du thème : fiche-<thème>.<empreinte>.css."""
+        version = hashlib.sha256(self.css_minifie.encode('utf-8')).hexdigest()[:8]
+        return f"fiche-{self.nom}.{version}.css"
+
+    @functools.cached_property
+    def en_tete_lien(self):
+        """En-tête dont le CSS est remplacé par un lien vers la feuille partagée."""
+        return compiler(self._modele_en_tete, css=f'<link rel="stylesheet" href="{self.feuille}">')
+
+    def variante(self, nom, remplacer, regles=''):
+        """Retourne un thème dérivé nommé nom : chaque modèle HTML et le CSS passent par remplacer(modèle).
+
+        regles (CSS sans balises) est ajouté à la fin du CSS du thème dérivé.
+        """
+        parametres = {
+            cle: remplacer(valeur) if cle in _MODELES else valeur
+            for cle, valeur in self._parametres.items()
+        }
+        if regles:
+            parametres['css'] = f"<style>\n{regles_css(parametres['css'])}\n{regles}\n</style>"
+        return Theme(nom, **parametres)
+
+    def debut_section(self, titre, icone=''):
+        """Début d'une section de titre quelconque (déjà échappé), hors des sections de la fiche."""
+        return compiler(self._modele_section, titre_section=titre, icone=icone)
+
+def ecrire_feuille(theme, dossier):
+    """Écrit la feuille de style partagée d'un thème dans un dossier, si elle n'y est pas ; retourne son chemin.
+
+    Son nom contient l'empreinte de son contenu : une page garde la feuille
+    avec laquelle elle a été produite, et plusieurs processus peuvent l'écrire
+    en même temps (fichier temporaire renommé).
+    """
+    from fiche_manifeste import chemin_temporaire
+
+    chemin = os.path.join(dossier, theme.feuille)
+    if not os.path.exists(chemin):
+        os.makedirs(dossier, exist_ok=True)
+        with open(chemin_temporaire(chemin), 'w', encoding='utf-8') as f:
+            f.write(theme.css_minifie)
+        os.replace(chemin_temporaire(chemin), chemin)
+    return chemin
+
+def _rendre(fragment, **valeurs):
+    """Rend un fragment compilé, qu'il soit une chaîne ou un Fragment."""
+    if isinstance(fragment, str):
+        return fragment
+    return fragment.rendre(**valeurs)
+
+def _iter_texte(value, echapper_texte):
+    """Produit un texte échappé, retours à la ligne convertis, par tranches bornées.
+
+    L'échappement et le remplacement agissent caractère par caractère : découper
+    le texte en tranches ne change pas le résultat.
+    """
+    for debut in range(0, len(value), TAILLE_MORCEAU):
+        morceau = value[debut:debut + TAILLE_MORCEAU]
+        if echapper_texte:
+            morceau = echapper(morceau)
+        yield morceau.replace('\n', '<br>')
+
+def _iter_marques(texte, marques, rendre_texte):
+    """Produit un texte dont les passages marqués (fiche_modele.Marque) sont des liens ou des définitions.
+
+    rendre_texte(morceau) produit le rendu d'un morceau de texte brut ; il est
+    appliqué entre les marques et à l'intérieur de chacune.
+    """
+    pos = 0
+    for marque in marques:
+        yield from rendre_texte(texte[pos:marque.debut])
+        passage = ''.join(rendre_texte(texte[marque.debut:marque.fin]))
+        if marque.definition is None:
+            yield f'<dfn id="{marque.ancre}">{passage}</dfn>'
+        else:
+            yield f'<a class="terme" href="#{marque.ancre}" title="{echapper_attribut(marque.definition)}">{passage}</a>'
+        pos = marque.fin
+    yield from rendre_texte(texte[pos:])
+
+# Balise ou entité HTML dans un texte inséré tel quel
+_BALISAGE = re.compile(r'[<&]')
+
+def _iter_section(theme, debut, section, images=None):
+    """Produit le fragment HTML d'une section à partir de ses blocs.
+
+    Les images sont référencées dans le magasin (fiche_images.MagasinImages)
+    s'il y en a un, intégrées en data: URL sinon. Les passages marqués par le
+    glossaire deviennent liens et définitions, sauf pour un thème qui n'échappe
+    pas les textes : ils peuvent contenir du HTML, où une balise ne peut être
+    insérée à l'aveugle. Pour la même raison, une citation (toujours insérée
+    telle quelle) n'est marquée que si elle ne contient ni balise ni entité.
+    """
+    yield debut
+
+    marquer = theme.echapper_texte
+    for bloc in section.blocs:
+        if isinstance(bloc, Paragraphe):
+            if bloc.marques and marquer:
+                texte = _iter_marques(bloc.texte, bloc.marques, lambda morceau: _iter_texte(morceau, True))
+            else:
+                texte = _iter_texte(bloc.texte, theme.echapper_texte)
+            yield from theme.paragraphe.iter(texte=texte)
+        elif isinstance(bloc, Citation):
+            marquer_citation = bloc.marques and marquer and not _BALISAGE.search(bloc.texte)
+            yield theme.citation.rendre(
+                texte=''.join(_iter_marques(bloc.texte, bloc.marques, lambda morceau: (morceau,)))
+                if marquer_citation else bloc.texte,
+                page=_rendre(theme.citation_page, page=bloc.page) if bloc.page else ''
+            )
+        elif isinstance(bloc, Image):
+            if images:
+                src = images.url(bloc, 'ecran')
+            else:
+                from fiche_images import data_url
+                src = data_url(bloc)
+            yield theme.image.rendre(src=src)
+        else:
+            yield theme.vides[bloc.nature]
+
+    yield theme.section_fin
+
+def _iter_section_cache(theme, debut, section, cache, images):
+    """Produit le fragment d'une section, repris du cache quand c'est possible."""
+    # Une section à images rendue depuis le cache n'écrirait pas ses images dans le magasin
+    if (cache is None or not taille_cachable(section.valeur)
+            or (images is not None and any(isinstance(bloc, Image) for bloc in section.blocs))):
+        yield from _iter_section(theme, debut, section, images)
+        return
+
+    if section.variante is None:
+        cle_cache = empreinte(theme.empreinte, section.cle, section.valeur)
+    else:
+        cle_cache = empreinte(theme.empreinte, section.cle, section.valeur, section.variante)
+    fragment = cache.lire(cle_cache)
+    if fragment is None:
+        fragment = ''.join(_iter_section(theme, debut, section, images))
+        cache.ecrire(cle_cache, fragment)
+    yield fragment
+
+def iter_html(data, theme, cache=None, images=None, profil=None, css_externe=False):
+    """Génère le document HTML d'une fiche morceau par morceau, en un seul parcours des sections.
+
+    data est une fiche JSON ou un document déjà construit (fiche_modele.Document).
+    Les grands champs texte sont produits par tranches de TAILLE_MORCEAU caractères,
+    si bien que la mémoire utilisée ne dépend pas de la taille du document.
+    Avec un cache (fiche_cache.CacheExport), les fragments des sections volumineuses
+    inchangées sont repris tels quels au lieu d'être recalculés. Avec un magasin
+    d'images (fiche_images.MagasinImages), les images collées sont écrites une
+    fois dans le magasin et référencées par chemin relatif. Avec un profil
+    (fiche_profil.Profil), la construction du modèle et chaque section sont
+    chronométrées, octets émis compris. Avec css_externe=True, le CSS du thème
+    n'est pas intégré : l'en-tête lie la feuille partagée theme.feuille, que
+    l'appelant écrit à côté de la page (ecrire_feuille).
+    """
+    with mesurer(profil, 'modele', theme=theme.nom):
+        doc = document(data)
+    titre = 'Sans titre' if doc.titre is None else doc.titre
+    auteur = 'Auteur inconnu' if doc.auteur is None else doc.auteur
+    date_str = datetime.now().strftime(theme.format_date)
+    polices = ''
+    if theme.fichiers_polices:
+        with mesurer(profil, 'polices', theme=theme.nom):
+            faces = faces_polices(theme.police, theme.fichiers_polices, caracteres_document(doc))
+        polices = f"<style>\n{faces}\n</style>"
+
+    en_tete = theme.en_tete_lien if css_externe else theme.en_tete
+    yield _rendre(en_tete, titre=titre, auteur=auteur, date_str=date_str, polices=polices)
+    yield from iter_sections(doc, theme, cache, images, profil)
+    yield _rendre(theme.pied, date_str=date_str)
+
+def iter_sections(doc, theme, cache=None, images=None, profil=None):
+    """Produit le fragment HTML des sections d'un document, dans l'ordre du thème.
+
+    C'est le corps d'une fiche, sans en-tête ni pied : iter_html l'encadre pour
+    une fiche seule, l'anthologie (export_fiche_anthologie) pour chaque fiche
+    d'un recueil.
+    """
+    for cle, debut in theme.sections.items():
+        section = doc.sections.get(cle)
+        if section is None:
+            continue
+        morceaux = _iter_section_cache(theme, debut, section, cache, images)
+        if profil is not None:
+            morceaux = profil.flux(cle, 'section', morceaux, theme=theme.nom)
+        yield from morceaux
+
+def rendre_html(data, theme, cache=None, images=None, profil=None, css_externe=False):
+    """Génère le document HTML complet d'une fiche sous forme de chaîne."""
+    return ''.join(iter_html(data, theme, cache, images, profil, css_externe))
+
+def ecrire_html(data, theme, fichier, cache=None, images=None, profil=None, css_externe=False):
+    """Écrit le document HTML d'une fiche directement dans un fichier ouvert, sans le construire en mémoire."""
+    for morceau in iter_html(data, theme, cache, images, profil, css_externe):
+        fichier.write(morceau)
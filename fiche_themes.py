@@ -0,0 +1,174 @@
+import functools
+import json
+import math
+import re
+
+from fiche_cache import empreinte
+
+# Rôles de couleur d'un thème personnalisé (CustomTheme de l'application web)
+ROLES = ('primary', 'secondary', 'accent', 'background', 'card', 'text', 'textLight', 'border')
+
+# Polices facultatives : valeurs font-family complètes (« Playfair Display, serif »)
+POLICES = ('titleFont', 'textFont')
+
+_HEX = re.compile(r'#(?:[0-9a-fA-F]{6}|[0-9a-fA-F]{3})')
+# Caractères qui permettraient à une valeur de police de sortir de sa déclaration CSS
+_HORS_POLICE = re.compile(r'[;{}<>\\]')
+
+def _arrondir(x):
+    """Arrondi de Math.round (demi vers le haut), pour des couleurs identiques à l'application."""
+    return math.floor(x + 0.5)
+
+def hex_vers_hsl(couleur):
+    """Convertit une couleur #rrggbb en (teinte, saturation, luminosité) entières, comme hexToHsl."""
+    r, g, b = (int(couleur[i:i + 2], 16) / 255 for i in (1, 3, 5))
+    maxi, mini = max(r, g, b), min(r, g, b)
+    l = (maxi + mini) / 2
+    h = s = 0
+    if maxi != mini:
+        d = maxi - mini
+        s = d / (2 - maxi - mini) if l > 0.5 else d / (maxi + mini)
+        if maxi == r:
+            h = (g - b) / d + (6 if g < b else 0)
+        elif maxi == g:
+            h = (b - r) / d + 2
+        else:
+            h = (r - g) / d + 4
+        h /= 6
+    return _arrondir(h * 360), _arrondir(s * 100), _arrondir(l * 100)
+
+def hsl_vers_hex(h, s, l):
+    """Convertit (teinte, saturation, luminosité) en couleur #rrggbb, comme hslToHex."""
+    h, s, l = h / 360, s / 100, l / 100
+    if s == 0:
+        r = g = b = l
+    else:
+        def composante(p, q, t):
+            if t < 0:
+                t += 1
+            if t > 1:
+                t -= 1
+            if t < 1 / 6:
+                return p + (q - p) * 6 * t
+            if t < 1 / 2:
+                return q
+            if t < 2 / 3:
+                return p + (q - p) * (2 / 3 - t) * 6
+            return p
+
+        q = l * (1 + s) if l < 0.5 else l + s - l * s
+        p = 2 * l - q
+        r, g, b = composante(p, q, h + 1 / 3), composante(p, q, h), composante(p, q, h - 1 / 3)
+    return '#' + ''.join(f"{min(255, max(0, _arrondir(c * 255))):02x}" for c in (r, g, b))
+
+def generer_palette(primaire):
+    """Dérive une palette complète d'une couleur principale #rrggbb, comme generatePalette."""
+    if not re.fullmatch(r'#[0-9a-fA-F]{6}', primaire):
+        raise ValueError(f"couleur principale #rrggbb attendue : {primaire!r}")
+    h, s, l = hex_vers_hsl(primaire)
+    return {
+        'primary': primaire,
+        'secondary': hsl_vers_hex(h, max(30, s - 10), max(20, l - 20)),
+        'accent': hsl_vers_hex(h, max(20, s - 20), min(80, l + 10)),
+        'background': hsl_vers_hex(h, max(5, s - 70), min(98, l + 40)),
+        'card': '#ffffff',
+        'text': '#2c3e50',
+        'textLight': '#6c757d',
+        'border': hsl_vers_hex(h, max(10, s - 60), min(93, l + 30)),
+    }
+
+def normaliser_palette(theme):
+    """Retourne la palette d'un thème JSON : rôles en #rrggbb minuscules, polices éventuelles.
+
+    Les rôles absents sont dérivés de la couleur principale (generer_palette),
+    seule obligatoire. Les autres champs (id, name, gradient, createdAt...)
+    sont ignorés : ils ne changent pas le CSS.
+    """
+    if not isinstance(theme, dict) or not isinstance(theme.get('primary'), str):
+        raise ValueError("thème JSON attendu : objet avec au moins une couleur 'primary'")
+    palette = generer_palette(theme['primary'])
+    for role in ROLES:
+        couleur = theme.get(role)
+        if couleur is None:
+            continue
+        if not isinstance(couleur, str) or not _HEX.fullmatch(couleur):
+            raise ValueError(f"couleur #rrggbb ou #rgb attendue pour '{role}' : {couleur!r}")
+        if len(couleur) == 4:
+            couleur = '#' + ''.join(c * 2 for c in couleur[1:])
+        palette[role] = couleur
+    palette = {role: couleur.lower() for role, couleur in palette.items()}
+    for police in POLICES:
+        valeur = theme.get(police)
+        if isinstance(valeur, str) and valeur.strip():
+            palette[police] = _HORS_POLICE.sub('', valeur).strip()
+    return palette
+
+def charger_palette(reference):
+    """Lit la palette d'un thème JSON : « chemin » ou « chemin#id » (id ou nom du thème).
+
+    Le fichier contient un thème (objet CustomTheme) ou la liste exportée par
+    useCustomThemes ; dans une liste, le thème est désigné par son id ou son
+    nom, sauf si elle n'en contient qu'un.
+    """
+    chemin, diese, choix = reference.partition('#')
+    with open(chemin, 'r', encoding='utf-8') as f:
+        contenu = json.load(f)
+    if isinstance(contenu, list):
+        themes = [theme for theme in contenu if isinstance(theme, dict)]
+        if diese:
+            themes = [theme for theme in themes if choix in (str(theme.get('id')), theme.get('name'))]
+        if len(themes) != 1:
+            noms = ', '.join(
+                str(theme.get('name') or theme.get('id')) for theme in contenu if isinstance(theme, dict)
+            )
+            raise ValueError(f"{chemin} : choisir un thème avec {chemin}#<id ou nom> ({noms})")
+        contenu = themes[0]
+    return normaliser_palette(contenu)
+
+def regles_polices(palette):
+    """Retourne les règles CSS des polices d'une palette (vide sans police)."""
+    regles = []
+    if 'textFont' in palette:
+        regles.append(f"body {{ font-family: {palette['textFont']}; }}")
+    if 'titleFont' in palette:
+        regles.append(f"h1, h2, h3 {{ font-family: {palette['titleFont']}; }}")
+    return '\n'.join(regles)
+
+def nom_palette(palette):
+    """Identifiant court d'une palette (début de son empreinte), pour nommer thèmes et exports."""
+    return empreinte(palette)[:8]
+
+@functools.lru_cache(maxsize=None)
+def _compiler(theme, elements):
+    palette = dict(elements)
+    couleurs = {
+        couleur.lower(): palette[role] for couleur, role in theme.couleurs.items() if role in palette
+    }
+    # Couleurs les plus longues d'abord : #333 ne doit pas mordre sur #333333
+    motif = re.compile(
+        '(?:' + '|'.join(re.escape(couleur) for couleur in sorted(couleurs, key=len, reverse=True))
+        + r')(?![0-9a-fA-F])',
+        re.I
+    ) if couleurs else None
+
+    def remplacer(modele):
+        if motif is None or not modele:
+            return modele
+        return motif.sub(lambda correspondance: couleurs[correspondance.group().lower()], modele)
+
+    nom = f"{theme.nom}-{nom_palette(palette)}"
+    return theme.variante(nom, remplacer, regles_polices(palette))
+
+def theme_personnalise(theme, palette):
+    """Retourne le thème HTML recoloré selon une palette (normaliser_palette), ou le thème lui-même sans palette.
+
+    Chaque couleur codée en dur du thème (Theme.couleurs) prend la valeur de
+    son rôle dans la palette. Le thème dérivé est compilé une seule fois par
+    processus et par palette, quel que soit le nombre de fiches exportées ;
+    son nom et son empreinte dérivent de la palette, si bien que ses exports,
+    ses fragments en cache et sa feuille de style partagée (ecrire_feuille)
+    ne se confondent pas avec ceux du thème d'origine.
+    """
+    if not palette:
+        return theme
+    return _compiler(theme, tuple(sorted(palette.items())))
@@ -0,0 +1,142 @@
+import os
+import shutil
+import time
+
+# asyncio n'est importé qu'au moment de convertir : il coûte plus cher à charger
+# que tout un exporteur HTML, qui n'importe ce module que pour trouver_binaire
+
+# Variable d'environnement désignant le binaire, prioritaire sur le PATH
+VARIABLE_BINAIRE = 'WKHTMLTOPDF'
+
+# Emplacement d'installation par défaut sous Windows, en dernier recours
+CHEMIN_WINDOWS = 'C:\\Program Files\\wkhtmltopdf\\bin\\wkhtmltopdf.exe'
+
+# Options de mise en page (celles passées auparavant par pdfkit)
+OPTIONS_PDF = [
+    '--quiet',
+    '--page-size', 'A4',
+    '--margin-top', '15mm',
+    '--margin-right', '15mm',
+    '--margin-bottom', '15mm',
+    '--margin-left', '15mm',
+    '--encoding', 'UTF-8',
+    '--no-outline',
+]
+
+# Accès du HTML aux fichiers locaux : seulement pour les pages qui lient le magasin
+# d'images (MagasinImages) ou une feuille de style voisine, jamais pour un HTML reçu
+ACCES_FICHIERS_LOCAUX = ['--enable-local-file-access']
+
+TIMEOUT_DEFAUT = 120
+TENTATIVES_DEFAUT = 2
+
+class ErreurConversion(RuntimeError):
+    """Échec d'une conversion HTML -> PDF, après toutes les tentatives."""
+
+def trouver_binaire(chemin=None):
+    """Retourne le chemin de wkhtmltopdf, ou None s'il est introuvable.
+
+    Ordre de recherche : chemin explicite, variable WKHTMLTOPDF, PATH, puis
+    l'emplacement d'installation par défaut de Windows.
+    """
+    for candidat in (chemin, os.environ.get(VARIABLE_BINAIRE)):
+        if candidat:
+            return shutil.which(candidat) or (candidat if os.path.isfile(candidat) else None)
+    trouve = shutil.which('wkhtmltopdf')
+    if trouve:
+        return trouve
+    return CHEMIN_WINDOWS if os.path.isfile(CHEMIN_WINDOWS) else None
+
+class PoolConversion:
+    """Pool borné de conversions wkhtmltopdf concurrentes.
+
+    Chaque conversion est un sous-processus lancé par asyncio ; au plus
+    `concurrence` tournent en même temps. Une conversion qui dépasse `timeout`
+    secondes est tuée puis retentée, jusqu'à `tentatives` essais au total. Le
+    PDF est écrit dans un fichier temporaire renommé à la fin. Avec un profil
+    (fiche_profil.Profil), chaque lancement devient un intervalle de la trace.
+
+    Les pages n'accèdent aux fichiers locaux qu'avec fichiers_locaux=True,
+    pour un HTML produit ici qui référence le magasin d'images par chemin
+    relatif ; sans cela, un <iframe src="file://..."> reste vide.
+    """
+
+    def __init__(self, binaire=None, concurrence=None, timeout=TIMEOUT_DEFAUT,
+                 tentatives=TENTATIVES_DEFAUT, profil=None, fichiers_locaux=False):
+        self.binaire = trouver_binaire(binaire)
+        if self.binaire is None:
+            raise ErreurConversion(
+                "wkhtmltopdf introuvable : installez-le, ajoutez-le au PATH "
+                f"ou indiquez son chemin dans la variable {VARIABLE_BINAIRE}"
+            )
+        self.concurrence = concurrence or os.cpu_count()
+        self.timeout = timeout
+        self.tentatives = max(1, tentatives)
+        self.profil = profil
+        self.options = OPTIONS_PDF + (ACCES_FICHIERS_LOCAUX if fichiers_locaux else [])
+        self._semaphore = None
+
+    async def _lancer(self, html_path, temporaire):
+        """Lance une conversion et retourne None si elle réussit, sinon le motif de l'échec."""
+        import asyncio
+
+        processus = await asyncio.create_subprocess_exec(
+            self.binaire, *self.options, html_path, temporaire,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, erreurs = await asyncio.wait_for(processus.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            processus.kill()
+            await processus.wait()
+            return f"délai de {self.timeout} s dépassé"
+        if processus.returncode != 0 or not os.path.exists(temporaire):
+            message = erreurs.decode('utf-8', 'replace').strip().splitlines()
+            return f"code {processus.returncode}" + (f" : {message[-1]}" if message else "")
+        return None
+
+    async def convertir(self, html_path, pdf_path):
+        """Convertit un fichier HTML en PDF ; lève ErreurConversion en cas d'échec."""
+        import asyncio
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrence)
+        temporaire = f"{pdf_path}.{os.getpid()}.tmp"
+        async with self._semaphore:
+            for tentative in range(1, self.tentatives + 1):
+                debut = time.perf_counter_ns()
+                motif = await self._lancer(html_path, temporaire)
+                if self.profil is not None:
+                    self.profil.intervalle(
+                        os.path.basename(html_path), 'wkhtmltopdf', debut, time.perf_counter_ns(),
+                        tentative=tentative, erreur=motif
+                    )
+                if motif is None:
+                    os.replace(temporaire, pdf_path)
+                    return pdf_path
+        if os.path.exists(temporaire):
+            os.remove(temporaire)
+        raise ErreurConversion(f"{os.path.basename(html_path)} : {motif}")
+
+    async def convertir_tout(self, paires):
+        """Convertit des paires (html, pdf) ; retourne pour chacune le chemin du PDF ou l'exception."""
+        import asyncio
+
+        return await asyncio.gather(
+            *(self.convertir(html_path, pdf_path) for html_path, pdf_path in paires),
+            return_exceptions=True
+        )
+
+def convertir_lot(paires, **options):
+    """Convertit des paires (html, pdf) sur un pool ; voir PoolConversion pour les options."""
+    import asyncio
+
+    pool = PoolConversion(**options)
+    return asyncio.run(pool.convertir_tout(paires))
+
+def convertir(html_path, pdf_path, **options):
+    """Convertit un seul fichier HTML en PDF ; lève ErreurConversion en cas d'échec."""
+    resultat, = convertir_lot([(html_path, pdf_path)], **options)
+    if isinstance(resultat, Exception):
+        raise resultat
+    return resultat